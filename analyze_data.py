@@ -5,123 +5,252 @@ from openpyxl.styles import Font, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 import re
 import os
+import itertools
+import sqlite3
 
-def process_subscription_file(subscription_file):
-    # 读取海运订阅文件，移除 encoding 参数
-    df = pd.read_excel(subscription_file)
+import xlsx_writer
+from config import DEFAULT_CONFIG, load_config, resolve_path
+from columnar_export import export_columnar, pyarrow_available
+from process_pool import process_pool
+from customer_keys import (CustomerKeys, DEPT_MAPPING, MONEY_SCALE, dense_codes, group_count,
+                           sort_ranks, department_rows, to_minor_units, from_minor_units, group_sum_minor)
+from rules import compile_rules, evaluate_rules, classify, rule_names, rule_columns
+from excel_stream import iter_sheet_rows, iter_excel_chunks, header_names, read_excel_chunked, PROGRESS_ROWS
+from memory_budget import MemoryTracker, choose_processing_mode
+from history_store import HistoryStore, normalize_month
+from customer_matching import AliasTable, CustomerMatcher
+from precheck_merge import DuplicateIndex, input_file_list, combine_precheck_frames
+from preview_sample import TicketSample, scale_counts, preview_dir, preview_label, mark_preview_files
+
+# 客户公司分析sheet的表头（两行表头）
+ANALYSIS_HEADERS = [
+    ['二级部门', '委托客户', '约价', '约价', '非约价', '非约价', '总票数', '总利润率', '总利润率环比', '初步分析',
+     '业务部门反馈具体原因', '原因类别', '损调利润', '计划采取的措施', '是否完成价格备案表', '是否联合磋商', '督办任务', 
+     '责任人', '督办时间点'],
+    ['', '', '负毛利票数', '毛利率', '低负票数', '毛利率', '', '', '', '', '', '', '', '', '', '', '', '', '']
+]
+
+# 客户公司分析sheet的合并单元格
+ANALYSIS_MERGE_RANGES = [
+    'A1:A2',  # 二级部门
+    'B1:B2',  # 委托客户
+    'C1:D1',  # 约价
+    'E1:F1',  # 非约价
+    'G1:G2',  # 总票数
+    'H1:H2',  # 总利润率
+    'I1:I2',  # 总利润率环比
+    'J1:J2',  # 初步分析
+    'K1:K2',  # 业务部门反馈具体原因
+    'L1:L2',  # 原因类别
+    'M1:M2',  # 损调利润
+    'N1:N2',  # 计划采取的措施
+    'O1:O2',  # 是否完成价格备案表
+    'P1:P2',  # 是否联合磋商
+    'Q1:Q2',  # 督办任务
+    'R1:R2',  # 责任人
+    'S1:S2',  # 督办时间点
+]
+
+# 客户公司分析sheet的列宽
+ANALYSIS_COLUMN_WIDTHS = {
+    'A': 15,  # 二级部门
+    'B': 30,  # 客户公司
+    'C': 12,  # 约价负毛利票数
+    'D': 10,  # 约价毛利率
+    'E': 12,  # 非约价低负票数
+    'F': 10,  # 非约价毛利率
+    'G': 10,  # 总票数
+    'H': 10,  # 总利润率
+    'I': 10,  # 总利润率环比
+    'J': 40,  # 初步分析
+    'K': 40,  # 业务部门反馈具体原因
+    'L': 15,  # 原因类别
+    'M': 12,  # 损调利润
+    'N': 40,  # 计划采取的措施
+    'O': 15,  # 是否完成价格备案表
+    'P': 15,  # 是否联合磋商
+    'Q': 15,  # 督办任务
+    'R': 10,  # 责任人
+    'S': 15,  # 督办时间点
+}
+
+# 客户公司分析sheet的数据列：(full_analysis 列名, 对齐方式, 是否百分比)
+ANALYSIS_DATA_COLUMNS = [
+    ('二级部门', 'left', False),
+    ('委托客户', 'left', False),
+    ('约价负毛利票数', 'center', False),
+    ('约价毛利率', 'center', True),
+    ('非约价低负票数', 'center', False),
+    ('非约价毛利率', 'center', True),
+    ('总票数', 'center', False),
+    ('总利润率', 'center', True),
+    ('总利润率环比', 'center', True),
+    ('初步分析', 'left', False),
+]
+
+# 订阅文件和预对账文件的必需列
+SUBSCRIPTION_COLUMNS = ['二级部门', '委托客户', '客户约价', '是否低负', '未税人民币总毛利', '未税人民币总收入', '业务大类名称', '业务月度']
+PRECHECK_COLUMNS = ['法人部门', '委托客户', '别名', '应收应付', '本位币金额', '费率单号', '币种']
+
+def process_subscription_file(subscription_file, business_lines=None, rules=None):
+    """
+    汇总订阅数据中每个业务大类、二级部门和委托客户的低负毛利情况
+
+    business_lines: 需要统计的业务大类名称列表，默认只统计海运；
+                    多个业务大类在同一次分组汇总中完成，结果中用“业务大类名称”列区分
+    rules: 订阅数据分类规则配置（config 中的 rules.subscription），默认使用内置规则
+    """
+    if business_lines is None:
+        business_lines = ['海运']
+    if rules is None:
+        rules = DEFAULT_CONFIG['rules']['subscription']
+    rules = compile_rules(rules)
+    missing_rules = {'约价负毛利', '非约价低负'} - set(rule_names(rules))
+    if missing_rules:
+        raise ValueError(f"订阅数据分类规则缺少: {', '.join(sorted(missing_rules))}")
+
+    # 读取海运订阅文件，移除 encoding 参数；已读取的 DataFrame 可直接传入，避免重复解析
+    if isinstance(subscription_file, pd.DataFrame):
+        df = subscription_file
+    else:
+        df = pd.read_excel(subscription_file)
     
     print("海运订阅文件的列名:", df.columns.tolist(), flush=True)
     print(f"原始数据行数: {len(df)}", flush=True)
     
     # 检查必需的列
-    required_columns = ['二级部门', '委托客户', '客户约价', '是否低负', '未税人民币总毛利', '未税人民币总收入', '业务大类名称', '业务月度']
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    missing_columns = [col for col in SUBSCRIPTION_COLUMNS if col not in df.columns]
     if missing_columns:
         raise ValueError(f"海运订阅文件缺少以下列: {', '.join(missing_columns)}")
     
     # 获取业务月度并进行验证
-    business_month = None
+    first_month = None
     if not df.empty:
         # 获取非空的业务月度值
         valid_months = df['业务月度'].dropna()
         if not valid_months.empty:
             # 获取第一个非空值
             first_month = valid_months.iloc[0]
-            if pd.notna(first_month) and str(first_month) != 'nan':
-                business_month = str(first_month)
+    business_month = resolve_business_month(first_month)
     
-    # 如果没有有效的业务月度，使用当前日期
-    if not business_month:
-        from datetime import datetime
-        business_month = datetime.now().strftime("%Y-%m")
-        print(f"警告：未找到有效的业务月度，使用当前日期：{business_month}")
-    
-    # 筛选业务大类为海运的数据
-    df = df[df['业务大类名称'] == '海运']
-    print(f"筛选海运业务后的数据行数: {len(df)}", flush=True)
+    # 筛选需要统计的业务大类的数据
+    df = df[df['业务大类名称'].isin(business_lines)]
+    print(f"筛选{'、'.join(business_lines)}业务后的数据行数: {len(df)}", flush=True)
     
     # 选择所需列
-    subscription_data = df[required_columns].copy()
+    subscription_data = df[SUBSCRIPTION_COLUMNS].copy()
     print(f"选择所需列后的数据行数: {len(subscription_data)}", flush=True)
     
-    # 计算约价的负毛利票数和非约价的低负票数
-    subscription_data['约价负毛利'] = ((subscription_data['客户约价'].notna() & (subscription_data['客户约价'] != 'N')) & 
-                                  (subscription_data['是否低负'] == '负毛利'))
-    subscription_data['非约价低负'] = ((subscription_data['客户约价'].isna() | (subscription_data['客户约价'] == 'N')) & 
-                                  ((subscription_data['是否低负'] == '低毛利') | (subscription_data['是否低负'] == '负毛利')))
-    
-    print(f"约价负毛利的记录数: {subscription_data['约价负毛利'].sum()}", flush=True)
-    print(f"非约价低负的记录数: {subscription_data['非约价低负'].sum()}", flush=True)
-    
-    # 分别计算约价和非约价的数据，只考虑 '是否低' 不为 'N' 的数据
-    yue_data = subscription_data[(subscription_data['约价负毛利']) & (subscription_data['是否低负'] != 'N')].groupby(['二级部门', '委托客户']).agg({
-        '未税人民币总毛利': 'sum',
-        '未税人民币总收入': 'sum',
-        '约价负毛利': 'count'
-    }).reset_index()
+    # 按配置的分类规则一次性计算每条记录所属的分类（约价负毛利、非约价低负等）
+    flags = evaluate_rules(rules, df)
+    for name, mask in flags.items():
+        print(f"{name}的记录数: {np.count_nonzero(mask)}", flush=True)
     
-    non_yue_data = subscription_data[(subscription_data['非约价低负']) & (subscription_data['是否低负'] != 'N')].groupby(['二级部门', '委托客户']).agg({
-        '未税人民币总毛利': 'sum',
-        '未税人民币总收入': 'sum',
-        '非约价低负': 'count'
-    }).reset_index()
+    # 建立委托客户组合键字典，之后的汇总都在整数编号上完成；
+    # 同一客户在不同业务大类中共用一个客户键，分组键为 (业务大类, 客户键)
+    keys = CustomerKeys(df['二级部门'], df['委托客户'])
+    line_codes, lines = pd.factorize(df['业务大类名称'])
+    codes, first_rows = dense_codes(line_codes, keys.codes)
+    n_keys = len(first_rows)
+    # 金额读入时换算为分，汇总在整数上完成，避免浮点累加误差影响 == 0 等判断
+    profit = to_minor_units(subscription_data['未税人民币总毛利'])
+    income = to_minor_units(subscription_data['未税人民币总收入'])
     
-    print(f"约价数据行数: {len(yue_data)}")
-    print(f"非约价数据行数: {len(non_yue_data)}")
+    # 分别计算约价和非约价的数据
+    yue_mask = flags['约价负毛利']
+    non_yue_mask = flags['非约价低负']
     
-    # 所有委托客户
-    all_customers = df[['二级部门', '委托客户']].drop_duplicates()
-    
-    # 合并约价和非约价数据，并确保包含所有委托客户
-    grouped_data = pd.merge(all_customers, yue_data, on=['二级部门', '委托客户'], how='left')
-    grouped_data = pd.merge(grouped_data, non_yue_data, on=['二级部门', '委托客户'], how='left')
-    
-    # 重命名列
-    grouped_data = grouped_data.rename(columns={
-        '约价负毛利': '约价负毛利票数',
-        '非约价低负': '非约价低负票数',
-        '未税人民币总毛利_x': '约价未税人民币总毛利',
-        '未税人民币总收入_x': '约价未税人民币总收入',
-        '未税人民币总毛利_y': '非约价未税人民币总毛利',
-        '未税人民币总收入_y': '非约价未税人民币总收入',
-    })
+    aggregates = {
+        'yue_count': group_count(codes, n_keys, yue_mask),
+        'yue_profit': group_sum_minor(np.where(yue_mask, codes, -1), profit, n_keys),
+        'yue_income': group_sum_minor(np.where(yue_mask, codes, -1), income, n_keys),
+        'non_yue_count': group_count(codes, n_keys, non_yue_mask),
+        'non_yue_profit': group_sum_minor(np.where(non_yue_mask, codes, -1), profit, n_keys),
+        'non_yue_income': group_sum_minor(np.where(non_yue_mask, codes, -1), income, n_keys),
+        'total_profit': group_sum_minor(codes, profit, n_keys),
+        'total_income': group_sum_minor(codes, income, n_keys),
+        'total_tickets': group_count(codes, n_keys),
+    }
+    # 配置中新增的分类只汇总票数
+    extra_counts = {name: group_count(codes, n_keys, mask) for name, mask in flags.items()
+                    if name not in ('约价负毛利', '非约价低负')}
+    grouped_data = summarize_subscription(keys, keys.codes[first_rows], lines[line_codes[first_rows]],
+                                          aggregates, extra_counts)
+    return grouped_data, business_month, keys
+
+def resolve_business_month(first_month):
+    """
+    第一个非空的业务月度统一为 YYYY-MM（2024-5、2024/05、日期等写法相同），没有有效的业务月度时使用当前日期
+
+    无法识别的写法原样保留为文字，这样的月份不保存到历史数据库
+    """
+    if first_month is not None and pd.notna(first_month) and str(first_month) != 'nan':
+        month = normalize_month(first_month)
+        if month is None:
+            print(f"警告：无法识别的业务月度 {first_month}，按原文字使用，不保存到历史数据库")
+            return str(first_month)
+        return month
+    from datetime import datetime
+    business_month = datetime.now().strftime("%Y-%m")
+    print(f"警告：未找到有效的业务月度，使用当前日期：{business_month}")
+    return business_month
+
+def summarize_subscription(keys, group_keys, group_lines, aggregates, extra_counts):
+    """
+    由每个 (业务大类, 客户键) 分组的汇总值生成订阅汇总结果
+
+    group_keys / group_lines: 每个分组的客户键和业务大类名称，按分组第一次出现的顺序排列
+    aggregates: 每个分组的票数和金额（分）：yue_count / yue_profit / yue_income、non_yue_count /
+                non_yue_profit / non_yue_income、total_profit / total_income / total_tickets
+    extra_counts: 配置中新增分类的 {名称: 每个分组的票数}
+    """
+    yue_count = aggregates['yue_count']
+    yue_profit = aggregates['yue_profit']
+    yue_income = aggregates['yue_income']
+    non_yue_count = aggregates['non_yue_count']
+    non_yue_profit = aggregates['non_yue_profit']
+    non_yue_income = aggregates['non_yue_income']
     
-    # 填充NaN值为0
-    fill_columns = ['约价负毛利票数', '非约价低负票数', '约价未税人民币总毛利', '约价未税人民币总收入', '非约价未税人民币总毛利', '非约价未税人民币总收入']
-    grouped_data[fill_columns] = grouped_data[fill_columns].fillna(0)
+    print(f"约价数据行数: {np.count_nonzero(yue_count)}")
+    print(f"非约价数据行数: {np.count_nonzero(non_yue_count)}")
     
     # 过滤掉约价负毛利票数和非约价低负票数都为0的记录
-    grouped_data = grouped_data[
-        (grouped_data['约价负毛利票数'] > 0) | 
-        (grouped_data['非约价低负票数'] > 0)
-    ]
+    selected = np.flatnonzero((yue_count > 0) | (non_yue_count > 0))
     
-    # 重新计算毛利率
-    grouped_data['约价毛利率'] = np.where(
-        grouped_data['约价未税人民币总收入'] != 0,
-        grouped_data['约价未税人民币总毛利'] / grouped_data['约价未税人民币总收入'],
-        -1
-    )
-    grouped_data['非约价毛利率'] = np.where(
-        grouped_data['非约价未税人民币总收入'] != 0,
-        grouped_data['非约价未税人民币总毛利'] / grouped_data['非约价未税人民币总收入'],
-        -1
-    )
-
-    # 将毛利率转换为百分比格式的数值，票数为0时显示为空
-    def format_rate(rate, count):
-        if pd.isnull(rate) or pd.isnull(count) or count == 0:
-            return None
-        elif rate == -1:
-            return -1  # 返回 -1，表示 -100%
-        else:
-            return rate  # 保持原始的小数形式
+    # 重新计算毛利率，票数为0时显示为空，收入为0时为 -1（表示 -100%）
+    with np.errstate(divide='ignore', invalid='ignore'):
+        yue_rate = np.where(yue_income != 0, yue_profit / yue_income, -1)
+        non_yue_rate = np.where(non_yue_income != 0, non_yue_profit / non_yue_income, -1)
+    yue_rate = np.where(yue_count > 0, yue_rate, np.nan)
+    non_yue_rate = np.where(non_yue_count > 0, non_yue_rate, np.nan)
     
-    grouped_data['约价毛利率'] = grouped_data.apply(lambda row: format_rate(row['约价毛利率'], row['约价负毛利票数']), axis=1)
-    grouped_data['非约价毛利率'] = grouped_data.apply(lambda row: format_rate(row['非约价毛利率'], row['非约价低负票数']), axis=1)
+    # 计算每个委托客户的总毛利率，过滤掉异常值
+    total_profit = aggregates['total_profit']
+    total_income = aggregates['total_income']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_rate = np.where(total_income != 0, total_profit / total_income, 0)
+    total_rate = np.clip(total_rate, -1, 1)
     
-    grouped_data['约价负毛利票数'] = grouped_data['约价负毛利票数'].apply(lambda x: '' if x == 0 else int(x))
-    grouped_data['非约价低负票数'] = grouped_data['非约价低负票数'].apply(lambda x: '' if x == 0 else int(x))
+    # 计算每个二级部门和委托客户的总票数
+    total_tickets = aggregates['total_tickets']
+    
+    # 只在输出时把编号还原为文字
+    customer_keys = np.asarray(group_keys)[selected]
+    grouped_data = keys.decode(customer_keys)
+    grouped_data['约价未税人民币总毛利'] = from_minor_units(yue_profit[selected])
+    grouped_data['约价未税人民币总收入'] = from_minor_units(yue_income[selected])
+    grouped_data['约价负毛利票数'] = _count_display(yue_count[selected])
+    grouped_data['非约价未税人民币总毛利'] = from_minor_units(non_yue_profit[selected])
+    grouped_data['非约价未税人民币总收入'] = from_minor_units(non_yue_income[selected])
+    grouped_data['非约价低负票数'] = _count_display(non_yue_count[selected])
+    grouped_data['约价毛利率'] = yue_rate[selected]
+    grouped_data['非约价毛利率'] = non_yue_rate[selected]
+    grouped_data['总利润率'] = total_rate[selected]
+    grouped_data['总票数'] = total_tickets[selected]
+    for name, counts in extra_counts.items():
+        grouped_data[f"{name}票数"] = counts[selected]
+    grouped_data['业务大类名称'] = np.asarray(group_lines, dtype=object)[selected]
+    grouped_data['客户键'] = customer_keys
     
     print("grouped_data 的前几行:")
     print(grouped_data.head().to_string())
@@ -132,146 +261,333 @@ def process_subscription_file(subscription_file):
     print(f"约价毛利率不为空的记录数: {grouped_data['约价毛利率'].astype(bool).sum()}")
     print(f"非约价毛利率不为空的记录数: {grouped_data['非约价毛利率'].astype(bool).sum()}")
     
-    # 计算每个委托客户的总毛利率
-    total_stats = df.groupby(['二级部门', '委托客户']).agg({
-        '未税人民币总毛利': 'sum',
-        '未税人民币总收入': 'sum'
-    }).reset_index()
-    
-    # 计算每个二级部门和委托客户的总票数
-    total_tickets = df.groupby(['二级部门', '委托客户']).size().reset_index(name='总票数')
-    
-    # 安全地计算总利润率
-    def calculate_profit_rate(row):
-        if pd.isna(row['未税人民币总收入']) or row['未税人民币总收入'] == 0:
-            return 0  # 或者返回其他默认值
-        return row['未税人民币总毛利'] / row['未税人民币总收入']
-    
-    total_stats['总利润率'] = total_stats.apply(calculate_profit_rate, axis=1)
-    
-    # 过滤掉异常值（如果需要的话）
-    total_stats['总利润率'] = total_stats['总利润率'].apply(
-        lambda x: x if abs(x) <= 1 else (1 if x > 1 else -1)
-    )
-    
-    # 合并总利润率和总票数到grouped_data
-    grouped_data = pd.merge(grouped_data, total_stats[['二级部门', '委托客户', '总利润率']], 
-                          on=['二级部门', '委托客户'], how='left')
-    grouped_data = pd.merge(grouped_data, total_tickets, 
-                          on=['二级部门', '委托客户'], how='left')
-    
-    return grouped_data, business_month
+    return grouped_data
 
-def analyze_excel_data(input_file, output_file, subscription_file, status_callback=None):
-    if status_callback:
-        status_callback("开始读取海运订阅文件...")
-    
-    # 读取海运订阅文件
+def _count_display(counts):
+    """票数为0时显示为空字符串"""
+    display = counts.astype(object)
+    display[counts == 0] = ''
+    return display
+
+def load_subscription_data(subscription_file, business_lines=None, rules=None):
+    """
+    读取海运订阅文件并立即完成汇总，返回原始数据、汇总结果和业务月度
+    （在子进程中运行，因此不接收 status_callback）
+    """
     subscription_df = pd.read_excel(subscription_file)
-    
+    subscription_data, business_month, keys = process_subscription_file(subscription_df, business_lines, rules)
+    return subscription_df, subscription_data, business_month, keys
+
+def sample_subscription_chunks(chunks, sample, business_lines, status_callback=None):
+    """
+    抽样预览：逐块抽取订阅数据，同时从全部数据中取第一个业务月度、出现的业务大类和客户；
+    没有费率单号列时按行抽样，并通过 status_callback 提示预对账数据将独立抽样
+
+    返回 (样本, {二级部门: 放大倍数}, 第一个业务月度, 业务大类集合, 全部客户的 CustomerKeys)；
+    客户名称匹配的候选使用全部客户，样本中没有抽到的客户不会被报告为未匹配
+    """
+    first_month = None
+    present_lines = set()
+    customers = []
+    for index, chunk in enumerate(chunks):
+        missing_columns = [col for col in SUBSCRIPTION_COLUMNS if col not in chunk.columns]
+        if missing_columns:
+            raise ValueError(f"海运订阅文件缺少以下列: {', '.join(missing_columns)}")
+        if index == 0 and '费率单号' not in chunk.columns:
+            message = "海运订阅文件没有费率单号列，订阅数据按行抽样，预对账数据独立抽样"
+            print(f"警告：{message}", flush=True)
+            if status_callback:
+                status_callback(message)
+        if first_month is None:
+            months = chunk['业务月度'].dropna()
+            if not months.empty:
+                first_month = months.iloc[0]
+        present_lines.update(chunk['业务大类名称'].dropna())
+        line_chunk = chunk[chunk['业务大类名称'].isin(business_lines)]
+        customers.append(line_chunk[['二级部门', '委托客户']].drop_duplicates())
+        sample.add_subscription(chunk)
+    subscription_df, factors = sample.subscription()
+    customers = pd.concat(customers).drop_duplicates()
+    return (subscription_df, factors, first_month, present_lines,
+            CustomerKeys(customers['二级部门'], customers['委托客户']))
+
+def sample_precheck_chunks(file_chunks, input_files, sample, dedup_columns, status_callback=None):
+    """
+    抽样预览：逐块读取预对账文件，多个文件时先按去重列去掉与之前文件重复的行（通过 status_callback 报告
+    每个文件去掉的行数），再保留订阅样本中的费率单（整单保留），返回样本
+    """
+    dedup = DuplicateIndex(dedup_columns) if len(input_files) > 1 else None
+    parts = []
+    rows = 0
+    for path, chunks in zip(input_files, file_chunks):
+        for chunk in chunks:
+            for col in ('法人部门', '费率单号'):
+                if col not in chunk.columns:
+                    raise ValueError(f"缺少必要的列: {col}")
+            keep = np.ones(len(chunk), dtype=bool)
+            if dedup:
+                dedup.check_columns(path, chunk.columns)
+                keep = dedup.filter(chunk)
+            rows += int(np.count_nonzero(keep))
+            parts.append(chunk[keep & sample.precheck_mask(chunk)])
+        if dedup:
+            dedup.finish_file(path)
+    if dedup:
+        dedup.report(status_callback)
+    df = pd.concat(parts, ignore_index=True)
+    print(f"预对账数据抽样：{rows} 行中保留样本中费率单的 {len(df)} 行", flush=True)
+    return df
+
+def analyze_excel_data(input_file, output_file, subscription_file, status_callback=None,
+                       writer_mode=None, compress_level=None, result_callback=None,
+                       export_mode=None, columnar_format=None, business_lines=None,
+                       processing_mode=None, progress_callback=None, history_db=None, compute_backend=None,
+                       sample_fraction=None):
+    """
+    分析海运订阅文件和预对账文件，生成总表并按部门拆分
+
+    input_file: 预对账文件路径，或多个预对账文件路径的列表（如相互重叠的每周导出）；多个文件并行读取后
+                按配置的 precheck_dedup_columns 去掉后面文件中与之前文件重复的行再合并分析；为空时只分析订阅数据
+    status_callback: 进入新阶段时调用 status_callback(文字)
+    progress_callback: 阶段内的进度，调用 progress_callback(已完成数量, 总数量, 单位)，总数量未知时为 None；
+                       在内层循环中频繁调用，回调本身不应阻塞
+
+    result_callback: 客户公司分析结果（full_analysis）计算完成后、写出 Excel 之前调用，
+                     用于在界面中提前预览结果
+    writer_mode: 总表写出方式，'openpyxl' 为逐 sheet 写出；'parallel' 为各 sheet 在独立子进程中
+                 生成 XML 并压缩，最后组装成 xlsx；为 None 时读取配置文件中的 writer_mode
+    compress_level: 'parallel' 模式和流式写出的 deflate 压缩级别（0-9）；为 None 时读取配置文件中的 compress_level
+    export_mode: 'excel' 只生成 Excel；'columnar' 只把计算结果写成按业务月度、业务大类和部门分区的
+                 Parquet/Arrow 数据集（输出目录下的“分析结果_数据集”）；'both' 两者都生成，
+                 没有安装 pyarrow 时只生成 Excel；为 None 时读取配置文件中的 export_mode
+    columnar_format: 数据集格式，'parquet' 或 'arrow'（可内存映射的 Arrow IPC 文件）；
+                     为 None 时读取配置文件中的 columnar_format
+    business_lines: 需要生成报表的业务大类名称列表，为 None 时读取配置文件中的 business_lines；
+                    海运沿用原来的文件名，其他业务大类的文件名为“分析结果_{业务大类}_...”
+    processing_mode: 'auto' 按文件大小和行数估算内存占用，超出配置的内存预算（memory_budget_mb）时
+                     改用流式处理：分块只读入需要的列，原始数据逐行复制到输出文件；
+                     'memory' / 'streaming' 强制使用对应方式；为 None 时读取配置文件中的 processing_mode
+    history_db: 历史数据库路径，本月结果保存到其中并据此计算总利润率环比；为 None 时读取配置文件中的 history_db
+    compute_backend: 'pandas' 在内存中汇总；'sqlite' 把输入分块写入临时 SQLite 数据库，用带索引的 SQL 查询
+                     完成分组汇总（结果与 pandas 相同，固定使用流式写出）；为 None 时读取配置文件中的 compute_backend
+    sample_fraction: 抽样预览的比例（0-1），为 None 时分析全部数据。按二级部门分层抽取这一比例的费率单，
+                     订阅数据和预对账数据使用同一组费率单（整单保留），边读边抽样，读取方式同样按 processing_mode
+                     选择；样本在内存中运行完整流程，票数换算为全量估计值；结果写到输出目录下的“抽样预览_比例”
+                     目录中，文件名前加“抽样预览_比例_”，不保存到历史数据库
+
+    返回生成的文件列表
+    """
+    config = load_config()
+    if business_lines is None:
+        business_lines = config['business_lines']
+    if processing_mode is None:
+        processing_mode = config['processing_mode']
+    if history_db is None:
+        history_db = config['history_db']
+    if writer_mode is None:
+        writer_mode = config['writer_mode']
+    if compress_level is None:
+        compress_level = config['compress_level']
+    if export_mode is None:
+        export_mode = config['export_mode']
+    if columnar_format is None:
+        columnar_format = config['columnar_format']
+    input_files = input_file_list(input_file)
+    dedup_columns = config['precheck_dedup_columns']
+    # 流式写出时每个预对账文件保留的行，None 表示全部保留
+    precheck_keep = [None] * len(input_files)
+    if compute_backend is None:
+        compute_backend = config['compute_backend']
+
+    if writer_mode not in ('openpyxl', 'parallel'):
+        raise ValueError(f"不支持的写出方式: {writer_mode}")
+    if isinstance(compress_level, bool) or not isinstance(compress_level, int) or not 0 <= compress_level <= 9:
+        raise ValueError(f"压缩级别应为 0 到 9 的整数: {compress_level}")
+    if export_mode not in ('excel', 'columnar', 'both'):
+        raise ValueError(f"不支持的导出方式: {export_mode}")
+    if compute_backend not in ('pandas', 'sqlite'):
+        raise ValueError(f"不支持的计算后端: {compute_backend}")
+    if export_mode != 'excel' and not pyarrow_available():
+        # 读入数据之前检查，避免分析完成后才发现无法导出
+        if export_mode == 'columnar':
+            raise ImportError("导出 Parquet/Arrow 数据集需要安装 pyarrow：pip install pyarrow")
+        print("未安装 pyarrow，不导出分析数据集，只生成 Excel 报表", flush=True)
+        if status_callback:
+            status_callback("未安装 pyarrow，只生成 Excel 报表")
+        export_mode = 'excel'
+    if sample_fraction is not None:
+        if not 0 < sample_fraction < 1:
+            raise ValueError(f"抽样比例应在 0 到 1 之间: {sample_fraction}")
+    if compute_backend == 'sqlite':
+        # 原始数据不读入内存，只能从源文件逐行复制写出
+        processing_mode = 'streaming'
+    if sample_fraction is not None:
+        # 输入按 processing_mode 整表或分块读取，边读边抽样；样本很小，在内存中汇总；抽样结果不能作为历史数据
+        compute_backend = 'pandas'
+        history_db = ''
+        print(f"抽样预览：抽取 {preview_label(sample_fraction)} 的费率单，票数为全量估计值", flush=True)
+
+    # 读入之前按文件大小和行数估算内存占用，决定整表读入还是流式处理
+    processing_mode, estimate_mb, budget_mb = choose_processing_mode(
+        [subscription_file] + input_files, config['memory_budget_mb'], processing_mode)
+    mode_text = '流式处理（分块读取、逐行写出）' if processing_mode == 'streaming' else '内存处理'
+    if estimate_mb is None:
+        print(f"内存预算 {budget_mb:.0f} MB，按设置使用{mode_text}", flush=True)
+        if status_callback:
+            status_callback(f"使用{mode_text}")
+    else:
+        print(f"预计内存占用 {estimate_mb:.0f} MB，内存预算 {budget_mb:.0f} MB，使用{mode_text}", flush=True)
+        if status_callback:
+            status_callback(f"使用{mode_text}（预计 {estimate_mb:.0f} MB / 预算 {budget_mb:.0f} MB）")
+    tracker = MemoryTracker(budget_mb)
+
     if status_callback:
-        status_callback("处理海运订阅数据...")
-    subscription_data, business_month = process_subscription_file(subscription_file)
+        status_callback("开始读取海运订阅文件...")
+
+    sqlite_backend = None
+    # 客户名称匹配使用的客户键，为 None 时使用订阅数据汇总时建立的客户键
+    match_keys = None
+    if compute_backend == 'sqlite':
+        # 输入分块写入临时数据库，内存中只保留分组汇总结果
+        from sql_backend import SQLiteBackend
+        sqlite_backend = SQLiteBackend()
+        if status_callback:
+            status_callback("处理海运订阅数据（SQLite）...")
+        try:
+            subscription_data, business_month, keys, present_lines = sqlite_backend.process_subscription_file(
+                subscription_file, business_lines, config['rules']['subscription'], progress=progress_callback)
+        except Exception:
+            sqlite_backend.close()
+            raise
+        if not input_file:
+            sqlite_backend.close()
+        elif status_callback:
+            status_callback("读取预对账文件（SQLite）...")
+    elif sample_fraction is not None:
+        # 边读边抽样，之后的汇总和写出都只处理样本；预对账数据保留订阅样本中的费率单
+        sample = TicketSample(sample_fraction, config['preview']['seed'])
+        if processing_mode == 'streaming':
+            # 分块读取，内存中只保留样本
+            subscription_chunks = iter_excel_chunks(subscription_file, progress=progress_callback)
+            precheck_chunks = [iter_excel_chunks(path, progress=progress_callback if len(input_files) == 1 else None)
+                               for path in input_files]
+        else:
+            # 各文件在进程池中并行整表解析后抽样
+            with process_pool(max(2, min(1 + len(input_files), os.cpu_count() or 1))) as executor:
+                subscription_future = executor.submit(read_excel_chunked, subscription_file)
+                input_futures = [executor.submit(read_excel_chunked, path) for path in input_files]
+                subscription_chunks = [subscription_future.result()]
+                precheck_chunks = [[future.result()] for future in input_futures]
+        subscription_df, sample_factors, first_month, present_lines, match_keys = sample_subscription_chunks(
+            subscription_chunks, sample, business_lines, status_callback)
+        if status_callback:
+            status_callback("处理海运订阅数据（抽样）...")
+        subscription_data, business_month, keys = process_subscription_file(
+            subscription_df, business_lines, config['rules']['subscription'])
+        subscription_data = scale_counts(subscription_data, sample_factors)
+        # 业务月度取自全部数据，与全量分析一致
+        if first_month is not None:
+            business_month = resolve_business_month(first_month)
+        if input_file:
+            if status_callback:
+                status_callback("读取预对账文件（抽样）...")
+            df = sample_precheck_chunks(precheck_chunks, input_files, sample, dedup_columns, status_callback)
+        precheck_chunks = None
+    elif processing_mode == 'streaming':
+        # 只读入分析需要的列；原始数据不读入内存，写出时再从源文件逐行复制
+        subscription_rules = config['rules']['subscription']
+        subscription_columns = set(SUBSCRIPTION_COLUMNS) | rule_columns(compile_rules(subscription_rules))
+        subscription_df = read_excel_chunked(subscription_file, subscription_columns, progress=progress_callback)
+        present_lines = set(subscription_df['业务大类名称'].dropna()) if '业务大类名称' in subscription_df else set()
+        if status_callback:
+            status_callback("处理海运订阅数据...")
+        subscription_data, business_month, keys = process_subscription_file(
+            subscription_df, business_lines, subscription_rules)
+        subscription_df = None
+        if input_file:
+            if status_callback:
+                status_callback("读取预对账文件...")
+            if len(input_files) > 1:
+                # 多个文件在进程池中并行解析，每个文件只读入分析和去重需要的列
+                precheck_columns = set(PRECHECK_COLUMNS) | set(dedup_columns)
+                with process_pool(min(len(input_files), os.cpu_count() or 1)) as executor:
+                    frames = list(executor.map(read_excel_chunked, input_files,
+                                               [precheck_columns] * len(input_files)))
+            else:
+                frames = [read_excel_chunked(input_files[0], PRECHECK_COLUMNS, progress=progress_callback)]
+            df, precheck_keep = combine_precheck_frames(frames, input_files, dedup_columns, status_callback)
+            frames = None
+    else:
+        # 海运订阅文件和预对账文件相互独立，在进程池中并行解析（Excel 解析受 GIL 限制，线程无法重叠）；
+        # 海运订阅数据读取完成后在同一子进程中立即汇总，与预对账文件的解析重叠进行
+        # 多个预对账文件各自在一个子进程中解析
+        with process_pool(max(2, min(1 + len(input_files), os.cpu_count() or 1))) as executor:
+            subscription_future = executor.submit(load_subscription_data, subscription_file, business_lines,
+                                                  config['rules']['subscription'])
+            if input_file:
+                if status_callback:
+                    status_callback("读取预对账文件...")
+                input_futures = [executor.submit(pd.read_excel, path) for path in input_files]
+            if status_callback:
+                status_callback("处理海运订阅数据...")
+            subscription_df, subscription_data, business_month, keys = subscription_future.result()
+            if input_file:
+                df, _ = combine_precheck_frames([future.result() for future in input_futures], input_files,
+                                                dedup_columns, status_callback)
+        present_lines = set(subscription_df['业务大类名称'].dropna())
+    tracker.stage("读取数据")
 
-    # 修改输出文件名，添加总表标识和业务月度，同时保持原始路径
+    # 输出文件名按业务大类和业务月度生成，保持在所选的输出目录中
     output_dir = os.path.dirname(output_file)
-    base_name = "分析结果_总表"
-    output_file = os.path.join(output_dir, f"{base_name}_{business_month}.xlsx")
+    if sample_fraction is not None:
+        output_dir = preview_dir(output_dir, sample_fraction)
+        os.makedirs(output_dir, exist_ok=True)
+    # 总表和部门工作簿之外生成的文件（如客户匹配报告）
+    extra_files = []
 
     if input_file:
-        if status_callback:
-            status_callback("读取预对账文件...")
-        df = pd.read_excel(input_file)
-        
         if status_callback:
             status_callback("分析数据中...")
-        # 确保必要的列存在
-        required_columns = ['法人部门', '委托客户', '别名', '应收应付', '本位币金额', '费率单号', '币种']
-        for col in required_columns:
-            if col not in df.columns:
-                raise ValueError(f"缺少必要的列: {col}")
-
-        # 按法人部门、委托客户、费率单号和别名进行汇总
-        grouped = df.groupby(['法人部门', '委托客户', '费率单号', '别名', '应收应付', '币种'])['本位币金额'].sum().unstack(level='应收应付').fillna(0)
-        grouped = grouped.rename(columns={'应收': '应收金额', '应付': '应付金额'})
-        grouped['费目利润'] = grouped['应收金额'] - grouped['应付金额']
-
-        # 重置索引，使得所有列都变成普通列
-        grouped = grouped.reset_index()
-
-        # 先计算每个费率单号的总毛利和毛利率
-        rate_totals = grouped.groupby('费率单号').agg({
-            '应收金额': 'sum',
-            '应付金额': 'sum'
-        }).reset_index()
-        
-        rate_totals['单票毛利'] = rate_totals['应收金额'] - rate_totals['应付金额']
-        rate_totals['单票毛利率'] = rate_totals.apply(
-            lambda x: x['单票毛利'] / x['应收金额'] if x['应收金额'] != 0 else -1, 
-            axis=1
-        )
-        
-        # 只保留需要的列
-        rate_totals = rate_totals[['费率单号', '单票毛利', '单票毛利率']]
-
-        # 创建结果 DataFrame
-        results = []
-        seen_rate_nos = {}  # 用于跟踪已经见过的费率单号
-
-        for _, row in grouped.iterrows():
-            # 获取该费率单号的总计数据
-            rate_total = rate_totals[rate_totals['费率单号'] == row['费率单号']].iloc[0]
-
-            result = {
-                '法人部门': row['法人部门'],
-                '委托客户': row['委托客户'],
-                '费率单号': row['费率单号'],
-                '别名': row['别名'],
-                '币种': row['币种'],
-                '应收金额': row['应收金额'],
-                '应付金额': row['应付金额'],
-                '费目利润': row['费目利润'],
-                '类型': '',
-                '单票毛利': rate_total['单票毛利'],  # 使用费率单总毛利
-                '单票毛利率': rate_total['单票毛利率']  # 使用费率单总毛利率
-            }
-
-            if row['应付金额'] > 0 and row['应收金额'] == 0:
-                result['类型'] = '无应收'
-            elif row['应收金额'] < row['应付金额']:
-                result['类型'] = '倒挂'
-
-            results.append(result)
-
-        # 创建结果 DataFrame
-        result_df = pd.DataFrame(results)
-        
-        # 创建客户公司分析数据
-        customer_analysis = result_df.groupby(['法人部门', '委托客户']).agg({
-            '费目利润': 'sum',  # 总金额
-        }).reset_index()
-
-        customer_analysis['初步分析'] = result_df.groupby(['法人部门', '委托客户']).apply(format_analysis).reset_index(drop=True)
-        customer_analysis = customer_analysis.rename(columns={
-            '费目利润': '总金额',
-        })
+        matcher = build_customer_matcher(keys if match_keys is None else match_keys, config['customer_matching'],
+                                         status_callback)
+        if sqlite_backend is not None:
+            with sqlite_backend:
+                result_df, customer_analysis, precheck_keep = sqlite_backend.analyze_precheck_data(
+                    input_files, keys, config['rules']['line_items'], matcher, dedup_columns,
+                    progress=progress_callback, status_callback=status_callback)
+        else:
+            # 确保必要的列存在
+            for col in PRECHECK_COLUMNS:
+                if col not in df.columns:
+                    raise ValueError(f"缺少必要的列: {col}")
+            result_df, customer_analysis = analyze_precheck_data(df, keys, config['rules']['line_items'], matcher)
+        if matcher is not None and not matcher.report.empty:
+            match_report_file = os.path.join(output_dir, f"客户匹配报告_{business_month}.xlsx")
+            write_match_report(match_report_file, matcher.report)
+            extra_files.append(match_report_file)
+            report_text = f"客户匹配报告已保存到 {match_report_file}，{matcher.unmatched_count()} 个客户未匹配"
+            print(report_text, flush=True)
+            if status_callback:
+                status_callback(report_text)
+        if processing_mode == 'streaming' and sample_fraction is None:
+            # 预对账原始数据写出时从源文件复制，汇总完成后即可释放
+            df = None
     else:
-        # 如果没有预对账文件，创建一个空的customer_analysis DataFrame
-        customer_analysis = pd.DataFrame(columns=['法人部门', '委托客户', '总金额', '初步分析'])
+        # 如果没有预对账文件，没有任何客户有预对账汇总
+        customer_analysis = None
 
-    # 创建法人部门和二级部门的对应关系映射
-    dept_mapping = {
-        '内贸水运': '内贸',
-        '外贸水运': '外贸'
-    }
-    
-    # 添加对应的法人部门列
-    subscription_data['法人部门'] = subscription_data['二级部门'].map(lambda x: dept_mapping.get(x, x))
-    
-    # 将海运订阅文件中的所有二级部门和委托客户信息合并到客户分析结果中
-    full_analysis = pd.merge(subscription_data, customer_analysis, 
-                           on=['法人部门', '委托客户'], 
-                           how='left')
+    # 将海运订阅文件中的所有二级部门和委托客户信息合并到客户分析结果中：
+    # 每个客户键对应唯一的法人客户键，合并即按编号查表
+    full_analysis = subscription_data.drop(columns=['客户键'])
+    customer_keys = subscription_data['客户键'].to_numpy()
+    full_analysis['法人部门'] = keys.legal_department_of(customer_keys)
+    if customer_analysis is not None:
+        legal_keys = keys.key_legal[customer_keys]
+        full_analysis['总金额'] = customer_analysis['总金额'][legal_keys]
+        full_analysis['初步分析'] = customer_analysis['初步分析'][legal_keys]
+    else:
+        full_analysis['总金额'] = np.nan
+        full_analysis['初步分析'] = None
     
     # 填充NaN值
     full_analysis = full_analysis.fillna({'总票数': 0, '总金额': 0, '总利润率': 0, '初步分析': ''})
@@ -279,31 +595,289 @@ def analyze_excel_data(input_file, output_file, subscription_file, status_callba
     # 对full_analysis进行排序
     full_analysis = full_analysis.sort_values(by=['二级部门', '委托客户'])
 
-    # 保存结果到 Excel 文件
+    # 保存到历史数据库，并按索引查找之前最近一个月份的总利润率计算环比
+    full_analysis['总利润率环比'] = update_history(history_db, business_month, full_analysis, business_lines)
+    tracker.stage("分析计算")
+
+    if result_callback:
+        result_callback(full_analysis)
+
+    dataset_files = []
+    if export_mode in ('columnar', 'both'):
+        if status_callback:
+            status_callback("导出分析数据集...")
+        dataset_dir = os.path.join(output_dir, "分析结果_数据集")
+        dataset_files = export_columnar(dataset_dir, business_month, subscription_data.drop(columns=['客户键']),
+                                        result_df if input_file else None, full_analysis, file_format=columnar_format,
+                                        business_lines=business_lines)
+        print(f"分析数据集已保存到 {dataset_dir}")
+        if export_mode == 'columnar':
+            if sample_fraction is not None:
+                return mark_preview_files(dataset_files + extra_files, sample_fraction)
+            return dataset_files + extra_files
+
+    if input_file:
+        # 处理分析结果sheet，应用"只显示一次"的逻辑
+        display_df = result_df.copy()
+        display_df = display_df.sort_values(['法人部门', '委托客户', '费率单号'])
+        
+        # 创建一个布尔掩码，标记每个费率单号的第一次出现
+        is_first = ~display_df['费率单号'].duplicated()
+        
+        # 将非第一次出现的记录的特定字段设置为空
+        # 修改：分别处理字符串列和数值列
+        display_df.loc[~is_first, ['委托客户', '费率单号']] = ''  # 字符串列
+        display_df.loc[~is_first, ['单票毛利', '单票毛利率']] = np.nan  # 数值列用 NaN
+
+    # 每个业务大类分别生成总表和部门工作簿；多个业务大类时原始数据sheet只包含本业务大类的数据
+    if len(business_lines) > 1:
+        for line in business_lines:
+            if line not in present_lines:
+                print(f"订阅文件中没有{line}业务的数据，跳过")
+        business_lines = [line for line in business_lines if line in present_lines]
+
+    if processing_mode == 'streaming' or sample_fraction is not None:
+        if sample_fraction is not None:
+            # 抽样预览的样本已在内存中，同样逐行写出总表和部门工作簿，不需要再读入总表拆分
+            subscription_source = subscription_df
+            precheck_sources = [df] if input_file else []
+        else:
+            subscription_source = subscription_file
+            precheck_sources = input_files
+        output_files = write_reports_streaming(output_dir, business_month, business_lines, subscription_source,
+                                               precheck_sources, display_df if input_file else None, full_analysis,
+                                               compress_level=compress_level, status_callback=status_callback,
+                                               progress_callback=progress_callback, precheck_keep=precheck_keep)
+        tracker.stage("写出工作簿")
+        _report_memory(tracker, mode_text, status_callback)
+        if sample_fraction is not None:
+            print(f"抽样预览结果已保存到 {output_dir}")
+            return mark_preview_files(output_files + dataset_files + extra_files, sample_fraction)
+        return output_files + dataset_files + extra_files
+
+    output_files = []
+    for line in business_lines:
+        if len(business_lines) > 1:
+            line_subscription_df = subscription_df[subscription_df['业务大类名称'] == line]
+        else:
+            line_subscription_df = subscription_df
+        line_analysis = full_analysis[full_analysis['业务大类名称'] == line]
+        line_output_file = os.path.join(output_dir, f"{report_prefix(line)}总表_{business_month}.xlsx")
+        subscription_sheet = f"{line}订阅原始数据"
+
+        if writer_mode == 'parallel':
+            if status_callback:
+                status_callback(f"并行写出{line}总表...")
+            # 与 openpyxl 模式一致，只有存在预对账文件时才设置原始数据列宽
+            sheets = [xlsx_writer.dataframe_sheet(subscription_sheet, line_subscription_df,
+                                                  fixed_widths={'B': 9} if input_file else None,
+                                                  max_auto_width=40 if input_file else None)]
+            if input_file:
+                sheets.append(xlsx_writer.dataframe_sheet('预对账原始数据', df, max_auto_width=40))
+                sheets.append(xlsx_writer.dataframe_sheet('分析结果', display_df, fixed_widths={'A': 17, 'I': 8},
+                                                          max_auto_width=30, percent_column=10))
+            sheets.append(_analysis_sheet(line_analysis))
+            xlsx_writer.write_workbook_parallel(line_output_file, sheets, compress_level=compress_level)
+        else:
+            if status_callback:
+                status_callback(f"写出{line}总表...")
+            write_summary_workbook(line_output_file, line_subscription_df, df if input_file else None,
+                                   display_df if input_file else None, line_analysis,
+                                   subscription_sheet=subscription_sheet, progress_callback=progress_callback)
+
+        print(f"分析完成，结果已保存到 {line_output_file}")
+        output_files.append(line_output_file)
+        tracker.stage(f"写出{line}总表")
+        
+        # 在主分析完成后进行拆分
+        if status_callback:
+            status_callback(f"正在按部门拆分{line}工作簿...")
+        output_files.extend(split_workbook_by_department(line_output_file, business_month, line,
+                                                         progress_callback=progress_callback))
+        tracker.stage(f"拆分{line}工作簿")
+    _report_memory(tracker, mode_text, status_callback)
+    return output_files + dataset_files + extra_files
+
+def update_history(history_db, business_month, full_analysis, business_lines):
+    """
+    把本月结果保存到历史数据库，返回总利润率环比（本月减去之前最近一个月份，单位与毛利率相同）
+
+    没有配置数据库、客户没有历史数据或数据库读写失败时为空值，不影响报表生成
+    """
+    change = np.full(len(full_analysis), np.nan)
+    if not history_db:
+        return change
+    try:
+        with HistoryStore(resolve_path(history_db)) as store:
+            store.save_month(business_month, full_analysis, business_lines)
+            previous = store.previous_values(business_month, full_analysis, '总利润率')
+    except (sqlite3.Error, ValueError) as e:
+        print(f"警告：历史数据库读写失败，跳过环比计算: {str(e)}")
+        return change
+    print(f"已保存到历史数据库，有历史数据的客户数: {np.count_nonzero(~np.isnan(previous))}")
+    return full_analysis['总利润率'].to_numpy(dtype=float) - previous
+
+def _report_memory(tracker, mode_text, status_callback):
+    """报告本次使用的处理方式和内存峰值"""
+    peak_mb = tracker.peak_mb
+    peak_text = f"，内存峰值 {peak_mb:.0f} MB" if peak_mb is not None else ''
+    print(f"处理方式：{mode_text}{peak_text}", flush=True)
+    if status_callback:
+        status_callback(f"工作簿拆分完成（{mode_text}{peak_text}）")
+
+def report_prefix(line):
+    """报表文件名前缀，海运沿用原来的文件名，其他业务大类在前缀中加上业务大类名称"""
+    return "分析结果_" if line == '海运' else f"分析结果_{line}_"
+
+def build_customer_matcher(keys, settings, status_callback=None):
+    """
+    按配置建立委托客户匹配器，候选为订阅数据中的全部 (法人部门, 委托客户)；未启用时返回 None
+
+    匹配结果的统计通过 status_callback 报告
+    """
+    if not settings['enabled']:
+        return None
+    names = keys.decode_legal(np.arange(keys.n_legal_keys))
+    alias_file = resolve_path(settings['alias_file']) if settings['alias_file'] else None
+    return CustomerMatcher(names['法人部门'], names['委托客户'], AliasTable(alias_file),
+                           suggest_threshold=settings['suggest_threshold'], status_callback=status_callback)
+
+def write_match_report(output_file, report):
+    """写出客户匹配报告：未完全相同的预对账客户及其匹配方式、建议的订阅客户和相似度"""
+    xlsx_writer.write_workbook_streaming(output_file, [
+        xlsx_writer.dataframe_sheet('客户匹配', report, max_auto_width=40, percent_column=4),
+    ])
+
+def analyze_precheck_data(df, keys, rules=None, matcher=None):
+    """
+    按费目汇总预对账数据
+
+    所有分组都在整数编号上完成：(法人部门, 委托客户) 使用海运订阅数据建立的法人客户键，
+    费率单号、别名、币种各自编号，只在生成明细表时还原为文字。
+    费目类型按 rules（config 中的 rules.line_items，默认为无应收、倒挂）在整列上分类
+    matcher: CustomerMatcher，编码之前把委托客户名称对应到订阅数据中的名称；为 None 时要求名称完全相同
+
+    返回 (result_df 费目明细, customer_analysis)，其中 customer_analysis 是以法人客户键为下标的数组：
+    {'总金额': ..., '初步分析': ...}，没有预对账数据的客户为 NaN / None
+    """
+    # groupby 会忽略分组列为空的行，这里保持一致
+    key_columns = ['法人部门', '委托客户', '费率单号', '别名', '应收应付', '币种']
+    valid = df[key_columns].notna().all(axis=1).to_numpy()
+    df = df[valid]
+
+    # 金额以分为单位的整数汇总和比较，只在生成明细表时换算为元
+    amount = to_minor_units(df['本位币金额'])
+    direction = df['应收应付'].to_numpy()
+    return summarize_precheck(keys, df['法人部门'], df['委托客户'], df['费率单号'], df['别名'], df['币种'],
+                              np.where(direction == '应收', amount, 0), np.where(direction == '应付', amount, 0),
+                              rules, matcher)
+
+def summarize_precheck(keys, departments, customers, rate_numbers, aliases, currencies, receivable, payable,
+                       rules=None, matcher=None, counts=None):
+    """
+    按 (法人部门, 委托客户, 费率单号, 别名, 币种) 汇总应收/应付金额（分）并生成费目明细和客户汇总
+
+    输入可以是逐行数据，也可以是已经部分汇总的数据（如 SQL 后端按原始名称分组的结果），
+    委托客户名称匹配后可能有多组合并为同一费目，这里会再汇总一次；
+    counts 为每行代表的原始记录数，只用于客户匹配报告，为 None 时每行按 1 条计
+    返回值与 analyze_precheck_data 相同
+    """
+    if matcher is not None:
+        customers = matcher.match(departments, customers, counts)
+    legal_codes = keys.encode_legal(departments, customers)
+    rate_codes, rate_numbers = pd.factorize(pd.Series(rate_numbers))
+    alias_codes, aliases = pd.factorize(pd.Series(aliases))
+    currency_codes, currencies = pd.factorize(pd.Series(currencies))
+    n_legal = keys.n_legal_keys
+
+    # 按法人部门、委托客户、费率单号、别名和币种汇总应收/应付金额
+    items, first_rows = dense_codes(legal_codes, rate_codes, alias_codes, currency_codes)
+    n_items = len(first_rows)
+    receivable = group_sum_minor(items, receivable, n_items)
+    payable = group_sum_minor(items, payable, n_items)
+    item_profit = receivable - payable
+
+    item_legal = legal_codes[first_rows]
+    item_rate = rate_codes[first_rows]
+    item_alias = alias_codes[first_rows]
+    item_currency = currency_codes[first_rows]
+
+    # 每个费率单号的总毛利和毛利率，按编号查表得到每个费目的单票数据
+    n_rates = len(rate_numbers)
+    rate_receivable = group_sum_minor(item_rate, receivable, n_rates)
+    rate_profit = rate_receivable - group_sum_minor(item_rate, payable, n_rates)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_margin = np.where(rate_receivable != 0, rate_profit / rate_receivable, -1)
+
+    # 按配置的规则确定费目类型（默认：无应收为有应付但没有应收；倒挂为应收小于应付）
+    if rules is None:
+        rules = DEFAULT_CONFIG['rules']['line_items']
+    # 金额列以分保存，规则中以元为单位的常数按同样比例换算
+    rules = compile_rules(rules, scales=dict.fromkeys(['应收金额', '应付金额', '费目利润', '单票毛利'], MONEY_SCALE))
+    item_type = classify(rules, pd.DataFrame({
+        '应收金额': receivable,
+        '应付金额': payable,
+        '费目利润': item_profit,
+        '单票毛利': rate_profit[item_rate],
+        '单票毛利率': rate_margin[item_rate],
+    }))
+
+    # 明细按法人部门、委托客户、费率单号、别名、币种的文字顺序排列（只对去重后的值排序）
+    legal_names = keys.decode_legal(np.arange(n_legal))
+    legal_rank = np.lexsort((sort_ranks(pd.Index(legal_names['委托客户'])),
+                             sort_ranks(pd.Index(legal_names['法人部门']))))
+    legal_order = np.empty(n_legal, dtype=np.int64)
+    legal_order[legal_rank] = np.arange(n_legal)
+    order = np.lexsort((
+        sort_ranks(pd.Index(currencies))[item_currency],
+        sort_ranks(pd.Index(aliases))[item_alias],
+        sort_ranks(pd.Index(rate_numbers))[item_rate],
+        legal_order[item_legal],
+    ))
+
+    item_names = legal_names.iloc[item_legal[order]].reset_index(drop=True)
+    result_df = pd.DataFrame({
+        '法人部门': item_names['法人部门'],
+        '委托客户': item_names['委托客户'],
+        '费率单号': rate_numbers[item_rate[order]],
+        '别名': aliases[item_alias[order]],
+        '币种': currencies[item_currency[order]],
+        '应收金额': from_minor_units(receivable[order]),
+        '应付金额': from_minor_units(payable[order]),
+        '费目利润': from_minor_units(item_profit[order]),
+        '类型': item_type[order],
+        '单票毛利': from_minor_units(rate_profit[item_rate[order]]),  # 使用费率单总毛利
+        '单票毛利率': rate_margin[item_rate[order]],  # 使用费率单总毛利率
+    })
+
+    # 客户公司分析：按法人客户键汇总总金额，并整理初步分析文字
+    has_items = np.bincount(item_legal, minlength=n_legal) > 0
+    total_amount = np.where(has_items, from_minor_units(group_sum_minor(item_legal, item_profit, n_legal)), np.nan)
+    analysis_text = format_analysis(item_legal[order], item_type[order], result_df['别名'].to_numpy(), n_legal,
+                                    rule_names(rules))
+    analysis_text[~has_items] = None
+
+    return result_df, {'总金额': total_amount, '初步分析': analysis_text}
+
+def write_summary_workbook(output_file, subscription_df, precheck_df, display_df, full_analysis,
+                           subscription_sheet='海运订阅原始数据', progress_callback=None):
+    """
+    使用 openpyxl 逐个 sheet 写出总表
+
+    progress_callback: 写入客户公司分析时按行报告进度
+    """
     with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-        # 首先保存海运订阅文件的原始数据
-        subscription_df.to_excel(writer, index=False, sheet_name='海运订阅原始数据')
-        # 设置海运订阅原始数据sheet的冻结窗格
-        writer.sheets['海运订阅原始数据'].freeze_panes = 'A2'
+        # 首先保存订阅文件的原始数据
+        subscription_df.to_excel(writer, index=False, sheet_name=subscription_sheet)
+        # 设置订阅原始数据sheet的冻结窗格
+        writer.sheets[subscription_sheet].freeze_panes = 'A2'
         
-        if input_file:
+        if precheck_df is not None:
             # 保存预对账原始数据
-            df.to_excel(writer, index=False, sheet_name='预对账原始数据')
+            precheck_df.to_excel(writer, index=False, sheet_name='预对账原始数据')
             # 设置预对账原始数据sheet的冻结窗格
             writer.sheets['预对账原始数据'].freeze_panes = 'A2'
             
-            # 处理分析结果sheet，应用"只显示一次"的逻辑
-            display_df = result_df.copy()
-            display_df = display_df.sort_values(['法人部门', '委托客户', '费率单号'])
-            
-            # 创建一个布尔掩码，标记每个费率单号的第一次出现
-            is_first = ~display_df['费率单号'].duplicated()
-            
-            # 将非第一次出现的记录的特定字段设置为空
-            # 修改：分别处理字符串列和数值列
-            display_df.loc[~is_first, ['委托客户', '费率单号']] = ''  # 字符串列
-            display_df.loc[~is_first, ['单票毛利', '单票毛利率']] = np.nan  # 数值列用 NaN
-            
             # 保存处理后的分析结果
             display_df.to_excel(writer, index=False, sheet_name='分析结果')
             # 设置分析结果sheet的冻结窗格
@@ -311,7 +885,7 @@ def analyze_excel_data(input_file, output_file, subscription_file, status_callba
             result_sheet.freeze_panes = 'A2'
             
             # 设置原始数据sheet的列宽
-            if input_file:
+            if precheck_df is not None:
                 # 设置分析结果sheet的格式
                 result_sheet = writer.sheets['分析结果']
                 
@@ -352,8 +926,8 @@ def analyze_excel_data(input_file, output_file, subscription_file, status_callba
                     adjusted_width = min(max_length + 2, 40)  # 限制最大宽度为40
                     worksheet.column_dimensions[column_letter].width = adjusted_width
 
-            # 设置海运订阅原始数据sheet的列宽
-            worksheet = writer.sheets['海运订阅原始数据']
+            # 设置订阅原始数据sheet的列宽
+            worksheet = writer.sheets[subscription_sheet]
             # 先设置B列的固定宽度
             worksheet.column_dimensions['B'].width = 9
             
@@ -377,41 +951,11 @@ def analyze_excel_data(input_file, output_file, subscription_file, status_callba
         analysis_sheet.freeze_panes = 'A3'  # 因为有两行表头，所以从第3行开始
         
         # 设置列宽
-        column_widths = {
-            'A': 15,  # 二级部门
-            'B': 30,  # 客户公司
-            'C': 12,  # 约价负毛利票数
-            'D': 10,  # 约价毛利率
-            'E': 12,  # 非约价低负票数
-            'F': 10,  # 非约价毛利率
-            'G': 10,  # 总票数
-            'H': 10,  # 总利润率
-            'I': 40,  # 初步分析
-            'J': 40,  # 业务部门反馈具体原因
-            'K': 15,  # 原因类别
-            'L': 12,  # 损调利润
-            'M': 40,  # 计划采取的措施
-            'N': 15,  # 是否完成价格备案表
-            'O': 15,  # 是否联合磋商
-            'P': 15,  # 督办任务
-            'Q': 10,  # 责任人
-            'R': 15,  # 督办时间点
-        }
-
-        # 设置列宽
-        for col, width in column_widths.items():
+        for col, width in ANALYSIS_COLUMN_WIDTHS.items():
             analysis_sheet.column_dimensions[col].width = width
 
-        # 添加表头
-        headers = [
-            ['二级部门', '委托客户', '约价', '约价', '非约价', '非约价', '总票数', '总利润率', '初步分析', '业务部门反馈具体原因', 
-             '原因类别', '损调利润', '计划采取的措施', '是否完成价格备案表', '是否联合磋商', '督办任务', 
-             '责任人', '督办时间点'],
-            ['', '', '负毛利票数', '毛利率', '低负票数', '毛利率', '', '', '', '', '', '', '', '', '', '', '', '']
-        ]
-        
         # 设置表头样式
-        for row_index, row in enumerate(headers, start=1):
+        for row_index, row in enumerate(ANALYSIS_HEADERS, start=1):
             for col_index, value in enumerate(row, start=1):
                 cell = analysis_sheet.cell(row=row_index, column=col_index, value=value)
                 cell.font = Font(bold=True, size=9)
@@ -423,28 +967,8 @@ def analyze_excel_data(input_file, output_file, subscription_file, status_callba
                     bottom=Side(style='thin')
                 )
 
-        # 合并单元格
-        merge_ranges = [
-            'A1:A2',  # 二级部门
-            'B1:B2',  # 委托客户
-            'C1:D1',  # 约价
-            'E1:F1',  # 非约价
-            'G1:G2',  # 总票数
-            'H1:H2',  # 总利润率
-            'I1:I2',  # 初步分析
-            'J1:J2',  # 业务部门反馈具体原因
-            'K1:K2',  # 原因类别
-            'L1:L2',  # 损调利润
-            'M1:M2',  # 计划采取的措施
-            'N1:N2',  # 是否完成价格备案表
-            'O1:O2',  # 是否联合磋商
-            'P1:P2',  # 督办任务
-            'Q1:Q2',  # 责任人
-            'R1:R2',  # 督办时间点
-        ]
-
         # 执行单元格合并
-        for cell_range in merge_ranges:
+        for cell_range in ANALYSIS_MERGE_RANGES:
             analysis_sheet.merge_cells(cell_range)
 
         # 设置表头行高
@@ -453,24 +977,14 @@ def analyze_excel_data(input_file, output_file, subscription_file, status_callba
         analysis_sheet.row_dimensions[2].height = header_height
 
         # 添加客户公司分析数据
-        for index, row in full_analysis.iterrows():
+        for index, (_, row) in enumerate(full_analysis.iterrows()):
+            if progress_callback and index % PROGRESS_ROWS == 0:
+                progress_callback(index, len(full_analysis), '行')
             row_num = analysis_sheet.max_row + 1
             
             # 设置单元格值和样式
-            cells = [
-                (1, row['二级部门'], 'left'),
-                (2, row['委托客户'], 'left'),
-                (3, row['约价负毛利票数'], 'center'),
-                (4, row['约价毛利率'], 'center'),
-                (5, row['非约价低负票数'], 'center'),
-                (6, row['非约价毛利率'], 'center'),
-                (7, row['总票数'], 'center'),
-                (8, row['总利润率'], 'center'),
-                (9, row['初步分析'], 'left'),
-            ]
-            
-            for col, value, align in cells:
-                cell = analysis_sheet.cell(row=row_num, column=col, value=value)
+            for col, (name, align, is_percent) in enumerate(ANALYSIS_DATA_COLUMNS, start=1):
+                cell = analysis_sheet.cell(row=row_num, column=col, value=row[name])
                 cell.font = Font(size=9)  # 设置字体大小为9
                 cell.alignment = Alignment(horizontal=align, vertical='center', wrap_text=True)
                 cell.border = Border(
@@ -481,11 +995,11 @@ def analyze_excel_data(input_file, output_file, subscription_file, status_callba
                 )
                 
                 # 设置百分比格式
-                if col in [4, 6, 8]:  # 毛利率列
+                if is_percent:  # 毛利率列
                     cell.number_format = '0.00%'
 
             # 添加空白列
-            for col in range(10, 19):
+            for col in range(len(ANALYSIS_DATA_COLUMNS) + 1, len(ANALYSIS_HEADERS[0]) + 1):
                 cell = analysis_sheet.cell(row=row_num, column=col, value='')
                 cell.font = Font(size=9)
                 cell.alignment = Alignment(horizontal='center', vertical='center')
@@ -496,34 +1010,35 @@ def analyze_excel_data(input_file, output_file, subscription_file, status_callba
                     bottom=Side(style='thin')
                 )
 
-    print(f"分析完成，结果已保存到 {output_file}")
-    
-    # 在主分析完成后进行拆分
-    if status_callback:
-        status_callback("正在按部门拆分工作簿...")
-    split_workbook_by_department(output_file, business_month)
-    if status_callback:
-        status_callback("工作簿拆分完成")
-
-def format_analysis(group):
+def format_analysis(legal_keys, types, aliases, n_legal, labels=('无应收', '倒挂')):
     """
-    格式化分析结果，将无应收和倒挂的情况整理成文本描述
+    格式化分析结果，将各类型（默认为无应收和倒挂）的情况整理成文本描述
+
+    legal_keys / types / aliases: 按明细顺序排列的法人客户键、类型和别名
+    labels: 需要写入的类型，按此顺序排列
+    返回以法人客户键为下标的文字数组，同一客户的别名按第一次出现的顺序去重
     """
-    no_receivable = group[group['类型'] == '无应收']['别名'].unique()
-    reversed = group[group['类型'] == '倒挂']['别名'].unique()
-    
-    result = []
-    if len(no_receivable) > 0:
-        result.append(f"无应收：{', '.join(no_receivable)}")
-    if len(reversed) > 0:
-        result.append(f"倒挂：{', '.join(reversed)}")
+    parts = [[] for _ in range(n_legal)]
+    for label in labels:
+        selected = types == label
+        pairs = pd.DataFrame({'key': legal_keys[selected], 'alias': aliases[selected]}).drop_duplicates()
+        for key, names in pairs.groupby('key', sort=False)['alias']:
+            parts[key].append(f"{label}：{', '.join(names)}")
     
-    return '\n'.join(result)
+    result = np.empty(n_legal, dtype=object)
+    result[:] = ['\n'.join(part) for part in parts]
+    return result
 
-def split_workbook_by_department(output_file, business_month):
+def split_workbook_by_department(output_file, business_month, line='海运', progress_callback=None):
     """
     将总工作簿按照二级部门和法人部门拆分成多个工作簿
+
+    line: 总表对应的业务大类名称，决定订阅原始数据sheet名称和拆分后的文件名
+    progress_callback: 每完成一个部门报告一次进度
+    返回拆分出的工作簿列表
     """
+    subscription_sheet = f"{line}订阅原始数据"
+
     # 读取原始工作簿中的所有sheet
     all_sheets = pd.read_excel(output_file, sheet_name=None)
     
@@ -553,39 +1068,47 @@ def split_workbook_by_department(output_file, business_month):
     # 获取唯一二级部门
     departments = customer_analysis['二级部门'].unique()
     
-    # 从海运订阅原始数据中获取二级部门和法人部门的对应关系
-    subscription_data = pd.read_excel(output_file, sheet_name='海运订阅原始数据')
-    dept_mapping = {
-        '内贸水运': '内贸',
-        '外贸水运': '外贸'
+    # 从订阅原始数据中获取二级部门和法人部门的对应关系
+    subscription_data = all_sheets[subscription_sheet]
+    
+    # 每个sheet只对部门列编码一次，按部门取行号，避免对每个部门重复比较字符串
+    empty_rows = np.array([], dtype=np.int64)
+    subscription_rows = department_rows(subscription_data['二级部门'])
+    customer_rows = department_rows(customer_analysis['二级部门'])
+    legal_rows = {
+        sheet_name: department_rows(all_sheets[sheet_name]['法人部门'])
+        for sheet_name in ['预对账原始数据', '分析结果'] if sheet_name in all_sheets
     }
     
     # 获取输出文件的目录
     output_dir = os.path.dirname(output_file)
     
     # 为每个部门创建新的工作簿
-    for dept in departments:
+    dept_files = []
+    for dept_index, dept in enumerate(departments):
+        if progress_callback:
+            progress_callback(dept_index, len(departments), '个部门')
         # 获取对应的法人部门
-        legal_dept = dept_mapping.get(dept, dept)
+        legal_dept = DEPT_MAPPING.get(dept, dept)
         
         # 创建新的文件名，使用与总表相同的基础名称，并保持在相同目录
-        dept_file = os.path.join(output_dir, f"分析结果_{dept}_{business_month}.xlsx")
+        dept_file = os.path.join(output_dir, f"{report_prefix(line)}{dept}_{business_month}.xlsx")
         
         try:
             with pd.ExcelWriter(dept_file, engine='openpyxl') as writer:
                 # 标记是否有任何数据被写入
                 has_data = False
                 
-                # 处理海运订阅原始数据（按二级部门拆分）
-                dept_subscription = subscription_data[subscription_data['二级部门'] == dept]
+                # 处理订阅原始数据（按二级部门拆分）
+                dept_subscription = subscription_data.iloc[subscription_rows.get(dept, empty_rows)]
                 if not dept_subscription.empty:
-                    dept_subscription.to_excel(writer, sheet_name='海运订阅原始数据', index=False)
+                    dept_subscription.to_excel(writer, sheet_name=subscription_sheet, index=False)
                     has_data = True
                 
                 # 处理预对账原始数据（按法人部门拆分）
                 if '预对账原始数据' in all_sheets:
                     precheck_data = all_sheets['预对账原始数据']
-                    dept_precheck = precheck_data[precheck_data['法人部门'] == legal_dept]
+                    dept_precheck = precheck_data.iloc[legal_rows['预对账原始数据'].get(legal_dept, empty_rows)]
                     if not dept_precheck.empty:
                         dept_precheck.to_excel(writer, sheet_name='预对账原始数据', index=False)
                         has_data = True
@@ -593,7 +1116,7 @@ def split_workbook_by_department(output_file, business_month):
                 # 处理分析结果（按法人部门拆分）
                 if '分析结果' in all_sheets:
                     analysis_data = all_sheets['分析结果']
-                    dept_analysis = analysis_data[analysis_data['法人部门'] == legal_dept]
+                    dept_analysis = analysis_data.iloc[legal_rows['分析结果'].get(legal_dept, empty_rows)]
                     if not dept_analysis.empty:
                         dept_analysis.to_excel(writer, sheet_name='分析结果', index=False)
                         has_data = True
@@ -629,22 +1152,14 @@ def split_workbook_by_department(output_file, business_month):
                                 row[10].number_format = '0.00%'
                 
                 # 处理客户公司分析（按二级部门拆分）
-                dept_customer = customer_analysis[customer_analysis['二级部门'] == dept]
+                dept_customer = customer_analysis.iloc[customer_rows.get(dept, empty_rows)]
                 if not dept_customer.empty:
                     # 创建客户公司分析sheet
                     writer.book.create_sheet('客户公司分析')
                     analysis_sheet = writer.sheets['客户公司分析']
                     
-                    # 添加表头
-                    headers = [
-                        ['二级部门', '委托客户', '约价', '约价', '非约价', '非约价', '总票数', '总利润率', '初步分析', '业务部门反馈具体原因', 
-                         '原因类别', '损调利润', '计划采取的措施', '是否完成价格备案表', '是否联合磋商', '督办任务', 
-                         '责任人', '督办时间点'],
-                        ['', '', '负毛利票数', '毛利率', '低负票数', '毛利率', '', '', '', '', '', '', '', '', '', '', '', '']
-                    ]
-                    
                     # 设置表头样式
-                    for row_index, row in enumerate(headers, start=1):
+                    for row_index, row in enumerate(ANALYSIS_HEADERS, start=1):
                         for col_index, value in enumerate(row, start=1):
                             cell = analysis_sheet.cell(row=row_index, column=col_index, value=value)
                             cell.font = Font(bold=True, size=9)
@@ -656,28 +1171,8 @@ def split_workbook_by_department(output_file, business_month):
                                 bottom=Side(style='thin')
                             )
                     
-                    # 合并单元格
-                    merge_ranges = [
-                        'A1:A2',  # 二级部门
-                        'B1:B2',  # 委托客户
-                        'C1:D1',  # 约价
-                        'E1:F1',  # 非约价
-                        'G1:G2',  # 总票数
-                        'H1:H2',  # 总利润率
-                        'I1:I2',  # 初步分析
-                        'J1:J2',  # 业务部门反馈具体原因
-                        'K1:K2',  # 原因类别
-                        'L1:L2',  # 损调利润
-                        'M1:M2',  # 计划采取的措施
-                        'N1:N2',  # 是否完成价格备案表
-                        'O1:O2',  # 是否联合磋商
-                        'P1:P2',  # 督办任务
-                        'Q1:Q2',  # 责任人
-                        'R1:R2',  # 督办时间点
-                    ]
-                    
                     # 执行单元格合并
-                    for cell_range in merge_ranges:
+                    for cell_range in ANALYSIS_MERGE_RANGES:
                         analysis_sheet.merge_cells(cell_range)
                     
                     # 设置表头行高
@@ -698,7 +1193,8 @@ def split_workbook_by_department(output_file, business_month):
                                 (6, row['非约价.毛利率'], 'center'),
                                 (7, row['总票数'], 'center'),
                                 (8, row['总利润率'], 'center'),
-                                (9, row['初步分析'], 'left'),
+                                (9, row['总利润率环比'], 'center'),
+                                (10, row['初步分析'], 'left'),
                             ]
                             
                             for col, value, align in cells:
@@ -713,12 +1209,12 @@ def split_workbook_by_department(output_file, business_month):
                                 )
                                 
                                 # 设置百分比格式
-                                if col in [4, 6, 8]:  # 毛利率列
+                                if col in [4, 6, 8, 9]:  # 毛利率列
                                     if pd.notna(value):  # 只对非空值设置格式
                                         cell.number_format = '0.00%'
                             
                             # 添加空白列
-                            for col in range(10, 19):
+                            for col in range(len(cells) + 1, len(ANALYSIS_HEADERS[0]) + 1):
                                 cell = analysis_sheet.cell(row=start_row, column=col, value='')
                                 cell.font = Font(size=9)
                                 cell.alignment = Alignment(horizontal='center', vertical='center')
@@ -737,13 +1233,7 @@ def split_workbook_by_department(output_file, business_month):
                     has_data = True
                     
                     # 设置列宽
-                    column_widths = {
-                        'A': 15, 'B': 30, 'C': 12, 'D': 10, 'E': 12,
-                        'F': 10, 'G': 10, 'H': 10, 'I': 40, 'J': 40,
-                        'K': 15, 'L': 12, 'M': 40, 'N': 15, 'O': 15,
-                        'P': 15, 'Q': 10, 'R': 15
-                    }
-                    for col, width in column_widths.items():
+                    for col, width in ANALYSIS_COLUMN_WIDTHS.items():
                         analysis_sheet.column_dimensions[col].width = width
                     
                     # 设置冻结窗格
@@ -752,11 +1242,169 @@ def split_workbook_by_department(output_file, business_month):
                 # 如果没有任何数据被写入，创建一个空的sheet以满足Excel要求
                 if not has_data:
                     pd.DataFrame().to_excel(writer, sheet_name='Sheet1', index=False)
+            dept_files.append(dept_file)
                 
         except Exception as e:
             print(f"处理部门 {dept} 时出错: {str(e)}")
             continue
 
+    if progress_callback:
+        progress_callback(len(departments), len(departments), '个部门')
+    return dept_files
+
+def write_reports_streaming(output_dir, business_month, business_lines, subscription_file, input_files,
+                            display_df, full_analysis, compress_level=6, status_callback=None,
+                            progress_callback=None, precheck_keep=None):
+    """
+    流式生成各业务大类的总表和部门工作簿，用于数据量超出内存预算时
+
+    原始数据不读入内存：订阅文件和预对账文件各逐行读取一遍，每一行直接写入所属总表和部门工作簿的
+    临时 sheet；分析结果和客户公司分析来自内存中的计算结果。生成的文件名、sheet 和内容与
+    analyze_excel_data / split_workbook_by_department 相同，拆分时也不需要重新读入总表
+
+    subscription_file: 订阅文件路径，或已读入的 DataFrame（如抽样预览的样本）
+    input_files: 预对账文件（或 DataFrame）列表，多个文件的原始数据按顺序写入同一个 sheet，列为各文件列的并集
+    display_df: 分析结果sheet的数据，没有预对账文件时为 None
+    precheck_keep: 每个预对账文件需要写出的行（布尔数组，去重时得到），None 表示全部写出
+    返回生成的文件列表
+    """
+    has_precheck = display_df is not None
+    filter_lines = len(business_lines) > 1
+
+    # 每个业务大类的总表，以及每个 (业务大类, 二级部门) 的部门工作簿，各自由若干 sheet 组成
+    summary = {}
+    departments = {}
+    for line in business_lines:
+        line_analysis = full_analysis[full_analysis['业务大类名称'] == line]
+        departments[line] = {dept: {} for dept in line_analysis['二级部门'].unique()}
+        summary[line] = {'客户公司分析': line_analysis}
+
+    try:
+        # 订阅原始数据：总表按业务大类，部门工作簿再按二级部门
+        if status_callback:
+            status_callback("复制订阅原始数据...")
+        rows = _source_rows(subscription_file, progress_callback)
+        columns = header_names(next(rows, ()))
+        line_index = columns.index('业务大类名称')
+        dept_index = columns.index('二级部门')
+        for line in business_lines:
+            sheet_name = f"{line}订阅原始数据"
+            summary[line]['subscription'] = xlsx_writer.StreamingSheet(
+                sheet_name, columns, fixed_widths={'B': 9} if has_precheck else None,
+                max_auto_width=40 if has_precheck else None)
+            for sheets in departments[line].values():
+                sheets['subscription'] = xlsx_writer.StreamingSheet(sheet_name, columns, freeze_panes=None)
+        for row in rows:
+            row_line = row[line_index] if len(row) > line_index else None
+            row_dept = row[dept_index] if len(row) > dept_index else None
+            for line in business_lines:
+                if filter_lines and row_line != line:
+                    continue
+                summary[line]['subscription'].append(row)
+                if row_dept in departments[line]:
+                    departments[line][row_dept]['subscription'].append(row)
+
+        if has_precheck:
+            # 预对账原始数据没有业务大类，每个总表都包含全部数据，部门工作簿按法人部门拆分
+            if status_callback:
+                status_callback("复制预对账原始数据...")
+            sources = [_source_rows(path, progress_callback) for path in input_files]
+            headers = [header_names(next(rows, ())) for rows in sources]
+            # 与 pd.concat 一致，列按第一次出现的顺序合并
+            columns = list(dict.fromkeys(name for header in headers for name in header))
+            legal_index = columns.index('法人部门')
+            legal_targets = {}
+            for line in business_lines:
+                summary[line]['precheck'] = xlsx_writer.StreamingSheet('预对账原始数据', columns, max_auto_width=40)
+                for dept, sheets in departments[line].items():
+                    sheets['precheck'] = xlsx_writer.StreamingSheet('预对账原始数据', columns, freeze_panes=None)
+                    legal_targets.setdefault(DEPT_MAPPING.get(dept, dept), []).append(sheets['precheck'])
+            for rows, header, keep in zip(sources, headers, precheck_keep or [None] * len(sources)):
+                # 列与合并后的列不同时按列名重新排列
+                positions = None if header == columns else [columns.index(name) for name in header]
+                for index, row in enumerate(rows):
+                    if keep is not None and not keep[index]:
+                        continue
+                    if positions is not None:
+                        values = [None] * len(columns)
+                        for position, value in zip(positions, row):
+                            values[position] = value
+                        row = values
+                    for line in business_lines:
+                        summary[line]['precheck'].append(row)
+                    legal_dept = row[legal_index] if len(row) > legal_index else None
+                    for sheet in legal_targets.get(legal_dept, ()):
+                        sheet.append(row)
+
+            # 分析结果：同样按法人部门拆分
+            result_rows = department_rows(display_df['法人部门'])
+            for line in business_lines:
+                summary[line]['result'] = xlsx_writer.StreamingSheet(
+                    '分析结果', display_df.columns, fixed_widths={'A': 17, 'I': 8}, max_auto_width=30,
+                    percent_column=10)
+                summary[line]['result'].append_frame(display_df)
+                for dept, sheets in departments[line].items():
+                    dept_rows = result_rows.get(DEPT_MAPPING.get(dept, dept))
+                    if dept_rows is not None:
+                        sheets['result'] = xlsx_writer.StreamingSheet(
+                            '分析结果', display_df.columns, freeze_panes=None, fixed_widths={'A': 17},
+                            max_auto_width=30, percent_column=10)
+                        sheets['result'].append_frame(display_df.iloc[dept_rows])
+
+        if status_callback:
+            status_callback("写出总表和部门工作簿...")
+        output_files = []
+        n_files = sum(len(departments[line]) + 1 for line in business_lines)
+        for line in business_lines:
+            if progress_callback:
+                progress_callback(len(output_files), n_files, '个文件')
+            line_output_file = os.path.join(output_dir, f"{report_prefix(line)}总表_{business_month}.xlsx")
+            sheets = [summary[line]['subscription']]
+            if has_precheck:
+                sheets.extend([summary[line]['precheck'], summary[line]['result']])
+            sheets.append(_analysis_sheet(summary[line]['客户公司分析']))
+            xlsx_writer.write_workbook_streaming(line_output_file, sheets, compress_level=compress_level)
+            print(f"分析完成，结果已保存到 {line_output_file}")
+            output_files.append(line_output_file)
+
+            line_analysis = summary[line]['客户公司分析']
+            customer_rows = department_rows(line_analysis['二级部门'])
+            for dept, dept_sheets in departments[line].items():
+                dept_file = os.path.join(output_dir, f"{report_prefix(line)}{dept}_{business_month}.xlsx")
+                # 与拆分总表时一样，没有数据的 sheet 不写出
+                sheets = [dept_sheets[name] for name in ('subscription', 'precheck', 'result')
+                          if name in dept_sheets and dept_sheets[name].rows]
+                sheets.append(_analysis_sheet(line_analysis.iloc[customer_rows[dept]]))
+                try:
+                    xlsx_writer.write_workbook_streaming(dept_file, sheets, compress_level=compress_level)
+                    output_files.append(dept_file)
+                except Exception as e:
+                    print(f"处理部门 {dept} 时出错: {str(e)}")
+                if progress_callback:
+                    progress_callback(len(output_files), n_files, '个文件')
+        return output_files
+    finally:
+        # 出错时也要删除临时文件
+        for line in summary:
+            for sheet in summary[line].values():
+                if isinstance(sheet, xlsx_writer.StreamingSheet):
+                    sheet.close()
+            for sheets in departments[line].values():
+                for sheet in sheets.values():
+                    sheet.close()
+
+def _source_rows(source, progress_callback=None):
+    """原始数据的逐行来源，首行为列名：文件逐行读取，已读入的 DataFrame 直接按行输出"""
+    if isinstance(source, pd.DataFrame):
+        return itertools.chain([tuple(source.columns)], source.itertuples(index=False, name=None))
+    return iter_sheet_rows(source, progress_callback)
+
+def _analysis_sheet(analysis):
+    """客户公司分析sheet的描述，与 openpyxl 写出的格式一致"""
+    return xlsx_writer.report_sheet('客户公司分析', ANALYSIS_HEADERS, analysis, ANALYSIS_DATA_COLUMNS,
+                                    ANALYSIS_MERGE_RANGES, ANALYSIS_COLUMN_WIDTHS,
+                                    blank_columns=len(ANALYSIS_HEADERS[0]) - len(ANALYSIS_DATA_COLUMNS))
+
 if __name__ == "__main__":
     from gui import run_gui
     input_file, output_file, subscription_file = run_gui()
@@ -0,0 +1,167 @@
+import importlib.util
+import os
+import shutil
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+# 各数据集的固定字段和类型，下游读取时不需要再推断
+SUBSCRIPTION_SCHEMA = [
+    ('业务月度', 'string'),
+    ('业务大类名称', 'string'),
+    ('二级部门', 'string'),
+    ('委托客户', 'string'),
+    ('约价未税人民币总毛利', 'float64'),
+    ('约价未税人民币总收入', 'float64'),
+    ('约价负毛利票数', 'int64'),
+    ('非约价未税人民币总毛利', 'float64'),
+    ('非约价未税人民币总收入', 'float64'),
+    ('非约价低负票数', 'int64'),
+    ('约价毛利率', 'float64'),
+    ('非约价毛利率', 'float64'),
+    ('总利润率', 'float64'),
+    ('总票数', 'int64'),
+]
+
+LINE_ITEM_SCHEMA = [
+    ('业务月度', 'string'),
+    ('法人部门', 'string'),
+    ('委托客户', 'string'),
+    ('费率单号', 'string'),
+    ('别名', 'string'),
+    ('币种', 'string'),
+    ('应收金额', 'float64'),
+    ('应付金额', 'float64'),
+    ('费目利润', 'float64'),
+    ('类型', 'string'),
+    ('单票毛利', 'float64'),
+    ('单票毛利率', 'float64'),
+]
+
+CUSTOMER_ANALYSIS_SCHEMA = SUBSCRIPTION_SCHEMA + [
+    ('法人部门', 'string'),
+    ('总金额', 'float64'),
+    ('初步分析', 'string'),
+    ('总利润率环比', 'float64'),
+]
+
+# 数据集名称 -> (字段定义, 分区字段)；订阅汇总和客户公司分析包含所有业务大类，按业务大类名称分区
+DATASETS = {
+    '订阅汇总': (SUBSCRIPTION_SCHEMA, ['业务月度', '业务大类名称', '二级部门']),
+    '费目明细': (LINE_ITEM_SCHEMA, ['业务月度', '法人部门']),
+    '客户公司分析': (CUSTOMER_ANALYSIS_SCHEMA, ['业务月度', '业务大类名称', '二级部门']),
+}
+# pyarrow 写出 hive 分区时空值使用的目录名
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+def _to_table(pa, frame, schema):
+    """按固定字段整理 DataFrame 并转换为 Arrow 表"""
+    arrays = []
+    fields = []
+    for name, kind in schema:
+        values = frame[name] if name in frame.columns else pd.Series([None] * len(frame), index=frame.index)
+        if kind == 'string':
+            values = [None if pd.isna(value) else str(value) for value in values]
+            fields.append(pa.field(name, pa.string()))
+        elif kind == 'int64':
+            # 票数列中 0 显示为空字符串，这里还原为 0
+            values = pd.to_numeric(values.replace('', 0), errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+            fields.append(pa.field(name, pa.int64()))
+        else:
+            values = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+            fields.append(pa.field(name, pa.float64()))
+        arrays.append(pa.array(values, type=fields[-1].type))
+    return pa.table(arrays, schema=pa.schema(fields))
+
+def pyarrow_available():
+    """是否安装了导出数据集需要的 pyarrow（只查找，不导入）"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+def _partition_dir(column, value):
+    """hive 分区的目录名，与 pyarrow 写出的相同"""
+    if value is None or pd.isna(value):
+        return f"{column}={NULL_PARTITION}"
+    return f"{column}={quote(str(value), safe='')}"
+
+def _remove_partitions(month_dir, lines):
+    """
+    删除本次重新写出的业务大类的分区；lines 为 None 时（不按业务大类分区的数据集）删除整个月份。
+    之前不按业务大类分区的旧目录（业务月度=.../二级部门=...）与新的目录结构不兼容，一起删除
+    """
+    if not os.path.isdir(month_dir):
+        return
+    if lines is None:
+        shutil.rmtree(month_dir)
+        return
+    targets = {_partition_dir('业务大类名称', line) for line in lines}
+    for entry in os.scandir(month_dir):
+        if entry.name not in targets and entry.name.startswith('业务大类名称='):
+            continue
+        if entry.is_dir():
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
+
+def export_columnar(output_dir, business_month, subscription_data, result_df, full_analysis, file_format='parquet',
+                    business_lines=None):
+    """
+    将计算结果按业务月度、业务大类和部门分区写成 Parquet / Arrow 数据集，供 BI 直接读取
+
+    目录结构为 {output_dir}/{数据集}/业务月度=.../业务大类名称=.../二级部门=.../part-0.parquet（pyarrow 写出的
+    hive 分区，分区值按 URI 编码，部门名称中的 /、= 等字符不会产生多余的目录层级；空值的目录为
+    __HIVE_DEFAULT_PARTITION__；分区字段不重复写入文件）。重复运行同一月份时只替换本次分析的业务大类
+    （business_lines，为 None 时取数据中出现的业务大类）的分区，其他业务大类的数据保留。
+    费目明细没有业务大类和二级部门，按法人部门分区，重复运行时整个月份目录会被替换。
+    'arrow' 格式写出不压缩的 Arrow IPC 文件，可直接内存映射。
+
+    result_df 为 None 时（没有预对账文件）不写出费目明细。返回写出的文件列表。
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise ImportError("导出 Parquet/Arrow 文件需要安装 pyarrow：pip install pyarrow")
+
+    if file_format not in ('parquet', 'arrow'):
+        raise ValueError(f"不支持的导出格式: {file_format}")
+    if file_format == 'arrow':
+        dataset_format = ds.IpcFileFormat()
+        write_options = dataset_format.make_write_options(compression=None)
+    else:
+        dataset_format = ds.ParquetFileFormat()
+        write_options = dataset_format.make_write_options()
+
+    frames = {
+        '订阅汇总': subscription_data,
+        '费目明细': result_df,
+        '客户公司分析': full_analysis,
+    }
+    written = []
+    for name, frame in frames.items():
+        if frame is None:
+            continue
+        schema, partition_columns = DATASETS[name]
+        dataset_dir = os.path.join(output_dir, name)
+        month_dir = os.path.join(dataset_dir, _partition_dir('业务月度', business_month))
+        if '业务大类名称' in partition_columns:
+            lines = list(business_lines) if business_lines is not None else []
+            if '业务大类名称' in frame.columns:
+                lines += [line for line in frame['业务大类名称'].unique() if line not in lines]
+            else:
+                lines.append(None)
+            _remove_partitions(month_dir, lines)
+        else:
+            _remove_partitions(month_dir, None)
+
+        frame = frame.assign(业务月度=business_month)
+        sort_columns = [column for column in partition_columns[1:] if column in frame.columns]
+        frame = frame.sort_values(sort_columns, kind='stable')
+        table = _to_table(pa, frame, schema)
+        partitioning = ds.partitioning(pa.schema([table.schema.field(column) for column in partition_columns]),
+                                       flavor='hive')
+        ds.write_dataset(table, dataset_dir, format=dataset_format, file_options=write_options,
+                         partitioning=partitioning, basename_template=f"part-{{i}}.{file_format}",
+                         existing_data_behavior='overwrite_or_ignore', use_threads=False,
+                         file_visitor=lambda written_file: written.append(os.path.normpath(written_file.path)))
+    return written
@@ -0,0 +1,151 @@
+import copy
+import json
+import os
+import sys
+
+# 配置文件名，放在程序（或打包后的 exe）所在目录
+CONFIG_FILE_NAME = 'config.json'
+
+# 默认配置，配置文件中只需要写出要修改的项
+DEFAULT_CONFIG = {
+    # 需要生成报表的业务大类名称，每个业务大类生成各自的总表和部门工作簿
+    'business_lines': ['海运'],
+    # 内存预算（MB），0 表示物理内存的一半；预计内存占用超出预算时自动改用流式处理。
+    # 预算包括主进程和并行读取、写出时的子进程（统计运行中的子进程需要 psutil）
+    'memory_budget_mb': 0,
+    # 处理方式：'auto' 按内存预算自动选择，'memory' 整表读入，'streaming' 分块读取、逐行写出
+    'processing_mode': 'auto',
+    # 计算后端：'pandas' 在内存中汇总；'sqlite' 把输入分块写入磁盘上的临时 SQLite 数据库，
+    # 用带索引的 SQL 查询完成分组汇总，结果与 pandas 相同，适合数据量远超内存时（固定使用流式写出）
+    'compute_backend': 'pandas',
+    # 导出方式：'excel' 只生成 Excel 报表；'columnar' 只把计算结果写成按业务月度、业务大类和部门分区的数据集
+    # （输出目录下的“分析结果_数据集”，供 BI 直接读取）；'both' 两者都生成。导出数据集需要 pyarrow
+    'export_mode': 'excel',
+    # 数据集格式：'parquet'，或 'arrow'（不压缩的 Arrow IPC 文件，可直接内存映射）
+    'columnar_format': 'parquet',
+    # 内存处理时总表的写出方式：'openpyxl' 逐 sheet 写出；'parallel' 各 sheet 在独立子进程中生成并压缩后组装，
+    # 数据量大时更快，生成的内容相同
+    'writer_mode': 'openpyxl',
+    # 'parallel' 方式和流式处理写出 xlsx 时的压缩级别（0-9），越小写出越快、文件越大
+    'compress_level': 6,
+    # 历史数据库（SQLite），保存每月的客户汇总结果，用于计算环比；为空时不保存
+    'history_db': 'analysis_history.db',
+    # 抽样预览：按二级部门分层抽取一部分费率单（整单保留，订阅数据和预对账数据使用同一组费率单）运行完整流程，
+    # 用于调整规则或检查部门时快速查看结果；海运订阅文件没有费率单号列时按行抽样。
+    # 票数按抽样比例换算为全量估计值，金额和毛利率为样本中的数值，不保存到历史数据库
+    'preview': {
+        'sample_fraction': 0.1,
+        # 随机数种子，相同的种子和数据每次抽到相同的样本，便于对比调整前后的结果
+        'seed': 0,
+    },
+    # 同时分析多个预对账文件（如相互重叠的每周导出）时的去重列：后面文件中这些列都与之前文件某一行相同的行
+    # 视为重复导出的数据并去掉，按次数计算（之前有 1 行、后面有 2 行相同的，后面的保留 1 行），
+    # 同一文件内的相同行保留；为空列表时不去重
+    'precheck_dedup_columns': ['费率单号', '别名', '应收应付', '币种', '本位币金额'],
+    # 预对账与订阅数据的委托客户名称匹配：完全相同 -> 别名表 -> 规范化（全半角、空格、公司后缀，分公司除外）；
+    # 相似的名称只在匹配报告中给出建议，人工确认后才使用
+    'customer_matching': {
+        'enabled': True,
+        # 别名表（CSV），人工确认的对应关系写在这里；匹配报告中确认的建议用 main.py --accept-matches 导入
+        'alias_file': '客户别名表.csv',
+        # 相似度达到此值且数字/英文部分相同的在匹配报告中给出建议
+        'suggest_threshold': 0.6,
+    },
+    # 任务服务（main.py --server），通过本机 HTTP 接口提交分析任务
+    'server': {
+        'host': '127.0.0.1',
+        'port': 8765,
+        # 同时运行的分析任务数（进程池大小）
+        'workers': 2,
+        # 排队中的任务上限，超出时拒绝新任务
+        'max_queued_jobs': 20,
+        # 每个任务的输出文件保存在此目录下以任务编号命名的子目录中
+        'jobs_dir': 'jobs',
+        # 已结束任务的保留数量和天数，超出的任务及其输出目录会被删除；为 0 或空时不按该项清理
+        'keep_jobs': 100,
+        'keep_days': 7,
+    },
+    # 监视文件夹（main.py --watch），ERP 导出的文件出现后自动分析
+    'watch': {
+        # 监视的目录和报表输出目录，输出目录为空时使用监视目录下的“分析结果”
+        'directory': '',
+        'output_dir': '',
+        # 扫描间隔（秒）
+        'poll_seconds': 10,
+        # 文件大小和修改时间保持不变这么久才认为导出已完成（秒）
+        'stable_seconds': 30,
+        # 只有海运订阅文件时，等待同月预对账文件的时间（秒），超时后只用订阅文件分析
+        'pair_wait_seconds': 600,
+        # 同时运行的分析任务数
+        'workers': 1,
+        # 按文件名中的关键字区分两类文件
+        'subscription_keyword': '订阅',
+        'precheck_keyword': '预对账',
+        # 分析失败（如文件被 Excel 占用、内存不足）后的重试次数上限和第一次重试的等待时间（秒），之后每次加倍
+        'max_retries': 3,
+        'retry_seconds': 60,
+    },
+    # 分类规则，说明见 rules.py；列表整体替换，不与默认规则合并
+    'rules': {
+        # 订阅数据分类，约价负毛利和非约价低负对应报表中的约价/非约价两组列，
+        # 新增的分类在汇总结果中增加“{名称}票数”列
+        'subscription': [
+            {'name': '约价负毛利', 'all': [
+                {'column': '客户约价', 'op': 'not_in', 'value': [None, 'N']},
+                {'column': '是否低负', 'op': '==', 'value': '负毛利'},
+            ]},
+            {'name': '非约价低负', 'all': [
+                {'column': '客户约价', 'op': 'in', 'value': [None, 'N']},
+                {'column': '是否低负', 'op': 'in', 'value': ['低毛利', '负毛利']},
+            ]},
+        ],
+        # 费目类型，按顺序取第一条成立的规则，并按同样顺序写入初步分析；
+        # 可用的列：应收金额、应付金额、费目利润、单票毛利、单票毛利率
+        'line_items': [
+            {'name': '无应收', 'all': [
+                {'column': '应付金额', 'op': '>', 'value': 0},
+                {'column': '应收金额', 'op': '==', 'value': 0},
+            ]},
+            {'name': '倒挂', 'all': [
+                {'column': '应收金额', 'op': '<', 'other': '应付金额'},
+            ]},
+        ],
+    },
+}
+
+def get_app_dir():
+    """程序所在目录：打包后为 exe 所在目录，否则为源码目录"""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+def get_config_path():
+    """配置文件路径"""
+    return os.path.join(get_app_dir(), CONFIG_FILE_NAME)
+
+def resolve_path(path):
+    """配置中的相对路径以程序所在目录为基准"""
+    return path if os.path.isabs(path) else os.path.join(get_app_dir(), path)
+
+def _merge(base, override):
+    """把 override 合并到 base 中，字典逐层合并，其他类型直接替换"""
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+def load_config(path=None):
+    """
+    读取配置文件并与默认配置合并，配置文件不存在时使用默认配置
+    """
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    path = path or get_config_path()
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                _merge(config, json.load(f))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"配置文件格式错误 {path}: {str(e)}")
+    return config
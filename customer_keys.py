@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+# 二级部门与法人部门的对应关系，未列出的二级部门与法人部门同名
+DEPT_MAPPING = {
+    '内贸水运': '内贸',
+    '外贸水运': '外贸'
+}
+
+def _pack(high, low):
+    """把两个非负编号打包成一个 int64，缺失值（-1）保持为 -1"""
+    packed = (high.astype(np.int64) << 32) | low.astype(np.int64)
+    packed[(high < 0) | (low < 0)] = -1
+    return packed
+
+def _encode(values, index, valid=None):
+    """
+    用已有字典对 values 编码，字典中没有的值追加到末尾
+
+    返回 (编号数组, 扩展后的字典)，缺失值（或 valid 为 False 的行）编号为 -1
+    """
+    values = pd.Series(values).reset_index(drop=True)
+    if valid is None:
+        valid = values.notna().to_numpy()
+    codes = index.get_indexer(values)
+    codes[~valid] = -1
+    missing = (codes == -1) & valid
+    if missing.any():
+        index = index.append(pd.Index(pd.unique(values[missing])))
+        codes[missing] = index.get_indexer(values[missing])
+    return codes, index
+
+def dense_codes(*code_arrays):
+    """
+    把多个编号数组合并为一个连续的组合编号，任一分量缺失（-1）时结果为 -1
+
+    返回 (组合编号, 每个组合第一次出现的行号)
+    """
+    combined = np.zeros(len(code_arrays[0]), dtype=np.int64)
+    valid = np.ones(len(code_arrays[0]), dtype=bool)
+    for codes in code_arrays:
+        valid &= codes >= 0
+        # 每一步都重新压缩成连续编号，避免乘法溢出
+        combined, uniques = pd.factorize(combined * (codes.max(initial=0) + 1) + np.maximum(codes, 0))
+    result = np.full(len(combined), -1, dtype=np.int64)
+    result[valid], _ = pd.factorize(combined[valid])
+    first_rows = np.flatnonzero(valid)[np.unique(result[valid], return_index=True)[1]]
+    return result, first_rows
+
+# 金额以“分”为单位的整数保存，读入时换算一次，汇总和比较都在整数上完成，输出时再换算为元
+MONEY_SCALE = 100
+
+def to_minor_units(values):
+    """
+    金额（元）换算为以分为单位的整数数组，缺失值和无法识别的值按 0 计
+
+    每行金额都在 int32 范围内时使用 int32，否则使用 int64；汇总时统一按 int64 累加
+    """
+    amounts = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+    minor = np.nan_to_num(np.round(amounts * MONEY_SCALE))
+    limit = np.iinfo(np.int32).max
+    dtype = np.int32 if len(minor) == 0 or np.abs(minor).max() <= limit else np.int64
+    return minor.astype(dtype)
+
+def from_minor_units(minor):
+    """分换算为元，只在输出时使用"""
+    return np.asarray(minor, dtype=np.int64) / MONEY_SCALE
+
+def group_sum_minor(codes, minor, n_groups):
+    """按编号汇总以分为单位的金额，结果为精确的 int64，编号为 -1 的行不参与"""
+    valid = codes >= 0
+    sums = np.zeros(n_groups, dtype=np.int64)
+    np.add.at(sums, codes[valid], np.asarray(minor)[valid].astype(np.int64))
+    return sums
+
+def group_count(codes, n_groups, mask=None):
+    """按编号计数（相当于 groupby().size()），编号为 -1 的行不参与"""
+    valid = codes >= 0
+    if mask is not None:
+        valid &= mask
+    return np.bincount(codes[valid], minlength=n_groups)
+
+def sort_ranks(index):
+    """字典中每个值按文字排序后的名次，用于只对去重后的值排序"""
+    ranks = np.empty(len(index), dtype=np.int64)
+    ranks[np.argsort(index.astype(str), kind='stable')] = np.arange(len(index))
+    return ranks
+
+def department_rows(values):
+    """
+    一次性按部门把行号分组，代替对每个部门重复做字符串比较
+
+    返回 {部门: 行号数组}
+    """
+    codes, uniques = pd.factorize(pd.Series(values))
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return {uniques[i]: order[bounds[i]:bounds[i + 1]] for i in range(len(uniques))}
+
+class CustomerKeys:
+    """
+    委托客户组合键字典
+
+    在读入海运订阅数据时一次性建立：
+    - 客户键：(二级部门, 委托客户) -> 连续整数编号，编号顺序为第一次出现的顺序
+    - 法人客户键：(法人部门, 委托客户) -> 连续整数编号，二级部门按 dept_mapping 转换为法人部门
+
+    预对账数据通过 encode_legal 编码到同一个法人客户键空间，之后的汇总和合并都使用整数编号，
+    只在输出时通过 decode / decode_legal 还原为文字
+    """
+
+    def __init__(self, departments, customers, dept_mapping=None):
+        dept_mapping = DEPT_MAPPING if dept_mapping is None else dept_mapping
+
+        dept_codes, self.departments = pd.factorize(pd.Series(departments))
+        customer_codes, self.customers = pd.factorize(pd.Series(customers))
+        self.departments = pd.Index(self.departments)
+        self.customers = pd.Index(self.customers)
+
+        # 每一行对应的客户键
+        pairs = _pack(dept_codes, customer_codes)
+        self.codes = np.full(len(pairs), -1, dtype=np.int64)
+        valid = pairs >= 0
+        self.codes[valid], key_pairs = pd.factorize(pairs[valid])
+        self.key_department = (key_pairs >> 32).astype(np.int64)
+        self.key_customer = (key_pairs & 0xFFFFFFFF).astype(np.int64)
+
+        # 二级部门 -> 法人部门
+        legal_names = [dept_mapping.get(name, name) for name in self.departments]
+        department_to_legal, self.legal_departments = pd.factorize(pd.Series(legal_names, dtype=object))
+        self.legal_departments = pd.Index(self.legal_departments)
+
+        # 客户键 -> 法人客户键
+        legal_pairs = _pack(department_to_legal[self.key_department], self.key_customer)
+        self.key_legal, legal_uniques = pd.factorize(legal_pairs)
+        self._legal_pairs = pd.Index(legal_uniques)
+
+    @property
+    def n_keys(self):
+        return len(self.key_department)
+
+    @property
+    def n_legal_keys(self):
+        return len(self._legal_pairs)
+
+    def encode_legal(self, legal_departments, customers):
+        """
+        将预对账数据的 (法人部门, 委托客户) 编码为法人客户键，新出现的组合追加到字典中
+        """
+        dept_codes, self.legal_departments = _encode(legal_departments, self.legal_departments)
+        customer_codes, self.customers = _encode(customers, self.customers)
+        pairs = _pack(dept_codes, customer_codes)
+        codes, self._legal_pairs = _encode(pairs, self._legal_pairs, valid=pairs >= 0)
+        return codes
+
+    def decode(self, keys):
+        """客户键 -> (二级部门, 委托客户)"""
+        return pd.DataFrame({
+            '二级部门': self.departments[self.key_department[keys]],
+            '委托客户': self.customers[self.key_customer[keys]],
+        })
+
+    def decode_legal(self, legal_keys):
+        """法人客户键 -> (法人部门, 委托客户)"""
+        pairs = self._legal_pairs.to_numpy()[legal_keys]
+        return pd.DataFrame({
+            '法人部门': self.legal_departments[(pairs >> 32).astype(np.int64)],
+            '委托客户': self.customers[(pairs & 0xFFFFFFFF).astype(np.int64)],
+        })
+
+    def legal_department_of(self, keys):
+        """客户键 -> 法人部门名称"""
+        pairs = self._legal_pairs.to_numpy()[self.key_legal[keys]]
+        return self.legal_departments[(pairs >> 32).astype(np.int64)]
@@ -0,0 +1,303 @@
+import csv
+import os
+import re
+import sys
+import tempfile
+import unicodedata
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# 比较前去掉的公司名称后缀，较长的写在前面
+COMPANY_SUFFIXES = ('股份有限公司', '有限责任公司', '有限公司', '公司')
+# 分公司是独立的法人主体，名称以此结尾时不去掉后缀，不会与总公司规范化为同一名称
+BRANCH_SUFFIX = '分公司'
+# 规范化时去掉的空白和标点（全角字符先经 NFKC 转为半角）
+IGNORED_CHARS_RE = re.compile(r'[\s\.,·・\-_/\\]+')
+# 名称中的数字和英文部分，两个名称的这部分不同时不认为是同一客户（如 客户14 与 客户144）
+TOKEN_RE = re.compile(r'[0-9a-z]+')
+# 出现在过多名称中的 n-gram 不用于查找候选（如“物流”“国际”），只用于计算相似度
+STOP_GRAM_LIMIT = 500
+
+# 匹配方式，按报告中的排列顺序
+MATCH_METHODS = ('未匹配', '建议', '规范化', '别名表')
+# 匹配报告“确认”列中表示接受建议的值
+CONFIRMED_VALUES = ('是', 'y', 'yes', '√', '✓')
+
+def normalize_name(name):
+    """
+    客户名称规范化：全角转半角、统一大小写、去掉空白和标点、去掉公司后缀
+
+    如“ 客户Ａ（上海）有限公司 ”和“客户a(上海)”规范化后相同；分公司保留完整名称，
+    “客户A有限公司上海分公司”与“客户A有限公司”不同
+    """
+    text = unicodedata.normalize('NFKC', str(name)).lower()
+    text = IGNORED_CHARS_RE.sub('', text)
+    if text.endswith(BRANCH_SUFFIX):
+        return text
+    for suffix in COMPANY_SUFFIXES:
+        if text.endswith(suffix) and len(text) > len(suffix):
+            text = text[:-len(suffix)]
+            break
+    return text
+
+def ngrams(text, n=2):
+    """名称的字符 n-gram 集合，短于 n 的名称取整个名称"""
+    if len(text) < n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class NgramIndex:
+    """
+    字符 n-gram 倒排索引
+
+    查询时只比较与查询名称至少共享一个 n-gram 的名称，不需要两两比较全部名称；
+    相似度为 Dice 系数 2|A∩B| / (|A|+|B|)
+    """
+
+    def __init__(self, names, n=2):
+        self.n = n
+        self.names = list(names)
+        self.grams = [ngrams(name, n) for name in self.names]
+        self.postings = defaultdict(list)
+        for i, grams in enumerate(self.grams):
+            for gram in grams:
+                self.postings[gram].append(i)
+
+    def query(self, name, limit=2):
+        """返回相似度最高的 limit 个 [(下标, 相似度)]，按相似度从高到低排列"""
+        grams = ngrams(name, self.n)
+        postings = [self.postings[gram] for gram in grams if gram in self.postings]
+        selective = [posting for posting in postings if len(posting) <= STOP_GRAM_LIMIT]
+        shared = Counter()
+        for posting in selective or postings:
+            shared.update(posting)
+        scored = []
+        for i in shared:
+            common = len(grams & self.grams[i])
+            scored.append((i, 2 * common / (len(grams) + len(self.grams[i]))))
+        scored.sort(key=lambda item: -item[1])
+        return scored[:limit]
+
+@contextmanager
+def _file_lock(path):
+    """
+    进程间的文件锁（锁文件为 path.lock），任务服务和监视文件夹中的多个进程同时更新别名表时依次进行
+    """
+    with open(path + '.lock', 'a+b') as lock_file:
+        if sys.platform == 'win32':
+            import msvcrt
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试约 10 秒后仍未取得锁时报错，继续等待
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+class AliasTable:
+    """
+    客户别名表（CSV，可以用 Excel 编辑）：预对账中的 (法人部门, 委托客户) -> 订阅数据中的委托客户
+
+    只保存人工确认的对应关系：直接编辑此表，或在客户匹配报告的“确认”列中填“是”后用
+    main.py --accept-matches 导入。来源为“自动”的行是之前未经确认自动写入的，不使用，
+    确认无误后把来源改为“人工”即可。path 为空时只在本次运行中使用，不保存
+    """
+
+    COLUMNS = ['法人部门', '预对账委托客户', '订阅委托客户', '来源', '相似度']
+
+    def __init__(self, path=None):
+        self.path = path
+        self.aliases = {}
+        self._new_rows = []
+        for row in self._read_rows():
+            if row['来源'] != '自动':
+                self.aliases[(row['法人部门'], row['预对账委托客户'])] = row['订阅委托客户']
+
+    def _read_rows(self):
+        rows = []
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8-sig', newline='') as f:
+                for row in csv.DictReader(f):
+                    if row.get('法人部门') and row.get('预对账委托客户') and row.get('订阅委托客户'):
+                        rows.append({column: row.get(column) or '' for column in self.COLUMNS})
+        return rows
+
+    def get(self, department, name):
+        return self.aliases.get((department, name))
+
+    def add(self, department, name, target, source='人工', score=None):
+        """加入一条人工确认的对应关系，save 时写入别名表"""
+        self.aliases[(department, name)] = target
+        self._new_rows.append({'法人部门': department, '预对账委托客户': name, '订阅委托客户': target,
+                               '来源': source, '相似度': '' if score is None else f"{score:.2f}"})
+
+    def save(self):
+        """
+        把新加入的对应关系写入别名表
+
+        在文件锁内重新读取当前内容并合并，写到临时文件后整体替换，多个进程同时保存时不会丢失其他进程写入的行
+        """
+        if not self.path or not self._new_rows:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with _file_lock(self.path):
+            rows = {(row['法人部门'], row['预对账委托客户']): row for row in self._read_rows()}
+            for row in self._new_rows:
+                rows[(row['法人部门'], row['预对账委托客户'])] = row
+            fd, temp_path = tempfile.mkstemp(prefix='.alias_', suffix='.tmp', dir=directory)
+            try:
+                # 使用带 BOM 的 UTF-8，Excel 打开时中文不会乱码
+                with os.fdopen(fd, 'w', encoding='utf-8-sig', newline='') as f:
+                    writer = csv.DictWriter(f, fieldnames=self.COLUMNS)
+                    writer.writeheader()
+                    writer.writerows(rows.values())
+                os.replace(temp_path, self.path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        self._new_rows = []
+
+def accept_matches(report_file, alias_file):
+    """
+    把客户匹配报告中“确认”列填了“是”的建议导入别名表，返回导入的行数
+
+    订阅委托客户可以在报告中改为正确的名称后再确认
+    """
+    report = pd.read_excel(report_file, dtype=str)
+    missing = [column for column in ('法人部门', '预对账委托客户', '订阅委托客户', '确认') if column not in report]
+    if missing:
+        raise ValueError(f"客户匹配报告缺少以下列: {', '.join(missing)}")
+    confirmed = report['确认'].fillna('').str.strip().str.lower().isin(CONFIRMED_VALUES)
+    confirmed &= report[['法人部门', '预对账委托客户', '订阅委托客户']].notna().all(axis=1)
+    aliases = AliasTable(alias_file)
+    for _, row in report[confirmed].iterrows():
+        score = pd.to_numeric(row.get('相似度'), errors='coerce')
+        aliases.add(row['法人部门'], row['预对账委托客户'], row['订阅委托客户'], '人工确认',
+                    None if pd.isna(score) else float(score))
+    aliases.save()
+    return int(confirmed.sum())
+
+class CustomerMatcher:
+    """
+    把预对账数据中的 (法人部门, 委托客户) 对应到订阅数据中的委托客户
+
+    只处理去重后的名称，按以下顺序查找：完全相同 -> 别名表 -> 规范化后相同 -> n-gram 索引相似匹配。
+    相似匹配的结果不直接使用：相似度达到 suggest_threshold 且数字/英文部分相同的在报告中给出建议，
+    人工确认后写入别名表才生效。候选只在同一法人部门中查找。
+    status_callback: 匹配完成后调用 status_callback(文字) 报告匹配结果，与分析流程的其他阶段提示一致
+    """
+
+    def __init__(self, legal_departments, customers, aliases=None, suggest_threshold=0.6, status_callback=None):
+        self.aliases = aliases if aliases is not None else AliasTable()
+        self.suggest_threshold = suggest_threshold
+        self.status_callback = status_callback
+        self._known = set(zip(legal_departments, customers))
+
+        # 每个法人部门一个规范化名称字典和 n-gram 索引
+        names = defaultdict(list)
+        for department, customer in self._known:
+            names[department].append(customer)
+        self._normalized = {}
+        self._indexes = {}
+        for department, customers in names.items():
+            customers = sorted(customers, key=str)
+            normalized = [normalize_name(customer) for customer in customers]
+            lookup = defaultdict(list)
+            for customer, key in zip(customers, normalized):
+                lookup[key].append(customer)
+            self._normalized[department] = lookup
+            self._indexes[department] = (customers, NgramIndex(normalized))
+        self.report = None
+
+    def _match_one(self, department, name):
+        """返回 (匹配到的订阅委托客户或 None, 匹配方式, 建议的委托客户, 相似度)"""
+        alias = self.aliases.get(department, name)
+        if alias is not None:
+            return alias, '别名表', alias, 1.0
+        if department not in self._indexes:
+            return None, '未匹配', None, None
+
+        normalized = normalize_name(name)
+        candidates = self._normalized[department].get(normalized, [])
+        if len(candidates) == 1:
+            return candidates[0], '规范化', candidates[0], 1.0
+
+        customers, index = self._indexes[department]
+        best = index.query(normalized, limit=1)
+        if not best:
+            return None, '未匹配', None, None
+        best_index, score = best[0]
+        target = customers[best_index]
+        same_tokens = TOKEN_RE.findall(normalized) == TOKEN_RE.findall(index.names[best_index])
+        if score >= self.suggest_threshold and same_tokens:
+            return None, '建议', target, score
+        return None, '未匹配', None, None
+
+    def match(self, departments, customers, counts=None):
+        """
+        返回对应到订阅数据名称后的委托客户数组，未匹配的保持原名称
+
+        匹配结果（完全相同的除外）保存在 self.report 中，每个 (法人部门, 委托客户) 一行；
+        counts 为每行代表的记录数（输入已经部分汇总时），为 None 时每行按 1 条计
+        """
+        frame = pd.DataFrame({'法人部门': np.asarray(departments, dtype=object),
+                              '委托客户': np.asarray(customers, dtype=object)})
+        if counts is None:
+            pairs = frame.value_counts(sort=False, dropna=True)
+        else:
+            pairs = pd.Series(np.asarray(counts), index=pd.MultiIndex.from_frame(frame)).dropna()
+            pairs = pairs.groupby(level=[0, 1], sort=False).sum()
+
+        mapping = {}
+        rows = []
+        for (department, name), count in pairs.items():
+            if (department, name) in self._known:
+                continue
+            target, method, suggestion, score = self._match_one(department, name)
+            if target is not None and target != name:
+                mapping[(department, name)] = target
+            rows.append((department, name, method, suggestion, score, count))
+
+        columns = ['法人部门', '预对账委托客户', '匹配方式', '订阅委托客户', '相似度', '预对账记录数']
+        report = pd.DataFrame(rows, columns=columns)
+        # 人工确认建议时填“是”，再用 main.py --accept-matches 导入别名表
+        report['确认'] = ''
+        report['_order'] = report['匹配方式'].map(MATCH_METHODS.index)
+        self.report = report.sort_values(['_order', '法人部门', '预对账委托客户']).drop(columns='_order') \
+            .reset_index(drop=True)
+        matched = int((~report['匹配方式'].isin(['未匹配', '建议'])).sum())
+        summary = (f"客户名称匹配：{len(pairs)} 个预对账客户，{len(pairs) - len(rows)} 个完全相同，"
+                   f"{matched} 个通过别名表/规范化匹配，{len(rows) - matched} 个未匹配或待确认")
+        print(summary, flush=True)
+        if self.status_callback:
+            self.status_callback(summary)
+
+        if not mapping:
+            return frame['委托客户']
+        # 只对去重后的名称查表，再按行展开
+        keys = pd.MultiIndex.from_frame(frame[['法人部门', '委托客户']])
+        targets = pd.Series(list(mapping.values()), index=pd.MultiIndex.from_tuples(list(mapping)))
+        replaced = targets.reindex(keys).to_numpy()
+        return frame['委托客户'].where(pd.isna(replaced), replaced)
+
+    def unmatched_count(self):
+        if self.report is None:
+            return 0
+        return int(self.report['匹配方式'].isin(['未匹配', '建议']).sum())
@@ -0,0 +1,141 @@
+import math
+import zipfile
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# 分块读取时每块的行数
+CHUNK_ROWS = 50000
+# 每读取这么多行报告一次进度
+PROGRESS_ROWS = 1000
+# 可以读取的输入文件扩展名：xlsx 使用 openpyxl，.xls 使用 xlrd
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+
+def _xls_cell(value, cell_type, datemode):
+    """.xls 单元格值转换为与 pandas.read_excel（xlrd）相同的 Python 值"""
+    import xlrd
+    if cell_type == xlrd.XL_CELL_DATE:
+        try:
+            value = xlrd.xldate.xldate_as_datetime(value, datemode)
+        except OverflowError:
+            return value
+        # 日期部分为纪元当天的是时间
+        if value.timetuple()[0:3] == ((1904, 1, 1) if datemode else (1899, 12, 31)):
+            return value.time()
+        return value
+    if cell_type in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+        return None
+    if cell_type == xlrd.XL_CELL_BOOLEAN:
+        return bool(value)
+    if cell_type == xlrd.XL_CELL_NUMBER and math.isfinite(value) and int(value) == value:
+        return int(value)
+    # 空字符串与 pandas 一样视为空值
+    return value if value != '' else None
+
+def xls_rows(path):
+    """
+    逐行读取 .xls 文件（BIFF 格式，openpyxl 不支持）第一个 sheet 的单元格值
+
+    返回 (总行数, 行迭代器, 关闭函数)；xlrd 会把整个文件读入内存，.xls 最多 65536 行
+    """
+    import xlrd
+    book = xlrd.open_workbook(path, on_demand=True)
+    sheet = book.sheet_by_index(0)
+    rows = (tuple(_xls_cell(value, cell_type, book.datemode)
+                  for value, cell_type in zip(sheet.row_values(i), sheet.row_types(i)))
+            for i in range(sheet.nrows))
+    return sheet.nrows, rows, book.release_resources
+
+def excel_complete(path):
+    """
+    文件是否已经完整写出：xlsx 的压缩包目录写在文件末尾，能识别为压缩包即完整；
+    .xls 能被 xlrd 打开（读取到全部扇区）即完整
+    """
+    if zipfile.is_zipfile(path):
+        return True
+    import xlrd
+    try:
+        book = xlrd.open_workbook(path, on_demand=True)
+    except Exception:
+        return False
+    book.release_resources()
+    return True
+
+def _xlsx_rows(path):
+    """以只读方式逐行读取 xlsx 文件第一个 sheet 的单元格值，返回 (总行数, 行迭代器, 关闭函数)"""
+    workbook = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    sheet = workbook.worksheets[0]
+    total = sheet.max_row
+    # 部分程序生成的文件尺寸记录不准确，按实际内容读取
+    sheet.reset_dimensions()
+    return total, sheet.iter_rows(values_only=True), workbook.close
+
+def iter_sheet_rows(path, progress=None):
+    """
+    以只读方式逐行读取第一个 sheet 的单元格值，首行为表头；xlsx 使用 openpyxl，.xls 使用 xlrd
+
+    与 pandas.read_excel 一致，忽略末尾的空行；中间的空行输出为空元组
+    progress: 进度回调 progress(已读数据行数, 总数据行数, 单位)，总行数来自 sheet 的尺寸记录，没有时为 None
+    """
+    total, sheet_rows, close = (_xlsx_rows if zipfile.is_zipfile(path) else xls_rows)(path)
+    try:
+        total = total - 1 if total else None
+        pending_empty = 0
+        index = 0
+        for index, row in enumerate(sheet_rows):
+            if progress and index and index % PROGRESS_ROWS == 0:
+                progress(index, total, '行')
+            if all(value is None for value in row):
+                pending_empty += 1
+                continue
+            for _ in range(pending_empty):
+                yield ()
+            pending_empty = 0
+            yield row
+        if progress:
+            progress(index, total, '行')
+    finally:
+        close()
+
+def header_names(header):
+    """表头单元格转换为列名，空表头按 pandas 的方式命名为 Unnamed: n"""
+    return [f"Unnamed: {i}" if value is None else value for i, value in enumerate(header)]
+
+def iter_excel_chunks(path, columns=None, chunk_rows=CHUNK_ROWS, progress=None):
+    """
+    分块读取第一个 sheet，每读满 chunk_rows 行输出一个只包含 columns 中的列的小 DataFrame
+
+    columns 为 None 时保留全部列；文件中不存在的列会被忽略，由调用方检查必需列。
+    至少输出一个块（没有数据行时为只有表头的空 DataFrame）
+    """
+    rows = iter_sheet_rows(path, progress)
+    try:
+        names = header_names(next(rows, ()))
+        if columns is None:
+            selected = list(range(len(names)))
+        else:
+            selected = [i for i, name in enumerate(names) if name in columns]
+        selected_names = [names[i] for i in selected]
+
+        buffer = []
+        produced = False
+        for row in rows:
+            buffer.append(tuple(row[i] if i < len(row) else None for i in selected))
+            if len(buffer) >= chunk_rows:
+                yield pd.DataFrame.from_records(buffer, columns=selected_names).infer_objects()
+                produced = True
+                buffer = []
+        if buffer or not produced:
+            yield pd.DataFrame.from_records(buffer, columns=selected_names).infer_objects()
+    finally:
+        rows.close()
+
+def read_excel_chunked(path, columns=None, chunk_rows=CHUNK_ROWS, progress=None):
+    """
+    分块读取第一个 sheet，只保留 columns 中的列（为 None 时保留全部列）
+
+    每读满 chunk_rows 行转换为一个小 DataFrame，不需要的列不会进入内存；
+    文件中不存在的列会被忽略，由调用方检查必需列
+    """
+    chunks = list(iter_excel_chunks(path, columns, chunk_rows, progress))
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
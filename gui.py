@@ -1,15 +1,29 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 import analyze_data
+from result_preview import ResultPreview
+from progress import ProgressChannel, format_progress
+from input_inspection import inspect_input, format_inspection
+from config import load_config
+from preview_sample import preview_label
 import threading  # 导入 threading 模块
 import pandas as pd
 import time
+import os
+
+# 界面读取进度的间隔（毫秒），约每秒 10 次
+PROGRESS_INTERVAL_MS = 100
+
+# 任务服务状态的刷新间隔（毫秒）
+SERVER_STATUS_INTERVAL_MS = 1000
 
 class DataAnalysisGUI:
-    def __init__(self, master):
+    def __init__(self, master, server=None):
         self.master = master
+        # 与界面同时运行的任务服务（main.py --server），为 None 时不显示服务状态
+        self.server = server
         master.title("数据分析工具")
-        master.geometry("400x320")  # 稍微增加高度
+        master.geometry("400x495" if server else "400x470")  # 稍微增加高度
         
         # 添加运行标志和窗口关闭处理
         self.is_running = False
@@ -23,6 +37,12 @@ class DataAnalysisGUI:
         self.input_file = ""
         self.output_file = ""
         self.subscription_file = ""
+        self.full_analysis = None
+        self.preview = None
+        # 选择文件后的预检结果：{'subscription' / 'precheck': (文字, 是否有问题)}
+        self.inspection = {}
+        # 工作线程写入、界面定时读取的进度通道
+        self.progress = ProgressChannel()
 
         button_width = 20
         button_height = 1  # 减小按钮高度使其更符合 Mac 风格
@@ -116,6 +136,43 @@ class DataAnalysisGUI:
         )
         self.analyze_button.grid(row=3, column=0, pady=10, sticky="w")
 
+        # 查看结果按钮，分析结果计算完成后可用
+        self.preview_button = tk.Button(
+            button_frame,
+            text="查看结果",
+            command=self.show_results,
+            width=label_width,
+            height=button_height,
+            state='disabled',
+            **button_style
+        )
+        self.preview_button.grid(row=3, column=1, pady=10, padx=(10, 0), sticky="w")
+
+        # 抽样预览：只分析一部分费率单，快速查看调整规则后的结果
+        self.sample_fraction = load_config()['preview']['sample_fraction']
+        self.preview_var = tk.BooleanVar(value=False)
+        self.preview_check = tk.Checkbutton(
+            button_frame,
+            text=f"抽样预览（{preview_label(self.sample_fraction)} 的费率单，票数为估计值）",
+            variable=self.preview_var,
+            bg='#F0F0F0',
+            font=('Arial', 9)
+        )
+        self.preview_check.grid(row=4, column=0, columnspan=2, sticky="w")
+
+        # 输入文件预检结果：行数、业务月度和缺少的列
+        self.inspection_label = tk.Label(
+            button_frame,
+            text="",
+            fg="#666666",
+            bg='#F0F0F0',
+            font=('Arial', 9),
+            justify='left',
+            anchor='w',
+            wraplength=340
+        )
+        self.inspection_label.grid(row=5, column=0, columnspan=2, sticky="w")
+
         # 处理标志
         self.processing_done = threading.Event()
 
@@ -130,9 +187,57 @@ class DataAnalysisGUI:
         )
         self.status_label.pack(side='bottom', fill='x', padx=5, pady=(10, 5))  # 放在底部，左对齐
 
+        # 进度详情：已处理数量、速度和剩余时间
+        self.progress_detail = tk.Label(
+            main_frame,
+            text="",
+            fg="#666666",
+            bg='#F0F0F0',
+            font=('SF Pro Text', 9),
+            anchor='w'
+        )
+        self.progress_detail.pack(side='bottom', fill='x', padx=5)
+
+        # 进度条，总数未知的阶段显示为来回滚动
+        self.progress_bar = ttk.Progressbar(main_frame, orient='horizontal', mode='determinate', maximum=100)
+        self.progress_bar.pack(side='bottom', fill='x', padx=5, pady=(10, 0))
+        self.progress_bar_running = False
+
+        # 任务服务地址和各状态的任务数，关闭窗口时停止服务
+        if server is not None:
+            self.server_label = tk.Label(
+                main_frame,
+                text="",
+                fg="#666666",
+                bg='#F0F0F0',
+                font=('SF Pro Text', 9),
+                anchor='w'
+            )
+            self.server_label.pack(side='bottom', fill='x', padx=5, pady=(5, 0))
+            self._poll_server()
+
+    def _poll_server(self):
+        """定时刷新任务服务状态"""
+        if not self.master.winfo_exists():
+            return
+        from job_server import server_url
+        jobs = self.server.manager.metrics()['jobs']
+        self.server_label.config(
+            text=f"任务服务 {server_url(self.server)}  运行中 {jobs.get('running', 0)}，"
+                 f"排队 {jobs.get('queued', 0)}，完成 {jobs.get('succeeded', 0)}，失败 {jobs.get('failed', 0)}")
+        self.master.after(SERVER_STATUS_INTERVAL_MS, self._poll_server)
+
+    def server_jobs_active(self):
+        """任务服务中排队和运行中的任务数"""
+        if self.server is None:
+            return 0
+        jobs = self.server.manager.metrics()['jobs']
+        return jobs.get('running', 0) + jobs.get('queued', 0)
+
     def select_input_file(self):
-        self.input_file = filedialog.askopenfilename(
-            title="选择预对账文件",
+        # 可以同时选择多个预对账文件（如每周导出），分析时合并并去掉重叠部分
+        paths = filedialog.askopenfilenames(
+            title="选择预对账文件（可多选）",
             filetypes=[
                 ("Excel 文件", "*.xlsx"),
                 ("旧版 Excel 文件", "*.xls"),
@@ -140,10 +245,14 @@ class DataAnalysisGUI:
             ],
             initialdir="~"
         )
+        paths = list(paths)
+        self.input_file = paths[0] if len(paths) == 1 else paths
         if self.input_file:
-            self.input_ok.config(text="✓ 已选择", fg="green")
+            self.input_ok.config(text=self._selected_text(), fg="green")
+            self._start_inspection(self.input_file, 'precheck')
         else:
             self.input_ok.config(text="未选择文件", fg="red")
+            self._show_inspection('precheck', None)
 
     def select_subscription_file(self):
         self.subscription_file = filedialog.askopenfilename(
@@ -157,8 +266,61 @@ class DataAnalysisGUI:
         )
         if self.subscription_file:
             self.subscription_ok.config(text="✓ 已选择", fg="green")
+            self._start_inspection(self.subscription_file, 'subscription')
         else:
             self.subscription_ok.config(text="未选择文件", fg="red")
+            self._show_inspection('subscription', None)
+
+    def _start_inspection(self, path, kind):
+        """在后台线程中预检所选文件（只读取表头和少量样本行），完成后在界面中显示"""
+        self._show_inspection(kind, ("正在检查...", False))
+
+        def _inspect():
+            try:
+                if isinstance(path, list):
+                    # 多个文件逐个预检，每个文件一行
+                    results = [format_inspection(inspect_input(item, kind)) for item in path]
+                    result = ('\n'.join(f"{os.path.basename(item)} {text}" for item, (text, _) in zip(path, results)),
+                              any(problem for _, problem in results))
+                else:
+                    result = format_inspection(inspect_input(path, kind))
+            except Exception as e:
+                result = (f"无法读取文件：{str(e)}", True)
+            self.master.after(0, lambda: self._finish_inspection(path, kind, result))
+
+        threading.Thread(target=_inspect, daemon=True).start()
+
+    def _finish_inspection(self, path, kind, result):
+        # 检查期间重新选择了文件时，丢弃旧文件的结果
+        current = self.subscription_file if kind == 'subscription' else self.input_file
+        if path != current:
+            return
+        label = self.subscription_ok if kind == 'subscription' else self.input_ok
+        if result[1]:
+            label.config(text="⚠ 请检查", fg="#CC6600")
+        else:
+            label.config(text="✓ 已选择" if kind == 'subscription' else self._selected_text(), fg="green")
+        self._show_inspection(kind, result)
+
+    def _selected_text(self):
+        """预对账文件的选择状态，多选时显示文件数"""
+        if isinstance(self.input_file, list):
+            return f"✓ 已选择 {len(self.input_file)} 个"
+        return "✓ 已选择"
+
+    def _show_inspection(self, kind, result):
+        if result is None:
+            self.inspection.pop(kind, None)
+        else:
+            self.inspection[kind] = result
+        lines = []
+        has_problem = False
+        for name, title in (('subscription', '订阅'), ('precheck', '预对账')):
+            if name in self.inspection:
+                text, problem = self.inspection[name]
+                lines.append(f"{title}：{text}")
+                has_problem = has_problem or problem
+        self.inspection_label.config(text='\n'.join(lines), fg="#CC6600" if has_problem else "#666666")
 
     def select_output_file(self):
         self.output_file = filedialog.asksaveasfilename(
@@ -176,12 +338,55 @@ class DataAnalysisGUI:
         else:
             self.output_ok.config(text="未选择文件", fg="red")
 
-    def _update_gui(self, text):
+    def _poll_progress(self):
         """
-        更新GUI显示的状态文本
+        按固定频率读取进度通道并更新状态文本和进度条，两次读取之间的多次进度更新只显示最新的一次，阶段文字依次显示
         """
-        self.status_label.config(text=text)
-        self.master.update()
+        if not self.master.winfo_exists():
+            return
+        state = self.progress.poll()
+        if state is not None:
+            self.status_label.config(text=state['text'])
+            self.progress_detail.config(text=format_progress(state))
+            if state['total']:
+                self._set_progress_bar_running(False)
+                self.progress_bar.config(value=min(state['done'] / state['total'], 1) * 100)
+            else:
+                self._set_progress_bar_running(True)
+        if self.is_running or state is not None:
+            self.master.after(PROGRESS_INTERVAL_MS, self._poll_progress)
+        else:
+            self._set_progress_bar_running(False)
+            self.progress_bar.config(value=0)
+            self.progress_detail.config(text="")
+
+    def _set_progress_bar_running(self, running):
+        """总数未知时进度条来回滚动，已知时显示百分比"""
+        if running == self.progress_bar_running:
+            return
+        self.progress_bar_running = running
+        if running:
+            self.progress_bar.config(mode='indeterminate')
+            self.progress_bar.start(20)
+        else:
+            self.progress_bar.stop()
+            self.progress_bar.config(mode='determinate', value=0)
+
+    def _set_results(self, full_analysis):
+        """
+        保存计算完成的客户公司分析结果并打开预览窗口
+        """
+        self.full_analysis = full_analysis
+        self.preview_button.config(state='normal')
+        self.show_results()
+
+    def show_results(self):
+        """打开（或刷新）客户公司分析预览窗口"""
+        if self.full_analysis is None:
+            return
+        if self.preview and self.preview.window.winfo_exists():
+            self.preview.window.destroy()
+        self.preview = ResultPreview(self.master, self.full_analysis)
 
     def _enable_button(self):
         """重新启用按钮"""
@@ -208,8 +413,15 @@ class DataAnalysisGUI:
             if not self.is_running:  # 检查是否应该继续运行
                 raise Exception("用户取消了操作")
             print(text, flush=True)
-            # 使用 after 方法在主线程中更新 GUI
-            self.master.after(0, lambda: self._update_gui(text))
+            # 只写入进度通道，由主线程定时读取，不在工作线程中操作界面
+            self.progress.status(text)
+
+        def report_progress(done, total=None, unit='行'):
+            if not self.is_running:
+                raise Exception("用户取消了操作")
+            self.progress.progress(done, total, unit)
+
+        sample_fraction = self.sample_fraction if self.preview_var.get() else None
 
         def _process_data():
             try:
@@ -220,15 +432,28 @@ class DataAnalysisGUI:
                     self.input_file, 
                     self.output_file, 
                     self.subscription_file,
-                    status_callback=update_progress
+                    status_callback=update_progress,
+                    progress_callback=report_progress,
+                    result_callback=lambda frame: self.master.after(0, lambda: self._set_results(frame)),
+                    sample_fraction=sample_fraction
                 )
                 
                 if self.is_running:
                     self.processing_time = time.time() - self.start_time  # 计算处理时间
                     print(f"处理完成，用时 {self.processing_time:.2f} 秒", flush=True)
-                    self.master.after(0, lambda: self.show_info("完成", "数据分析已完成！"))
+                    message = "抽样预览已完成，结果保存在输出目录下的“抽样预览”文件夹中。" if sample_fraction \
+                        else "数据分析已完成！"
+                    self.master.after(0, lambda: self.show_info("完成", message))
                     update_progress("准备就绪")
                 
+            except MemoryError:
+                if self.is_running:
+                    self.master.after(0, lambda: self.show_error(
+                        "内存不足",
+                        "处理过程中内存不足。\n请在 config.json 中调低 memory_budget_mb，"
+                        "或将 processing_mode 设置为 streaming 后重试。"))
+                    update_progress("处理出错：内存不足")
+                print("操作终止: 内存不足", flush=True)
             except Exception as e:
                 if str(e) != "用户取消了操作" and self.is_running:
                     self.master.after(0, lambda: self.show_error("错误", f"处理过程中出现错误：\n{str(e)}"))
@@ -243,6 +468,7 @@ class DataAnalysisGUI:
         thread = threading.Thread(target=_process_data)
         thread.daemon = True  # 设置为守护线程，这样主窗口关闭时线程会自动终止
         thread.start()
+        self.master.after(PROGRESS_INTERVAL_MS, self._poll_progress)
 
     def show_error(self, title, message):
         if self.master.winfo_exists():  # 检查窗口是否还存在
@@ -263,14 +489,22 @@ class DataAnalysisGUI:
             self.processing_done.set()  # 设置事件
         self.master.destroy()  # 关闭窗口
 
-def run_gui():
+def run_gui(server=None):
+    """
+    运行界面；server 为与界面同时运行的任务服务，界面中显示其状态，关闭窗口后由调用方停止服务
+    """
     root = tk.Tk()
-    gui = DataAnalysisGUI(root)
+    gui = DataAnalysisGUI(root, server)
     
     # 添加一个事件来跟踪处理是否完成
     gui.processing_done = threading.Event()
     
     def on_closing():
+        active = gui.server_jobs_active()
+        if active and not messagebox.askokcancel(
+                "任务服务", f"任务服务中还有 {active} 个任务未完成。\n关闭窗口将停止任务服务：排队中的任务取消，"
+                           "运行中的任务完成后退出。是否关闭？"):
+            return
         gui.is_running = False
         gui.processing_done.set()  # 设置事件
         root.destroy()
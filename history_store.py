@@ -0,0 +1,217 @@
+import re
+import sqlite3
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# 每月订阅汇总结果（process_subscription_file 的输出）
+SUBSCRIPTION_TABLE = 'subscription_aggregates'
+SUBSCRIPTION_FIELDS = [
+    ('约价未税人民币总毛利', 'REAL'),
+    ('约价未税人民币总收入', 'REAL'),
+    ('约价负毛利票数', 'INTEGER'),
+    ('非约价未税人民币总毛利', 'REAL'),
+    ('非约价未税人民币总收入', 'REAL'),
+    ('非约价低负票数', 'INTEGER'),
+    ('约价毛利率', 'REAL'),
+    ('非约价毛利率', 'REAL'),
+    ('总利润率', 'REAL'),
+    ('总票数', 'INTEGER'),
+]
+
+# 每月预对账汇总结果（客户公司分析中的总金额和初步分析）
+ANALYSIS_TABLE = 'customer_analysis'
+ANALYSIS_FIELDS = [
+    ('法人部门', 'TEXT'),
+    ('总金额', 'REAL'),
+    ('初步分析', 'TEXT'),
+]
+
+ANALYSIS_SCHEMA = f"""CREATE TABLE IF NOT EXISTS {ANALYSIS_TABLE} (
+    业务月度 TEXT NOT NULL,
+    二级部门 TEXT NOT NULL,
+    委托客户 TEXT NOT NULL,
+    业务大类名称 TEXT NOT NULL,
+    {', '.join(f'{name} {kind}' for name, kind in ANALYSIS_FIELDS)},
+    PRIMARY KEY (业务月度, 二级部门, 委托客户, 业务大类名称)
+)"""
+
+SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS {SUBSCRIPTION_TABLE} (
+        业务月度 TEXT NOT NULL,
+        二级部门 TEXT NOT NULL,
+        委托客户 TEXT NOT NULL,
+        业务大类名称 TEXT NOT NULL,
+        {', '.join(f'{name} {kind}' for name, kind in SUBSCRIPTION_FIELDS)},
+        PRIMARY KEY (业务月度, 二级部门, 委托客户, 业务大类名称)
+    )""",
+    # 环比查询按客户查找之前的月份
+    f"""CREATE INDEX IF NOT EXISTS {SUBSCRIPTION_TABLE}_customer
+        ON {SUBSCRIPTION_TABLE} (二级部门, 委托客户, 业务大类名称, 业务月度)""",
+    ANALYSIS_SCHEMA,
+]
+
+def normalize_month(value):
+    """
+    业务月度统一为 YYYY-MM，无法识别时返回 None
+
+    接受 2024-05、2024-5、2024/05、2024.05、202405、2024年5月和日期（如 2024-05-01 00:00:00）；
+    数据库中按文字比较月份先后，不同写法必须先统一，否则 '2024-5' 会排在 '2024-10' 之后
+    """
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, date):
+        return value.strftime('%Y-%m')
+    if isinstance(value, (int, np.integer)) or (isinstance(value, (float, np.floating)) and float(value).is_integer()):
+        value = str(int(value))
+    text = str(value).strip().replace('年', '-').replace('月', '')
+    if re.fullmatch(r'\d{6}', text):
+        text = f"{text[:4]}-{text[4:]}"
+    if not re.match(r'\d{4}\D', text):
+        return None
+    try:
+        return pd.to_datetime(text).strftime('%Y-%m')
+    except (ValueError, OverflowError):
+        return None
+
+def _month_key(business_month):
+    """保存和查询使用的月份，无法识别的月份不写入数据库"""
+    month = normalize_month(business_month)
+    if month is None:
+        raise ValueError(f"无法识别的业务月度: {business_month}")
+    return month
+
+def _to_records(frame, columns):
+    """转换为 sqlite3 可以直接写入的 Python 值，缺失值写为 NULL"""
+    values = frame[columns].astype(object).where(frame[columns].notna(), None)
+    return [
+        tuple(value.item() if isinstance(value, np.generic) else value for value in row)
+        for row in values.itertuples(index=False, name=None)
+    ]
+
+class HistoryStore:
+    """
+    历史月度汇总数据库（SQLite）
+
+    每次运行按 (业务月度, 二级部门, 委托客户, 业务大类名称) 保存订阅汇总和客户公司分析结果，
+    同一月份重复运行时只替换该月份中本次分析的业务大类的数据；环比通过索引直接查找客户之前月份的数据，不需要打开历史总表
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30)
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+        self._add_analysis_line_column()
+        self._normalize_stored_months()
+
+    def _add_analysis_line_column(self):
+        """
+        之前的客户公司分析表没有业务大类名称，主键为 (业务月度, 二级部门, 委托客户)：按新的表结构重建，
+        旧数据的业务大类取同一月份、同一客户的订阅汇总（之前只分析海运，没有时按海运）
+        """
+        columns = [row[1] for row in self.connection.execute(f"PRAGMA table_info({ANALYSIS_TABLE})")]
+        if '业务大类名称' in columns:
+            return
+        fields = ', '.join(name for name, _ in ANALYSIS_FIELDS)
+        with self.connection:
+            self.connection.execute(f"ALTER TABLE {ANALYSIS_TABLE} RENAME TO {ANALYSIS_TABLE}_old")
+            self.connection.execute(ANALYSIS_SCHEMA)
+            self.connection.execute(f"""
+                INSERT OR REPLACE INTO {ANALYSIS_TABLE} (业务月度, 二级部门, 委托客户, 业务大类名称, {fields})
+                SELECT a.业务月度, a.二级部门, a.委托客户,
+                       COALESCE((SELECT MIN(s.业务大类名称) FROM {SUBSCRIPTION_TABLE} s
+                                 WHERE s.业务月度 = a.业务月度 AND s.二级部门 = a.二级部门
+                                   AND s.委托客户 = a.委托客户), '海运'),
+                       {', '.join(f'a.{name}' for name, _ in ANALYSIS_FIELDS)}
+                FROM {ANALYSIS_TABLE}_old a""")
+            self.connection.execute(f"DROP TABLE {ANALYSIS_TABLE}_old")
+
+    def _normalize_stored_months(self):
+        """把之前按原始文字保存的月份（如 2024-5、2024-05-01 00:00:00）改为 YYYY-MM，同一月份的不同写法合并"""
+        with self.connection:
+            for table in (SUBSCRIPTION_TABLE, ANALYSIS_TABLE):
+                months = [row[0] for row in self.connection.execute(f"SELECT DISTINCT 业务月度 FROM {table}")]
+                for month in months:
+                    normalized = normalize_month(month)
+                    if normalized is not None and normalized != month:
+                        self.connection.execute(f"UPDATE OR REPLACE {table} SET 业务月度 = ? WHERE 业务月度 = ?",
+                                                [normalized, month])
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def save_month(self, business_month, full_analysis, business_lines):
+        """
+        保存本月结果，先删除本月份中这些业务大类的旧数据，在同一个事务中完成
+
+        full_analysis: 客户公司分析结果，包含订阅汇总列、业务大类名称和总金额、初步分析
+        """
+        business_month = _month_key(business_month)
+        frame = full_analysis.copy()
+        # 票数为 0 时显示为空字符串，保存时还原为 0
+        for name, kind in SUBSCRIPTION_FIELDS:
+            if kind == 'INTEGER':
+                frame[name] = pd.to_numeric(frame[name].replace('', 0), errors='coerce').fillna(0).astype(np.int64)
+        frame.insert(0, '业务月度', business_month)
+
+        subscription_columns = ['业务月度', '二级部门', '委托客户', '业务大类名称'] + [name for name, _ in SUBSCRIPTION_FIELDS]
+        analysis_columns = ['业务月度', '二级部门', '委托客户', '业务大类名称'] + [name for name, _ in ANALYSIS_FIELDS]
+        analysis = frame.drop_duplicates(subset=['二级部门', '委托客户', '业务大类名称'])
+
+        with self.connection:
+            placeholders = ', '.join('?' * len(business_lines))
+            self.connection.execute(
+                f"DELETE FROM {SUBSCRIPTION_TABLE} WHERE 业务月度 = ? AND 业务大类名称 IN ({placeholders})",
+                [business_month] + list(business_lines))
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {SUBSCRIPTION_TABLE} ({', '.join(subscription_columns)}) "
+                f"VALUES ({', '.join('?' * len(subscription_columns))})",
+                _to_records(frame, subscription_columns))
+            self.connection.execute(
+                f"DELETE FROM {ANALYSIS_TABLE} WHERE 业务月度 = ? AND 业务大类名称 IN ({placeholders})",
+                [business_month] + list(business_lines))
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {ANALYSIS_TABLE} ({', '.join(analysis_columns)}) "
+                f"VALUES ({', '.join('?' * len(analysis_columns))})",
+                _to_records(analysis, analysis_columns))
+
+    def previous_values(self, business_month, full_analysis, column='总利润率'):
+        """
+        查找每个客户在本月之前最近一个月份的数值，没有历史数据时为 NaN
+
+        返回与 full_analysis 行对应的数组
+        """
+        business_month = _month_key(business_month)
+        keys = full_analysis[['二级部门', '委托客户', '业务大类名称']]
+        with self.connection:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS current_keys (行号 INTEGER, 二级部门 TEXT, 委托客户 TEXT, 业务大类名称 TEXT)")
+            self.connection.execute("DELETE FROM current_keys")
+            self.connection.executemany(
+                "INSERT INTO current_keys VALUES (?, ?, ?, ?)",
+                [(i,) + row for i, row in enumerate(_to_records(keys, list(keys.columns)))])
+        rows = self.connection.execute(f"""
+            SELECT c.行号, h.{column}
+            FROM current_keys c
+            JOIN {SUBSCRIPTION_TABLE} h
+              ON h.二级部门 = c.二级部门 AND h.委托客户 = c.委托客户 AND h.业务大类名称 = c.业务大类名称
+             AND h.业务月度 = (
+                SELECT MAX(p.业务月度) FROM {SUBSCRIPTION_TABLE} p
+                WHERE p.二级部门 = c.二级部门 AND p.委托客户 = c.委托客户
+                  AND p.业务大类名称 = c.业务大类名称 AND p.业务月度 < ?)
+        """, [business_month]).fetchall()
+
+        result = np.full(len(full_analysis), np.nan)
+        for index, value in rows:
+            if value is not None:
+                result[index] = value
+        return result
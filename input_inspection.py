@@ -0,0 +1,275 @@
+import itertools
+import posixpath
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+
+from analyze_data import SUBSCRIPTION_COLUMNS, PRECHECK_COLUMNS
+from config import load_config
+from excel_stream import xls_rows
+from history_store import normalize_month
+from rules import compile_rules, rule_columns
+
+# 预检读取的数据行数
+SAMPLE_ROWS = 200
+# 每次送入 XML 解析器的字节数，较小的块使行数估算更准确
+FEED_BYTES = 4096
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+CELL_REF_RE = re.compile(r'([A-Z]+)(\d+)')
+# 内置的日期时间格式编号，27-36、50-58 是中文等东亚版本 Excel 的日期格式
+BUILTIN_DATE_FORMAT_IDS = set(range(14, 23)) | set(range(27, 37)) | set(range(45, 48)) | set(range(50, 59))
+
+def _tag(name):
+    return f'{{{MAIN_NS}}}{name}'
+
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+def _first_sheet_path(archive):
+    """第一个 sheet 在压缩包中的路径"""
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    sheet = workbook.find(f'{_tag("sheets")}/{_tag("sheet")}')
+    relation_id = sheet.get(f'{{{REL_NS}}}id')
+    relations = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for relation in relations.iter(f'{{{PACKAGE_REL_NS}}}Relationship'):
+        if relation.get('Id') == relation_id:
+            target = relation.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    raise ValueError("找不到工作表")
+
+def _date_epoch(archive):
+    """工作簿使用的日期系统：1904 日期系统（Mac 版 Excel）或默认的 1900 日期系统"""
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    properties = workbook.find(_tag('workbookPr'))
+    if properties is not None and properties.get('date1904') in ('1', 'true'):
+        return CALENDAR_MAC_1904
+    return CALENDAR_WINDOWS_1900
+
+def _date_styles(archive):
+    """数字格式为日期时间的单元格样式编号"""
+    if 'xl/styles.xml' not in archive.namelist():
+        return set()
+    styles = ET.fromstring(archive.read('xl/styles.xml'))
+    custom = {int(fmt.get('numFmtId')): fmt.get('formatCode', '') for fmt in styles.iter(_tag('numFmt'))}
+    cell_formats = styles.find(_tag('cellXfs'))
+    if cell_formats is None:
+        return set()
+    result = set()
+    for index, xf in enumerate(cell_formats.findall(_tag('xf'))):
+        format_id = int(xf.get('numFmtId', 0))
+        code = custom.get(format_id, BUILTIN_FORMATS.get(format_id))
+        if format_id in BUILTIN_DATE_FORMAT_IDS or (format_id in custom and is_date_format(code)):
+            result.add(index)
+    return result
+
+def _shared_strings(archive, needed):
+    """只读取共享字符串表中用到的条目，读到最大的编号即停止"""
+    if not needed or 'xl/sharedStrings.xml' not in archive.namelist():
+        return {}
+    last = max(needed)
+    strings = {}
+    index = 0
+    with archive.open('xl/sharedStrings.xml') as f:
+        for _, element in ET.iterparse(f, events=('end',)):
+            if element.tag != _tag('si'):
+                continue
+            if index in needed:
+                strings[index] = ''.join(text.text or '' for text in element.iter(_tag('t')))
+            element.clear()
+            if index >= last:
+                break
+            index += 1
+    return strings
+
+def _cell_value(cell, date_styles, epoch):
+    """返回 (值, 共享字符串编号)，共享字符串在读取完样本后统一解析；日期格式的数字转换为日期"""
+    kind = cell.get('t')
+    if kind == 'inlineStr':
+        return ''.join(text.text or '' for text in cell.iter(_tag('t'))), None
+    value = cell.find(_tag('v'))
+    if value is None or value.text is None:
+        return None, None
+    if kind == 's':
+        return None, int(value.text)
+    if kind in ('str', 'e'):
+        return value.text, None
+    if kind == 'b':
+        return value.text == '1', None
+    number = float(value.text)
+    if kind in (None, 'n') and int(cell.get('s', 0)) in date_styles:
+        try:
+            return from_excel(number, epoch), None
+        except (ValueError, OverflowError):
+            pass
+    return int(number) if number.is_integer() else number, None
+
+def _column_names(header):
+    return [f"Unnamed: {i}" if value is None else str(value) for i, value in enumerate(header)]
+
+def read_sample(path, sample_rows=SAMPLE_ROWS):
+    """
+    直接解析 xlsx 中第一个 sheet 的 XML，只读取表头和前 sample_rows 行，不加载整个共享字符串表
+
+    返回 {'columns': 列名, 'rows': 样本行, 'total_rows': 数据行数, 'estimated': 行数是否为估算值}；
+    行数优先使用 sheet 的尺寸记录，没有时按已解析的字节数比例估算
+    """
+    with zipfile.ZipFile(path) as archive:
+        sheet_path = _first_sheet_path(archive)
+        epoch = _date_epoch(archive)
+        date_styles = _date_styles(archive)
+        xml_size = archive.getinfo(sheet_path).file_size
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        dimension_rows = None
+        rows = []
+        fed = 0
+        done = False
+        with archive.open(sheet_path) as f:
+            while not done:
+                block = f.read(FEED_BYTES)
+                if not block:
+                    break
+                fed += len(block)
+                parser.feed(block)
+                for event, element in parser.read_events():
+                    if event == 'start' and element.tag == _tag('dimension'):
+                        refs = CELL_REF_RE.findall(element.get('ref', ''))
+                        if refs:
+                            dimension_rows = int(refs[-1][1])
+                    elif event == 'end' and element.tag == _tag('row'):
+                        cells = {}
+                        for position, cell in enumerate(element.iter(_tag('c'))):
+                            ref = CELL_REF_RE.match(cell.get('r', ''))
+                            cells[_column_index(ref.group(1)) if ref else position] = _cell_value(cell, date_styles, epoch)
+                        rows.append(cells)
+                        element.clear()
+                        if len(rows) > sample_rows:
+                            done = True
+                            break
+
+        needed = {index for cells in rows for _, index in cells.values() if index is not None}
+        strings = _shared_strings(archive, needed)
+
+    width = max((max(cells) + 1 for cells in rows if cells), default=0)
+    table = []
+    for cells in rows:
+        values = [None] * width
+        for column, (value, index) in cells.items():
+            values[column] = strings.get(index) if index is not None else value
+        table.append(values)
+
+    header = table[0] if table else []
+    columns = _column_names(header)
+    data = table[1:]
+    if not done:
+        # 整个 sheet 都已读完，行数是准确的
+        total_rows, estimated = len(data), False
+    elif dimension_rows and dimension_rows > 1:
+        total_rows, estimated = dimension_rows - 1, False
+    else:
+        total_rows, estimated = int(len(rows) * xml_size / fed) - 1, True
+    return {'columns': columns, 'rows': data, 'total_rows': total_rows, 'estimated': estimated}
+
+def read_sample_xls(path, sample_rows=SAMPLE_ROWS):
+    """
+    读取 .xls 文件第一个 sheet 的表头和前 sample_rows 行，返回值与 read_sample 相同
+
+    xlrd 会把整个文件读入内存（.xls 最多 65536 行），行数来自 sheet 的尺寸记录，是准确的
+    """
+    total, sheet_rows, close = xls_rows(path)
+    try:
+        table = [list(row) for row in itertools.islice(sheet_rows, sample_rows + 1)]
+    finally:
+        close()
+    header = table[0] if table else []
+    return {'columns': _column_names(header), 'rows': table[1:], 'total_rows': max(total - 1, 0),
+            'estimated': False}
+
+def _first_value(sample, column):
+    if column not in sample['columns']:
+        return None
+    index = sample['columns'].index(column)
+    for row in sample['rows']:
+        if index < len(row) and row[index] is not None:
+            return row[index]
+    return None
+
+def _distinct_values(sample, column):
+    if column not in sample['columns']:
+        return []
+    index = sample['columns'].index(column)
+    values = []
+    for row in sample['rows']:
+        if index < len(row) and row[index] is not None and row[index] not in values:
+            values.append(row[index])
+    return values
+
+def inspect_input(path, kind, config=None):
+    """
+    快速预检输入文件
+
+    kind: 'subscription'（海运订阅文件）或 'precheck'（预对账文件）
+    返回 {'columns', 'total_rows', 'estimated', 'missing'（缺少的必需列）, 'business_month',
+          'business_lines'（样本中的业务大类）, 'warnings', 'seconds'}
+    """
+    start = time.perf_counter()
+    config = config or load_config()
+    result = {'columns': [], 'total_rows': None, 'estimated': False, 'missing': [], 'business_month': None,
+              'business_lines': [], 'warnings': [], 'seconds': 0}
+    if zipfile.is_zipfile(path):
+        sample = read_sample(path)
+    else:
+        # 不是 xlsx 的按 .xls 读取，与分析时相同
+        try:
+            sample = read_sample_xls(path)
+        except Exception as e:
+            result['warnings'].append(f"不是 xlsx 或 xls 格式，无法读取: {str(e)}")
+            return result
+    result.update(columns=sample['columns'], total_rows=sample['total_rows'], estimated=sample['estimated'])
+    if kind == 'subscription':
+        required = list(SUBSCRIPTION_COLUMNS)
+        extra = rule_columns(compile_rules(config['rules']['subscription'])) - set(required)
+        required += sorted(extra)
+    else:
+        required = PRECHECK_COLUMNS
+    result['missing'] = [column for column in required if column not in sample['columns']]
+
+    if kind == 'subscription':
+        month = _first_value(sample, '业务月度')
+        if month is not None:
+            result['business_month'] = normalize_month(month) or str(month)
+        result['business_lines'] = _distinct_values(sample, '业务大类名称')
+        if '业务大类名称' in sample['columns'] and sample['rows']:
+            configured = set(config['business_lines'])
+            if not configured & set(result['business_lines']):
+                result['warnings'].append(f"前 {len(sample['rows'])} 行中没有{'、'.join(config['business_lines'])}业务的数据")
+    if sample['total_rows'] <= 0:
+        result['warnings'].append("文件中没有数据行")
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def format_inspection(result):
+    """预检结果的简短说明，返回 (文字, 是否有问题)"""
+    parts = []
+    if result['total_rows'] is not None:
+        prefix = '约 ' if result['estimated'] else ''
+        parts.append(f"{prefix}{result['total_rows']:,} 行，{len(result['columns'])} 列")
+    if result['business_month']:
+        parts.append(f"业务月度 {result['business_month']}")
+    if result['business_lines']:
+        parts.append(f"业务大类 {'、'.join(map(str, result['business_lines'][:3]))}"
+                     f"{'等' if len(result['business_lines']) > 3 else ''}")
+    problems = []
+    if result['missing']:
+        problems.append(f"缺少列：{'、'.join(result['missing'])}")
+    problems.extend(result['warnings'])
+    return '，'.join(parts + problems), bool(result['missing']) or bool(result['warnings'])
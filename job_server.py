@@ -0,0 +1,523 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+from analyze_data import analyze_excel_data
+from config import load_config, resolve_path
+from precheck_merge import input_file_list
+from process_pool import limit_workers
+from progress import ProgressChannel, format_progress
+
+# 提交任务时可以指定的 analyze_excel_data 参数
+JOB_OPTIONS = ('writer_mode', 'compress_level', 'export_mode', 'columnar_format', 'business_lines',
+               'processing_mode', 'compute_backend', 'sample_fraction')
+# 子进程向服务进程发送进度的最小间隔（秒），状态文字总是立即发送
+PROGRESS_INTERVAL = 0.2
+# 计算文件哈希时每次读取的字节数
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# 任务编号（uuid 的前 12 位），清理 jobs_dir 时只删除这样命名的子目录
+JOB_ID_RE = re.compile(r'[0-9a-f]{12}')
+
+# 子进程中的事件队列，由进程池的 initializer 设置
+_events = None
+
+def _init_worker(events):
+    global _events
+    _events = events
+    # 每个任务只在自己的子进程中运行，不再启动嵌套的进程池，进程总数不超过 workers
+    limit_workers(1)
+
+def run_job(job_id, input_file, subscription_file, output_file, options):
+    """
+    在进程池的子进程中运行一个分析任务，状态和进度通过事件队列发送给服务进程
+
+    返回 {'files': 生成的文件列表, 'started': 开始时间, 'finished': 结束时间, 'pid': 进程号}
+    """
+    started = time.time()
+    _events.put(('started', job_id, os.getpid(), started))
+    last_progress = 0
+
+    def report_status(text):
+        _events.put(('status', job_id, text, time.time()))
+
+    def report_progress(done, total=None, unit='行'):
+        nonlocal last_progress
+        now = time.time()
+        if now - last_progress >= PROGRESS_INTERVAL or done == total:
+            last_progress = now
+            _events.put(('progress', job_id, (done, total, unit), now))
+
+    files = analyze_excel_data(input_file, output_file, subscription_file, status_callback=report_status,
+                               progress_callback=report_progress, **options)
+    return {'files': files, 'started': started, 'finished': time.time(), 'pid': os.getpid()}
+
+class JobRejected(Exception):
+    """任务请求无效或队列已满，status 为返回的 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class Job:
+    def __init__(self, job_id, key, input_file, subscription_file, options, output_dir, hash_seconds,
+                 owns_output_dir=True):
+        self.id = job_id
+        self.key = key
+        self.input_file = input_file
+        self.subscription_file = subscription_file
+        self.options = options
+        self.output_dir = output_dir
+        # 输出目录是否为任务自己的目录（jobs_dir 下以任务编号命名），清理任务时一起删除
+        self.owns_output_dir = owns_output_dir
+        self.state = 'queued'
+        self.error = None
+        self.files = []
+        self.pid = None
+        self.duplicate_requests = 0
+        self.channel = ProgressChannel()
+        # (阶段名称, 开始时间)，用于统计各阶段用时
+        self.stages = []
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.hash_seconds = hash_seconds
+
+    def files_available(self):
+        return all(os.path.exists(path) for path in self.files)
+
+    def metrics(self):
+        """任务各部分用时（秒），尚未发生的为 None"""
+        end = self.finished or time.time()
+        stages = []
+        for i, (name, begin) in enumerate(self.stages):
+            stage_end = self.stages[i + 1][1] if i + 1 < len(self.stages) else end
+            stages.append({'name': name, 'seconds': round(stage_end - begin, 3)})
+        return {
+            'hash_seconds': round(self.hash_seconds, 3),
+            'queue_seconds': round((self.started or end) - self.submitted, 3),
+            'run_seconds': round(end - self.started, 3) if self.started else None,
+            'total_seconds': round(end - self.submitted, 3),
+            'stages': stages,
+        }
+
+    def to_dict(self):
+        progress = self.channel.snapshot()
+        progress['detail'] = format_progress(progress)
+        files = []
+        for index, path in enumerate(self.files):
+            name = os.path.relpath(path, self.output_dir)
+            files.append({
+                'index': index,
+                'name': name,
+                'size': os.path.getsize(path) if os.path.exists(path) else None,
+                'url': f"/jobs/{self.id}/files/{index}",
+            })
+        return {
+            'id': self.id,
+            'state': self.state,
+            'input_file': self.input_file,
+            'subscription_file': self.subscription_file,
+            'options': self.options,
+            'submitted': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.submitted)),
+            'duplicate_requests': self.duplicate_requests,
+            'pid': self.pid,
+            'progress': progress,
+            'metrics': self.metrics(),
+            'files': files,
+            'error': self.error,
+        }
+
+class JobManager:
+    """
+    分析任务队列
+
+    任务在有界的进程池中运行，超出进程数的任务排队等待；输入文件内容和参数都相同的任务
+    在排队或运行中时不会重复运行，直接返回已有的任务。
+    已结束的任务最多保留 keep_jobs 个、keep_days 天，超出的连同 jobs_dir 下的输出目录一起删除。
+    子进程异常退出（如内存不足被系统结束）时进程池不可再用，运行中的任务失败，之后的任务在新建的进程池中运行
+    """
+
+    def __init__(self, jobs_dir, workers=2, max_queued_jobs=20, keep_jobs=100, keep_days=7):
+        self.jobs_dir = jobs_dir
+        self.workers = workers
+        self.max_queued_jobs = max_queued_jobs
+        self.keep_jobs = keep_jobs
+        self.keep_days = keep_days
+        self.jobs = {}
+        self._by_key = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._events = multiprocessing.Queue()
+        self._executor = self._new_executor()
+        self._stopped = threading.Event()
+        self._event_thread = threading.Thread(target=self._read_events, daemon=True)
+        self._event_thread.start()
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._remove_expired_dirs()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self._events,))
+
+    def _replace_broken_executor(self, executor):
+        """executor 中有子进程异常退出后换成新的进程池；多个任务同时发现时只替换一次"""
+        with self._lock:
+            if self._executor is not executor or self._stopped.is_set():
+                return
+            self._executor = self._new_executor()
+        executor.shutdown(wait=False)
+        print("分析进程异常退出，已重新创建进程池", flush=True)
+
+    def _remove_expired_dirs(self):
+        """删除之前运行时留下的、超过保留天数的任务输出目录（重启后这些任务已不在列表中）"""
+        if not self.keep_days:
+            return
+        expires = time.time() - self.keep_days * 86400
+        for entry in os.scandir(self.jobs_dir):
+            if entry.is_dir() and JOB_ID_RE.fullmatch(entry.name) and entry.stat().st_mtime < expires:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _prune(self):
+        """删除超出保留数量或天数的已结束任务，调用时持有 self._lock"""
+        finished = sorted((job for job in self.jobs.values() if job.state in ('succeeded', 'failed', 'cancelled')),
+                          key=lambda job: job.finished, reverse=True)
+        expires = time.time() - self.keep_days * 86400 if self.keep_days else None
+        for index, job in enumerate(finished):
+            if (not self.keep_jobs or index < self.keep_jobs) and (expires is None or job.finished >= expires):
+                continue
+            del self.jobs[job.id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            if job.owns_output_dir:
+                shutil.rmtree(job.output_dir, ignore_errors=True)
+
+    def file_digest(self, path):
+        """文件内容的 SHA-256，按路径、大小和修改时间缓存"""
+        stat = os.stat(path)
+        cache_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(cache_key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            self._digests[cache_key] = digest
+        return digest
+
+    def job_key(self, subscription_file, input_file=None, options=None):
+        """
+        任务的去重键：输入文件内容的哈希加上任务参数
+
+        按文件内容而不是路径判断重复，同一文件复制到不同位置也视为相同的任务；
+        input_file 可以是多个预对账文件的列表，文件顺序不同视为不同的任务（去重时保留先出现的行）
+        """
+        digests = [self.file_digest(path) for path in input_file_list(input_file)]
+        key_source = {
+            'subscription_file': self.file_digest(subscription_file),
+            'input_file': digests[0] if len(digests) == 1 else (digests or None),
+            'options': options or {},
+        }
+        return hashlib.sha256(json.dumps(key_source, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def submit(self, request, output_dir=None):
+        """
+        提交任务，request 为 {'subscription_file': 路径, 'input_file': 路径或路径列表（可选）, 其他参数}
+
+        output_dir: 输出目录，为 None 时使用 jobs_dir 下以任务编号命名的子目录
+        返回 (任务, 是否为重复任务)
+        """
+        if not isinstance(request, dict):
+            raise JobRejected("请求内容应为 JSON 对象")
+        subscription_file = request.get('subscription_file')
+        input_file = request.get('input_file') or None
+        if not subscription_file:
+            raise JobRejected("缺少 subscription_file")
+        if input_file is not None and not isinstance(input_file, (str, list)):
+            raise JobRejected("input_file 应为路径或路径列表")
+        for path in [subscription_file] + input_file_list(input_file):
+            if not isinstance(path, str) or not os.path.isfile(path):
+                raise JobRejected(f"文件不存在: {path}")
+        unknown = set(request) - {'subscription_file', 'input_file'} - set(JOB_OPTIONS)
+        if unknown:
+            raise JobRejected(f"不支持的参数: {', '.join(sorted(unknown))}")
+        options = {name: request[name] for name in JOB_OPTIONS if name in request}
+
+        hash_start = time.perf_counter()
+        key = self.job_key(subscription_file, input_file, options)
+        hash_seconds = time.perf_counter() - hash_start
+
+        with self._lock:
+            existing = self._by_key.get(key)
+            # 只合并排队中和运行中的相同任务；已完成的任务不复用，
+            # 因为去重键不包含配置文件、别名表和历史数据库，修改后重新提交应重新分析
+            if existing and existing.state in ('queued', 'running'):
+                existing.duplicate_requests += 1
+                return existing, True
+
+            queued = sum(1 for job in self.jobs.values() if job.state == 'queued')
+            if queued >= self.max_queued_jobs:
+                raise JobRejected(f"排队中的任务已达上限 {self.max_queued_jobs}，请稍后再试", status=503)
+
+            job_id = uuid.uuid4().hex[:12]
+            owns_output_dir = output_dir is None
+            output_dir = output_dir or os.path.join(self.jobs_dir, job_id)
+            os.makedirs(output_dir, exist_ok=True)
+            job = Job(job_id, key, input_file, subscription_file, options, output_dir, hash_seconds,
+                      owns_output_dir)
+            job.channel.status("排队中...")
+            self.jobs[job_id] = job
+            self._by_key[key] = job
+
+        # 只使用输出文件所在的目录，文件名由业务大类和业务月度决定
+        arguments = (run_job, job_id, input_file, subscription_file, os.path.join(output_dir, '分析结果.xlsx'), options)
+        executor = self._executor
+        try:
+            future = executor.submit(*arguments)
+        except BrokenProcessPool:
+            self._replace_broken_executor(executor)
+            executor = self._executor
+            future = executor.submit(*arguments)
+        future.add_done_callback(lambda f: self._finish(job, f, executor))
+        print(f"任务 {job_id} 已提交: {subscription_file}", flush=True)
+        return job, False
+
+    def _finish(self, job, future, executor):
+        if future.cancelled():
+            # 停止服务时排队中的任务被取消
+            with self._lock:
+                job.finished = time.time()
+                job.state = 'cancelled'
+                job.channel.status("已取消")
+                self._prune()
+            print(f"任务 {job.id} 已取消", flush=True)
+            return
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._replace_broken_executor(executor)
+        with self._lock:
+            job.finished = time.time()
+            if error is None:
+                result = future.result()
+                job.files = result['files']
+                job.started = job.started or result['started']
+                job.finished = result['finished']
+                job.pid = result['pid']
+                job.state = 'succeeded'
+                job.channel.status("完成")
+            else:
+                job.state = 'failed'
+                if isinstance(error, MemoryError):
+                    job.error = "处理过程中内存不足"
+                elif isinstance(error, BrokenProcessPool):
+                    job.error = "分析进程异常退出（可能是内存不足）"
+                else:
+                    job.error = str(error)
+                job.channel.status("处理出错")
+            self._prune()
+        text = f"任务 {job.id} {'完成' if error is None else '失败: ' + job.error}，"
+        print(f"{text}用时 {job.metrics()['total_seconds']:.1f} 秒", flush=True)
+
+    def _read_events(self):
+        """读取子进程发送的状态和进度，更新对应任务"""
+        while not self._stopped.is_set():
+            try:
+                kind, job_id, value, at = self._events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            with self._lock:
+                if kind == 'started':
+                    job.pid = value
+                    job.started = at
+                    if job.state == 'queued':
+                        job.state = 'running'
+                elif job.state != 'running':
+                    # 任务结束后才读到的事件不再覆盖最终状态
+                    continue
+                elif kind == 'status':
+                    job.stages.append((value, at))
+                    job.channel.status(value)
+                elif kind == 'progress':
+                    job.channel.progress(*value)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in sorted(self.jobs.values(), key=lambda job: job.submitted)]
+
+    def metrics(self):
+        """服务整体统计：各状态任务数、重复请求数和已完成任务的平均用时"""
+        with self._lock:
+            jobs = list(self.jobs.values())
+        states = {}
+        for job in jobs:
+            states[job.state] = states.get(job.state, 0) + 1
+        finished = [job.metrics() for job in jobs if job.state == 'succeeded']
+
+        def average(name):
+            values = [metrics[name] for metrics in finished if metrics[name] is not None]
+            return round(sum(values) / len(values), 3) if values else None
+
+        return {
+            'workers': self.workers,
+            'max_queued_jobs': self.max_queued_jobs,
+            'jobs': states,
+            'duplicate_requests': sum(job.duplicate_requests for job in jobs),
+            'average_queue_seconds': average('queue_seconds'),
+            'average_run_seconds': average('run_seconds'),
+            'average_total_seconds': average('total_seconds'),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._stopped.set()
+        self._event_thread.join()
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP 接口：
+        POST /jobs                    提交任务，返回任务信息（重复任务返回已有任务，duplicate 为 true）
+        GET  /jobs                    所有任务
+        GET  /jobs/<编号>             任务状态、进度和用时
+        GET  /jobs/<编号>/files/<序号> 下载输出文件
+        GET  /metrics                 服务统计
+    """
+
+    server_version = 'AnalysisJobServer/1.0'
+
+    @property
+    def manager(self):
+        return self.server.manager
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, message, status):
+        self._send_json({'error': message}, status)
+
+    def _send_file(self, path):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(os.path.basename(path))}")
+        self.end_headers()
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(HASH_BLOCK_SIZE)
+                if not block:
+                    break
+                self.wfile.write(block)
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?', 1)[0].split('/') if part]
+        if parts == ['metrics']:
+            return self._send_json(self.manager.metrics())
+        if parts in ([], ['jobs']):
+            return self._send_json(self.manager.list())
+        if len(parts) < 2 or parts[0] != 'jobs':
+            return self._send_error("未知的路径", 404)
+
+        job = self.manager.get(parts[1])
+        if job is None:
+            return self._send_error(f"任务不存在: {parts[1]}", 404)
+        if len(parts) == 2:
+            return self._send_json(job.to_dict())
+        if len(parts) == 4 and parts[2] == 'files' and parts[3].isdigit():
+            index = int(parts[3])
+            # 只能下载任务生成的文件
+            if index >= len(job.files) or not os.path.exists(job.files[index]):
+                return self._send_error("文件不存在", 404)
+            return self._send_file(job.files[index])
+        return self._send_error("未知的路径", 404)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            return self._send_error("未知的路径", 404)
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+            job, duplicate = self.manager.submit(request)
+        except (ValueError, UnicodeDecodeError) as e:
+            return self._send_error(f"请求格式错误: {str(e)}", 400)
+        except JobRejected as e:
+            return self._send_error(str(e), e.status)
+        except OSError as e:
+            return self._send_error(f"读取文件出错: {str(e)}", 400)
+        data = job.to_dict()
+        data['duplicate'] = duplicate
+        self._send_json(data, 200 if duplicate else 201)
+
+    def log_message(self, format, *args):
+        # 打包为窗口程序时没有 stderr，使用 print 输出
+        print(f"[{self.address_string()}] {format % args}", flush=True)
+
+def create_server(host=None, port=None, workers=None, jobs_dir=None):
+    """
+    创建任务服务，未指定的参数读取配置文件中的 server 配置
+
+    返回 ThreadingHTTPServer，其 manager 属性为 JobManager；port 为 0 时使用系统分配的端口
+    """
+    settings = load_config()['server']
+    host = settings['host'] if host is None else host
+    port = settings['port'] if port is None else port
+    workers = workers or settings['workers']
+    jobs_dir = resolve_path(jobs_dir or settings['jobs_dir'])
+
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.manager = JobManager(jobs_dir, workers=workers, max_queued_jobs=settings['max_queued_jobs'],
+                                keep_jobs=settings['keep_jobs'], keep_days=settings['keep_days'])
+    return server
+
+def server_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/jobs"
+
+def start_server(host=None, port=None, workers=None, jobs_dir=None):
+    """在后台线程中运行任务服务（与界面同时运行），返回 server，用 stop_server 停止"""
+    server = create_server(host, port, workers, jobs_dir)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"任务服务已启动: {server_url(server)}，进程数 {server.manager.workers}，"
+          f"输出目录 {server.manager.jobs_dir}", flush=True)
+    return server
+
+def stop_server(server):
+    """停止接收请求，等待运行中的任务完成，排队中的任务取消"""
+    print("正在停止任务服务...", flush=True)
+    server.shutdown()
+    server.server_close()
+    server.manager.shutdown()
+
+def run_server(host=None, port=None, workers=None, jobs_dir=None):
+    """在命令行中运行任务服务（不显示窗口），直到按 Ctrl+C 停止"""
+    server = start_server(host, port, workers, jobs_dir)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_server(server)
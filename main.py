@@ -2,6 +2,8 @@ import os
 os.environ['TK_SILENCE_DEPRECATION'] = '1'
 
 import sys
+import argparse
+import multiprocessing
 from gui import run_gui
 from analyze_data import analyze_excel_data
 import time
@@ -26,11 +28,58 @@ def check_dependencies():
             print(f"安装依赖包时出错：{str(e)}")
             sys.exit(1)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="海运订阅与预对账数据分析")
+    parser.add_argument('--server', action='store_true',
+                        help="同时运行任务服务，通过本机 HTTP 接口提交分析任务；窗口中显示服务状态，关闭窗口时停止")
+    parser.add_argument('--no-gui', action='store_true',
+                        help="与 --server 一起使用，不显示窗口，在命令行中运行任务服务，按 Ctrl+C 停止")
+    parser.add_argument('--host', help="任务服务监听地址，默认读取配置文件")
+    parser.add_argument('--port', type=int, help="任务服务端口，默认读取配置文件")
+    parser.add_argument('--watch', nargs='?', const='', metavar='DIR',
+                        help="监视目录，ERP 导出文件后自动分析；不指定目录时读取配置文件")
+    parser.add_argument('--output', metavar='DIR', help="监视模式的报表输出目录，默认读取配置文件")
+    parser.add_argument('--workers', type=int, help="同时运行的分析任务数，默认读取配置文件")
+    parser.add_argument('--accept-matches', metavar='REPORT',
+                        help="把客户匹配报告中“确认”列填了“是”的建议导入客户别名表")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     check_dependencies()
-    
-    # 运行 GUI
-    input_file, output_file, subscription_file = run_gui()
+
+    if args.accept_matches:
+        from config import load_config, resolve_path
+        from customer_matching import accept_matches
+        alias_file = load_config()['customer_matching']['alias_file']
+        if not alias_file:
+            sys.exit("配置文件中没有设置客户别名表 customer_matching.alias_file")
+        alias_file = resolve_path(alias_file)
+        count = accept_matches(args.accept_matches, alias_file)
+        print(f"已导入 {count} 条确认的客户对应关系到 {alias_file}")
+        return
+    if args.server and args.no_gui:
+        from job_server import run_server
+        run_server(host=args.host, port=args.port, workers=args.workers)
+        return
+    if args.watch is not None:
+        from watch_folder import run_watch
+        run_watch(directory=args.watch, output_dir=args.output, workers=args.workers)
+        return
+
+    # 运行 GUI；--server 时任务服务在后台线程中同时运行，关闭窗口后停止
+    server = None
+    if args.server:
+        from job_server import start_server
+        server = start_server(host=args.host, port=args.port, workers=args.workers)
+    try:
+        input_file, output_file, subscription_file = run_gui(server)
+    finally:
+        if server is not None:
+            from job_server import stop_server
+            stop_server(server)
 
 if __name__ == "__main__":
+    # PyInstaller 打包后的 exe 使用进程池时需要此调用
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,216 @@
+import ctypes
+import os
+import sys
+import zipfile
+
+from openpyxl import load_workbook
+
+# 没有配置内存预算时，使用物理内存的这一比例
+DEFAULT_BUDGET_RATIO = 0.5
+# 无法获取物理内存时使用的预算
+FALLBACK_BUDGET_MB = 2048
+
+# 整表读入和 openpyxl 写出时，每个单元格大约占用的内存（字节），
+# 包括 openpyxl 解析、DataFrame 对象列和写出时的单元格对象
+IN_MEMORY_BYTES_PER_CELL = 900
+# 无法读取表格尺寸时，按 sheet XML 的大小估算
+IN_MEMORY_BYTES_PER_XML_BYTE = 15
+# .xls 等非 xlsx 文件无法读取表格尺寸，按文件大小估算（BIFF 格式每个单元格约 15 字节）
+IN_MEMORY_BYTES_PER_FILE_BYTE = 60
+# 程序本身（pandas、openpyxl 等）占用的内存
+BASE_FOOTPRINT_MB = 150
+
+def physical_memory_mb():
+    """物理内存大小（MB），无法获取时返回 None"""
+    try:
+        if sys.platform == 'win32':
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [
+                    ('dwLength', ctypes.c_ulong),
+                    ('dwMemoryLoad', ctypes.c_ulong),
+                    ('ullTotalPhys', ctypes.c_ulonglong),
+                    ('ullAvailPhys', ctypes.c_ulonglong),
+                    ('ullTotalPageFile', ctypes.c_ulonglong),
+                    ('ullAvailPageFile', ctypes.c_ulonglong),
+                    ('ullTotalVirtual', ctypes.c_ulonglong),
+                    ('ullAvailVirtual', ctypes.c_ulonglong),
+                    ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+                ]
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullTotalPhys / 1024 ** 2
+            return None
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 ** 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def process_memory_mb():
+    """
+    当前进程的工作集和峰值工作集（MB），无法获取时为 None
+    """
+    try:
+        if sys.platform == 'win32':
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ('cb', ctypes.c_ulong),
+                    ('PageFaultCount', ctypes.c_ulong),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t),
+                ]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize / 1024 ** 2, counters.PeakWorkingSetSize / 1024 ** 2
+            return None, None
+        # Linux：/proc 中的 VmRSS 为当前值，VmHWM 为峰值
+        values = {}
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    name, amount = line.split(':', 1)
+                    values[name] = int(amount.split()[0]) / 1024
+        return values.get('VmRSS'), values.get('VmHWM')
+    except (AttributeError, OSError, ValueError):
+        pass
+    try:
+        # macOS 等只能取得峰值（ru_maxrss 在 macOS 上以字节为单位）
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+        return None, peak
+    except (ImportError, OSError):
+        return None, None
+
+def children_memory_mb():
+    """
+    子进程（并行读取和写出时进程池中的进程）的内存（MB）：(运行中的子进程工作集之和, 已结束的子进程中最大的峰值)
+
+    运行中的子进程需要 psutil，没有安装时为 None；已结束子进程的峰值来自 getrusage，Windows 上为 None
+    """
+    current = None
+    try:
+        import psutil
+        current = 0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                current += child.memory_info().rss / 1024 ** 2
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+    except ImportError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        peak = peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    except (ImportError, OSError):
+        peak = None
+    return current, peak
+
+def resolve_budget_mb(budget_mb):
+    """配置中的内存预算为 0 或空时，取物理内存的一半"""
+    if budget_mb:
+        return float(budget_mb)
+    total = physical_memory_mb()
+    return total * DEFAULT_BUDGET_RATIO if total else FALLBACK_BUDGET_MB
+
+def excel_size(path):
+    """
+    不解析单元格，快速取得第一个 sheet 的行数、列数和 XML 大小
+
+    行列数来自 sheet 开头的 dimension 记录，没有该记录时为 None
+    """
+    workbook = load_workbook(path, read_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows, columns = sheet.max_row, sheet.max_column
+        with zipfile.ZipFile(path) as archive:
+            xml_size = archive.getinfo(sheet._worksheet_path).file_size
+    finally:
+        workbook.close()
+    return rows, columns, xml_size
+
+def estimate_footprint_mb(paths):
+    """
+    估算整表读入并用 openpyxl 写出时需要的内存（MB）
+
+    原始数据会同时存在于读入的 DataFrame、总表写出时的单元格对象和拆分时重新读入的总表中，
+    因此按单元格数量估算；表格没有尺寸记录时按 XML 大小估算，不是 xlsx 的文件按文件大小估算
+    """
+    total = 0
+    for path in paths:
+        if not path:
+            continue
+        if not zipfile.is_zipfile(path):
+            total += os.path.getsize(path) * IN_MEMORY_BYTES_PER_FILE_BYTE
+            continue
+        rows, columns, xml_size = excel_size(path)
+        if rows and columns and rows > 1:
+            total += rows * columns * IN_MEMORY_BYTES_PER_CELL
+        else:
+            total += xml_size * IN_MEMORY_BYTES_PER_XML_BYTE
+    return total / 1024 ** 2 + BASE_FOOTPRINT_MB
+
+def choose_processing_mode(paths, budget_mb, processing_mode='auto'):
+    """
+    根据估算的内存占用选择处理方式
+
+    processing_mode: 'auto' 超出预算时使用流式处理；'memory' / 'streaming' 强制使用对应方式，不打开文件估算
+    返回 (处理方式, 估算内存 MB, 预算 MB)，没有估算时估算内存为 None
+    """
+    if processing_mode not in ('auto', 'memory', 'streaming'):
+        raise ValueError(f"不支持的处理方式: {processing_mode}")
+    budget_mb = resolve_budget_mb(budget_mb)
+    estimate_mb = None
+    if processing_mode == 'auto':
+        estimate_mb = estimate_footprint_mb(paths)
+        processing_mode = 'streaming' if estimate_mb > budget_mb else 'memory'
+    return processing_mode, estimate_mb, budget_mb
+
+class MemoryTracker:
+    """
+    记录各阶段结束时的内存，并在超出预算时给出提示
+
+    内存为主进程加上子进程：运行中的子进程按当前工作集计入，已结束的子进程按其中最大的峰值计入
+    （开始记录之前已结束的子进程，如界面中上一次分析的子进程，不计入）
+    """
+
+    def __init__(self, budget_mb):
+        self.budget_mb = budget_mb
+        self.stages = []
+        self._children_peak_before = children_memory_mb()[1]
+
+    def _children_mb(self):
+        current, peak = children_memory_mb()
+        if peak is not None and self._children_peak_before is not None and peak <= self._children_peak_before:
+            peak = None
+        values = [value for value in (current, peak) if value]
+        return max(values) if values else 0
+
+    def stage(self, name):
+        current, peak = process_memory_mb()
+        children = self._children_mb()
+        if current is not None:
+            current += children
+        if peak is not None:
+            peak += children
+        self.stages.append((name, current, peak))
+        if peak is not None:
+            current_text = f"当前 {current:.0f} MB，" if current is not None else ''
+            children_text = f"（其中子进程 {children:.0f} MB）" if children else ''
+            print(f"[内存] {name}: {current_text}峰值 {peak:.0f} MB{children_text}", flush=True)
+            if peak > self.budget_mb:
+                print(f"[内存] 警告：{name}时内存占用超出预算 {self.budget_mb:.0f} MB", flush=True)
+        return current
+
+    @property
+    def peak_mb(self):
+        peaks = [peak for _, _, peak in self.stages if peak is not None]
+        return max(peaks) if peaks else None
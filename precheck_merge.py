@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from customer_keys import to_minor_units
+
+# 去重键中的金额列，换算为分后比较，不同导出中 100 与 100.00 视为相同
+MONEY_COLUMNS = {'本位币金额'}
+
+def input_file_list(input_file):
+    """预对账文件参数统一为列表：None 或空字符串 -> []，单个路径 -> [路径]"""
+    if not input_file:
+        return []
+    if isinstance(input_file, (str, os.PathLike)):
+        return [input_file]
+    return list(input_file)
+
+def key_text(values):
+    """非金额列统一按文字比较；数值列中的整数去掉小数部分（列中有空值时整列读入为浮点数）"""
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        numbers = values.astype(float)
+        text = numbers.astype(str)
+        integral = (numbers.notna() & (numbers % 1 == 0)).to_numpy()
+        text[integral] = numbers[integral].astype(np.int64).astype(str)
+        return text
+    return values.astype(str)
+
+def row_hashes(frame, key_columns):
+    """每行去重键的 64 位哈希"""
+    keys = pd.DataFrame({
+        column: to_minor_units(frame[column]).astype(np.int64) if column in MONEY_COLUMNS
+        else key_text(frame[column]).to_numpy(dtype=object)
+        for column in key_columns
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+def _lookup_counts(keys, counts, hashes):
+    """排好序的 keys 中每个哈希对应的次数，不在其中的为 0"""
+    if not len(keys):
+        return np.zeros(len(hashes), dtype=np.int64)
+    positions = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+    return np.where(keys[positions] == hashes, counts[positions], 0)
+
+def _merge_counts(keys, counts, other_keys, other_counts, combine):
+    """合并两组 (排好序的哈希, 次数)，相同哈希的次数用 combine（np.add 或 np.maximum）合并"""
+    merged, inverse = np.unique(np.concatenate([keys, other_keys]), return_inverse=True)
+    merged_counts = np.zeros(len(merged), dtype=np.int64)
+    combine.at(merged_counts, inverse, np.concatenate([counts, other_counts]))
+    return merged, merged_counts
+
+def _occurrences(hashes):
+    """每行是同一哈希在这组数据中的第几次出现（从 0 开始）"""
+    order = np.argsort(hashes, kind='stable')
+    ordered = hashes[order]
+    positions = np.arange(len(hashes))
+    starts = np.ones(len(hashes), dtype=bool)
+    starts[1:] = ordered[1:] != ordered[:-1]
+    result = np.empty(len(hashes), dtype=np.int64)
+    result[order] = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+    return result
+
+class DuplicateIndex:
+    """
+    合并多个预对账文件时的去重索引
+
+    按文件顺序读入，已读入文件中每个去重键的哈希和最多在一个文件中出现的次数保存在排好序的数组中（二分查找）；
+    同一文件内去重键相同的行是不同的记录，全部保留，后面文件中某个去重键的第 1、2……n 次出现，
+    在之前的文件中也出现过这么多次时，视为相邻两次导出重叠部分的重复行。
+    如之前的文件中有 1 行、当前文件中有 2 行相同的记录，当前文件保留 1 行
+    """
+
+    def __init__(self, key_columns):
+        self.key_columns = list(key_columns)
+        # 之前文件中的去重键哈希和次数
+        self._seen = np.empty(0, dtype=np.uint64)
+        self._seen_counts = np.empty(0, dtype=np.int64)
+        # 当前文件已读入部分的去重键哈希和次数
+        self._current = np.empty(0, dtype=np.uint64)
+        self._current_counts = np.empty(0, dtype=np.int64)
+        self._rows = 0
+        self._dropped = 0
+        # [(文件, 行数, 去掉的重复行数)]
+        self.stats = []
+
+    def check_columns(self, path, columns):
+        missing = [column for column in self.key_columns if column not in columns]
+        if missing:
+            raise ValueError(f"预对账文件 {os.path.basename(path)} 缺少去重列: {', '.join(missing)}")
+
+    def filter(self, frame):
+        """返回当前文件中这一块数据需要保留的行（布尔数组）"""
+        keep = np.ones(len(frame), dtype=bool)
+        if self.key_columns and len(frame):
+            hashes = row_hashes(frame, self.key_columns)
+            # 当前文件中的第几次出现，包括之前各块中的次数
+            occurrences = _lookup_counts(self._current, self._current_counts, hashes) + _occurrences(hashes)
+            keep = occurrences >= _lookup_counts(self._seen, self._seen_counts, hashes)
+            chunk_keys, chunk_counts = np.unique(hashes, return_counts=True)
+            self._current, self._current_counts = _merge_counts(self._current, self._current_counts,
+                                                                chunk_keys, chunk_counts, np.add)
+        self._rows += len(frame)
+        self._dropped += int(np.count_nonzero(~keep))
+        return keep
+
+    def finish_file(self, path):
+        """当前文件读完，其中的去重键加入索引，次数取之前文件与当前文件中较多的"""
+        if len(self._current):
+            self._seen, self._seen_counts = _merge_counts(self._seen, self._seen_counts,
+                                                          self._current, self._current_counts, np.maximum)
+        self.stats.append((path, self._rows, self._dropped))
+        self._current = np.empty(0, dtype=np.uint64)
+        self._current_counts = np.empty(0, dtype=np.int64)
+        self._rows = 0
+        self._dropped = 0
+
+    def report(self, status_callback=None):
+        """
+        输出每个文件去掉的重复行数；打包为窗口程序时看不到 print，有 status_callback 时
+        同时把各文件的行数发送给界面或任务服务。返回 stats
+        """
+        for path, rows, dropped in self.stats:
+            print(f"预对账文件 {os.path.basename(path)}: {rows} 行，去掉与之前文件重复的 {dropped} 行", flush=True)
+        total = sum(dropped for _, _, dropped in self.stats)
+        summary = f"合并 {len(self.stats)} 个预对账文件，共去掉重复行 {total} 行"
+        print(summary, flush=True)
+        if status_callback:
+            details = '；'.join(f"{os.path.basename(path)} {rows} 行中去掉 {dropped} 行"
+                               for path, rows, dropped in self.stats)
+            status_callback(f"{summary}（{details}）")
+        return self.stats
+
+def combine_precheck_frames(frames, paths, key_columns, status_callback=None):
+    """
+    按文件顺序合并多个预对账文件读入的数据，去掉后面文件中与之前文件重复的行
+
+    status_callback: 合并完成后调用 status_callback(文字)，报告每个文件去掉的重复行数
+    返回 (合并后的数据, 每个文件保留的行)；只有一个文件时原样返回，保留的行为 None
+    """
+    if len(frames) == 1:
+        return frames[0], [None]
+    index = DuplicateIndex(key_columns)
+    kept = []
+    masks = []
+    for frame, path in zip(frames, paths):
+        index.check_columns(path, frame.columns)
+        keep = index.filter(frame)
+        index.finish_file(path)
+        kept.append(frame[keep])
+        masks.append(keep)
+    index.report(status_callback)
+    return pd.concat(kept, ignore_index=True), masks
@@ -0,0 +1,146 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from precheck_merge import key_text
+
+def _departments(values):
+    """二级部门统一为 Python 对象，缺失值为 None，可以作为字典的键"""
+    return pd.Series(values, dtype=object).where(pd.notna(values), None).to_numpy(dtype=object)
+
+class TicketSample:
+    """
+    抽样预览的样本：按费率单号整单抽取，订阅数据和预对账数据使用同一组费率单
+
+    每个费率单号按种子计算一个哈希值，换算到 0-1 之间小于抽样比例的被抽中；哈希值与读入顺序和分块方式无关，
+    因此可以边读边抽样，整表读入和分块读入得到相同的样本。按二级部门分层：没有抽中任何费率单的二级部门
+    取哈希值最小的一个。订阅数据中费率单号为空的行各自按行号抽取，没有费率单号列时全部按行号抽取，
+    此时预对账数据按同样的规则独立抽取费率单，两者不再对应同一组费率单。
+    预对账数据保留订阅样本中的费率单，以及订阅数据中没有、按同样规则抽中的费率单，
+    同一费率单号的全部行一起保留，单票毛利和毛利率与全量数据中的数值相同
+    """
+
+    def __init__(self, fraction, seed=0):
+        self.fraction = fraction
+        # 哈希密钥为 16 个字符
+        self._hash_key = f"{abs(int(seed)) % 10 ** 16:016d}"
+        # 哈希值小于 fraction × 2^64 的被抽中
+        self._threshold = np.uint64(int(fraction * 2 ** 53) << 11)
+        self._rows = 0
+        self._parts = []
+        # 二级部门 -> 行数
+        self._sizes = Counter()
+        self._picked_departments = set()
+        # 还没有抽中费率单的二级部门 -> (哈希值最小的费率单, [该费率单的行])
+        self._fallback = {}
+        self._ticket_hashes = []
+        # 订阅样本中的费率单和订阅数据中全部的费率单（哈希值，排好序）
+        self._picked = None
+        self._known = None
+
+    def _hash(self, tickets):
+        """费率单号的哈希值，数值型的整数费率单号与文字写法相同"""
+        return pd.util.hash_array(key_text(pd.Series(tickets).reset_index(drop=True)).to_numpy(dtype=object),
+                                  hash_key=self._hash_key)
+
+    def add_subscription(self, chunk):
+        """抽取订阅数据的一块，样本保留在内存中"""
+        if '费率单号' in chunk.columns:
+            tickets = chunk['费率单号']
+        else:
+            tickets = pd.Series(None, index=chunk.index, dtype=object)
+        hashes = self._hash(tickets)
+        missing = tickets.isna().to_numpy()
+        if missing.any():
+            rows = np.arange(self._rows, self._rows + len(chunk), dtype=np.int64)[missing]
+            hashes[missing] = pd.util.hash_array(rows, hash_key=self._hash_key)
+        self._ticket_hashes.append(hashes[~missing])
+
+        # 行号作为索引，补充各部门的备选费率单后按原来的顺序排列
+        frame = chunk.set_axis(pd.RangeIndex(self._rows, self._rows + len(chunk)))
+        departments = _departments(chunk['二级部门'])
+        picked = hashes < self._threshold
+        self._sizes.update(departments)
+        self._picked_departments.update(departments[picked])
+        self._parts.append(frame[picked])
+        rest = ~picked
+        for department in set(departments[rest]) - self._picked_departments:
+            in_department = rest & (departments == department)
+            best = hashes[in_department].min()
+            rows = frame[in_department & (hashes == best)]
+            current = self._fallback.get(department)
+            if current is None or best < current[0]:
+                self._fallback[department] = (best, [rows])
+            elif best == current[0]:
+                current[1].append(rows)
+        self._rows += len(chunk)
+
+    def subscription(self):
+        """
+        订阅数据全部读完后返回 (样本, {二级部门: 放大倍数})，放大倍数为部门行数 / 样本中的行数
+        """
+        for department, (_, rows) in self._fallback.items():
+            if department not in self._picked_departments:
+                self._parts.extend(rows)
+        df = pd.concat(self._parts).sort_index(kind='stable').reset_index(drop=True)
+        self._parts = []
+        self._fallback = {}
+        sampled = Counter(_departments(df['二级部门']))
+        factors = {department: self._sizes[department] / count for department, count in sampled.items()}
+        if '费率单号' in df.columns:
+            self._picked = np.unique(self._hash(df['费率单号'].dropna()))
+        else:
+            self._picked = np.empty(0, dtype=np.uint64)
+        self._known = np.unique(np.concatenate(self._ticket_hashes))
+        self._ticket_hashes = []
+        print(f"订阅数据抽样：{self._rows} 行中抽取 {len(df)} 行，{len(self._picked)} 个费率单号", flush=True)
+        return df, factors
+
+    def precheck_mask(self, chunk):
+        """预对账数据一块中需要保留的行（布尔数组），需要先读完订阅数据；费率单号为空的行不参与分析，不保留"""
+        hashes = self._hash(chunk['费率单号'])
+        picked = np.isin(hashes, self._picked)
+        outside = ~np.isin(hashes, self._known) & (hashes < self._threshold)
+        return chunk['费率单号'].notna().to_numpy() & (picked | outside)
+
+def scale_counts(subscription_data, factors):
+    """
+    汇总结果中的票数列（列名以“票数”结尾）按所在二级部门的放大倍数换算为全量估计值
+
+    票数为 0 时显示的空字符串保持不变；金额和毛利率为样本中的数值，不换算
+    """
+    factor = subscription_data['二级部门'].map(factors).fillna(1).to_numpy(dtype=float)
+    scaled = subscription_data.copy()
+    for column in subscription_data.columns:
+        if not str(column).endswith('票数'):
+            continue
+        values = subscription_data[column].to_numpy()
+        is_count = np.array([value != '' for value in values], dtype=bool)
+        estimate = values.astype(object)
+        estimate[is_count] = np.rint(values[is_count].astype(float) * factor[is_count]).astype(np.int64)
+        scaled[column] = estimate if not is_count.all() else estimate.astype(np.int64)
+    return scaled
+
+def preview_label(fraction):
+    """抽样比例的文字，如 10%"""
+    percent = fraction * 100
+    return f"{percent:g}%"
+
+def preview_dir(output_dir, fraction):
+    """抽样预览的输出目录，与全量报表分开"""
+    return os.path.join(output_dir, f"抽样预览_{preview_label(fraction)}")
+
+def mark_preview_files(files, fraction):
+    """生成的 Excel 文件名前加上“抽样预览_比例_”，避免与全量报表混淆；返回新的文件列表"""
+    marked = []
+    prefix = f"抽样预览_{preview_label(fraction)}_"
+    for path in files:
+        directory, name = os.path.split(path)
+        if name.endswith('.xlsx') and not name.startswith(prefix) and os.path.isfile(path):
+            target = os.path.join(directory, prefix + name)
+            os.replace(path, target)
+            path = target
+        marked.append(path)
+    return marked
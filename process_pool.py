@@ -0,0 +1,31 @@
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+
+# 分析过程中每个进程池的子进程数上限，None 表示不限制；任务服务的子进程中设为 1，
+# 这样同时运行的分析进程总数不超过任务服务的 workers
+_max_workers = None
+
+def limit_workers(max_workers):
+    """设置当前进程中进程池的子进程数上限，为 1 时不再启动子进程"""
+    global _max_workers
+    _max_workers = max_workers
+
+class SerialExecutor(Executor):
+    """在当前进程中依次执行提交的函数，接口与 ProcessPoolExecutor 相同"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+def process_pool(max_workers):
+    """
+    创建进程池，子进程数不超过 limit_workers 设置的上限；只需要 1 个进程时在当前进程中依次执行
+    """
+    if _max_workers is not None:
+        max_workers = min(max_workers, _max_workers)
+    if max_workers <= 1:
+        return SerialExecutor()
+    return ProcessPoolExecutor(max_workers=max_workers)
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import deque
+
+# 界面来不及显示的阶段文字最多保留的条数
+MAX_PENDING_STATUS = 50
+
+class ProgressChannel:
+    """
+    工作线程与界面之间的进度通道
+
+    工作线程通过 status / progress 写入最新状态，只在锁内赋值，不会等待界面；
+    界面按固定频率调用 poll 读取，两次读取之间的多次进度更新只保留最后一次，
+    阶段文字则按顺序保留，每次 poll 返回一条，不会被之后的阶段覆盖
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._polled_version = 0
+        self._text = ''
+        self._done = 0
+        self._total = None
+        self._unit = '行'
+        self._started = None
+        self._pending = deque(maxlen=MAX_PENDING_STATUS)
+
+    def status(self, text):
+        """进入新的阶段，进度和计时重新开始"""
+        with self._lock:
+            self._text = text
+            self._done = 0
+            self._total = None
+            self._started = time.monotonic()
+            self._pending.append(text)
+            self._version += 1
+
+    def progress(self, done, total=None, unit='行'):
+        """更新当前阶段已处理的数量，total 未知时为 None"""
+        now = time.monotonic()
+        with self._lock:
+            # 从 0 开始或数量回退（同一阶段中开始新的循环）时重新计时
+            if self._started is None or done == 0 or done < self._done or unit != self._unit:
+                self._started = now
+            self._done = done
+            self._total = total
+            self._unit = unit
+            self._version += 1
+
+    def poll(self):
+        """
+        读取最新状态，自上次读取后没有更新时返回 None
+
+        返回 {'text', 'done', 'total', 'unit', 'rate'（每秒数量）, 'eta'（剩余秒数）}，无法计算的值为 None；
+        上次读取后进入了多个阶段时，先依次返回之前阶段的文字（没有进度），最后返回当前阶段的最新状态
+        """
+        with self._lock:
+            if len(self._pending) > 1:
+                return {'text': self._pending.popleft(), 'done': 0, 'total': None, 'unit': self._unit,
+                        'rate': None, 'eta': None}
+            if self._version == self._polled_version:
+                return None
+            self._pending.clear()
+            self._polled_version = self._version
+        return self.snapshot()
+
+    def snapshot(self):
+        """读取最新状态，不论是否有更新，格式与 poll 相同"""
+        with self._lock:
+            text, done, total, unit, started = self._text, self._done, self._total, self._unit, self._started
+
+        rate = eta = None
+        if started is not None and done:
+            elapsed = time.monotonic() - started
+            if elapsed > 0:
+                rate = done / elapsed
+                if total and total >= done:
+                    eta = (total - done) / rate
+        return {'text': text, 'done': done, 'total': total, 'unit': unit, 'rate': rate, 'eta': eta}
+
+def format_progress(state):
+    """进度详情文字，如“1,200 / 40,000 行  3,000 行/秒  剩余约 13 秒”"""
+    if not state['done'] and not state['total']:
+        return ''
+    parts = []
+    if state['total']:
+        parts.append(f"{state['done']:,} / {state['total']:,} {state['unit']}")
+    else:
+        parts.append(f"{state['done']:,} {state['unit']}")
+    if state['rate']:
+        parts.append(f"{state['rate']:,.0f} {state['unit']}/秒")
+    if state['eta'] is not None:
+        eta = int(round(state['eta']))
+        parts.append(f"剩余约 {eta // 60} 分 {eta % 60} 秒" if eta >= 60 else f"剩余约 {eta} 秒")
+    return '  '.join(parts)
@@ -0,0 +1,286 @@
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+import pandas as pd
+
+# 预览表格显示的列：(full_analysis 列名, 列宽, 显示格式)
+PREVIEW_COLUMNS = [
+    ('业务大类名称', 80, 'text'),
+    ('二级部门', 100, 'text'),
+    ('委托客户', 220, 'text'),
+    ('约价负毛利票数', 90, 'count'),
+    ('约价毛利率', 80, 'percent'),
+    ('非约价低负票数', 90, 'count'),
+    ('非约价毛利率', 80, 'percent'),
+    ('总票数', 60, 'count'),
+    ('总利润率', 80, 'percent'),
+    ('总利润率环比', 90, 'percent'),
+    ('初步分析', 300, 'text'),
+]
+
+class PreviewModel:
+    """
+    客户公司分析预览的数据模型：负责筛选、排序和按行号取出可见行，
+    与界面无关，所有运算都在整列上完成
+    """
+
+    def __init__(self, full_analysis):
+        self.columns = [name for name, _, _ in PREVIEW_COLUMNS]
+        frame = full_analysis.reindex(columns=self.columns).reset_index(drop=True)
+        self.frame = frame
+        # 票数列中 0 被写成空字符串，排序和筛选时转成数值
+        self.numeric = {
+            name: pd.to_numeric(frame[name], errors='coerce').to_numpy(dtype=float)
+            for name, _, kind in PREVIEW_COLUMNS if kind != 'text'
+        }
+        self.text = {
+            name: frame[name].fillna('').astype(str).to_numpy()
+            for name, _, kind in PREVIEW_COLUMNS if kind == 'text'
+        }
+        self.order = np.arange(len(frame))
+        self.sort_column = None
+        self.sort_descending = False
+
+    def __len__(self):
+        return len(self.order)
+
+    def departments(self):
+        return sorted(set(self.text['二级部门']) - {''})
+
+    def lines(self):
+        return sorted(set(self.text['业务大类名称']) - {''})
+
+    def apply(self, department='', customer='', max_contract_rate=None, max_profit_rate=None, line=''):
+        """
+        按条件筛选并保持当前排序
+
+        line: 业务大类名称，为空时不过滤
+        department: 二级部门，为空时不过滤
+        customer: 委托客户包含的文字，为空时不过滤
+        max_contract_rate / max_profit_rate: 约价毛利率 / 总利润率上限（小数），为 None 时不过滤
+        """
+        mask = np.ones(len(self.frame), dtype=bool)
+        if line:
+            mask &= self.text['业务大类名称'] == line
+        if department:
+            mask &= self.text['二级部门'] == department
+        if customer:
+            mask &= pd.Series(self.text['委托客户']).str.contains(customer, regex=False).to_numpy()
+        if max_contract_rate is not None:
+            mask &= self.numeric['约价毛利率'] <= max_contract_rate
+        if max_profit_rate is not None:
+            mask &= self.numeric['总利润率'] <= max_profit_rate
+        self.order = np.flatnonzero(mask)
+        if self.sort_column:
+            self._sort_order()
+
+    def sort(self, column):
+        """按列排序，重复点击同一列时切换升序/降序"""
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self._sort_order()
+
+    def _sort_order(self):
+        if self.sort_column in self.numeric:
+            values = self.numeric[self.sort_column][self.order]
+            # 空值始终排在最后
+            keys = np.where(np.isnan(values), np.inf, -values if self.sort_descending else values)
+            self.order = self.order[np.argsort(keys, kind='stable')]
+        else:
+            values = self.text[self.sort_column][self.order]
+            ranks = np.argsort(values, kind='stable')
+            if self.sort_descending:
+                ranks = ranks[::-1]
+            self.order = self.order[ranks]
+
+    def rows(self, start, count):
+        """取出排序后第 start 行起的 count 行，格式化为显示文本"""
+        indexes = self.order[start:start + count]
+        rows = []
+        for i in indexes:
+            values = []
+            for name, _, kind in PREVIEW_COLUMNS:
+                if kind == 'text':
+                    values.append(self.text[name][i].replace('\n', '；'))
+                    continue
+                value = self.numeric[name][i]
+                if np.isnan(value):
+                    values.append('')
+                elif kind == 'percent':
+                    values.append(f"{value:.2%}")
+                else:
+                    values.append(f"{value:.0f}" if value else '')
+            rows.append(values)
+        return rows
+
+class ResultPreview:
+    """
+    客户公司分析结果预览窗口
+
+    表格只创建与可见高度相同数量的行，滚动时替换这些行的内容，
+    因此几万行数据也能保持流畅
+    """
+
+    ROW_HEIGHT = 20
+
+    def __init__(self, master, full_analysis):
+        self.model = PreviewModel(full_analysis)
+        self.offset = 0
+        self.visible_rows = 0
+
+        self.window = tk.Toplevel(master)
+        self.window.title("客户公司分析预览")
+        self.window.geometry("1100x600")
+        self.window.configure(bg='#F0F0F0')
+
+        ttk.Style(self.window).configure('Preview.Treeview', rowheight=self.ROW_HEIGHT, font=('Arial', 9))
+
+        # 筛选条件
+        filter_frame = tk.Frame(self.window, bg='#F0F0F0')
+        filter_frame.pack(fill='x', padx=10, pady=(10, 5))
+
+        # 多个业务大类合并预览时才显示业务大类筛选
+        self.line_var = tk.StringVar(value='全部')
+        if len(self.model.lines()) > 1:
+            tk.Label(filter_frame, text="业务大类", bg='#F0F0F0', font=('Arial', 9)).pack(side='left')
+            line_box = ttk.Combobox(filter_frame, textvariable=self.line_var, state='readonly', width=8,
+                                    values=['全部'] + self.model.lines())
+            line_box.pack(side='left', padx=(5, 15))
+            line_box.bind('<<ComboboxSelected>>', lambda event: self.apply_filter())
+
+        tk.Label(filter_frame, text="二级部门", bg='#F0F0F0', font=('Arial', 9)).pack(side='left')
+        self.department_var = tk.StringVar(value='全部')
+        department_box = ttk.Combobox(filter_frame, textvariable=self.department_var, state='readonly', width=12,
+                                      values=['全部'] + self.model.departments())
+        department_box.pack(side='left', padx=(5, 15))
+        department_box.bind('<<ComboboxSelected>>', lambda event: self.apply_filter())
+
+        tk.Label(filter_frame, text="委托客户", bg='#F0F0F0', font=('Arial', 9)).pack(side='left')
+        self.customer_var = tk.StringVar()
+        self._filter_entry(filter_frame, self.customer_var, 18)
+
+        tk.Label(filter_frame, text="约价毛利率 ≤ (%)", bg='#F0F0F0', font=('Arial', 9)).pack(side='left')
+        self.contract_rate_var = tk.StringVar()
+        self._filter_entry(filter_frame, self.contract_rate_var, 6)
+
+        tk.Label(filter_frame, text="总利润率 ≤ (%)", bg='#F0F0F0', font=('Arial', 9)).pack(side='left')
+        self.profit_rate_var = tk.StringVar()
+        self._filter_entry(filter_frame, self.profit_rate_var, 6)
+
+        tk.Button(filter_frame, text="筛选", command=self.apply_filter, bg='#FFFFFF', relief='solid', bd=1,
+                  highlightthickness=0).pack(side='left')
+
+        self.count_label = tk.Label(filter_frame, text="", fg="#666666", bg='#F0F0F0', font=('Arial', 9))
+        self.count_label.pack(side='right')
+
+        # 表格
+        table_frame = tk.Frame(self.window)
+        table_frame.pack(expand=True, fill=tk.BOTH, padx=10, pady=(0, 10))
+
+        columns = [name for name, _, _ in PREVIEW_COLUMNS]
+        self.tree = ttk.Treeview(table_frame, columns=columns, show='headings', style='Preview.Treeview',
+                                 selectmode='browse')
+        for name, width, kind in PREVIEW_COLUMNS:
+            self.tree.heading(name, text=name, command=lambda column=name: self.sort_by(column))
+            self.tree.column(name, width=width, anchor='w' if kind == 'text' else 'center', stretch=name == '初步分析')
+
+        self.scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self._on_scrollbar)
+        self.scrollbar.pack(side='right', fill='y')
+        self.tree.pack(side='left', expand=True, fill=tk.BOTH)
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll_to(self.offset - 3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll_to(self.offset + 3))
+
+        self.refresh()
+
+    def _filter_entry(self, parent, variable, width):
+        entry = tk.Entry(parent, textvariable=variable, width=width)
+        entry.pack(side='left', padx=(5, 15))
+        entry.bind('<Return>', lambda event: self.apply_filter())
+
+    @staticmethod
+    def _parse_percent(text):
+        text = text.strip().rstrip('%')
+        if not text:
+            return None
+        return float(text) / 100
+
+    def apply_filter(self):
+        department = self.department_var.get()
+        line = self.line_var.get()
+        try:
+            max_contract_rate = self._parse_percent(self.contract_rate_var.get())
+            max_profit_rate = self._parse_percent(self.profit_rate_var.get())
+        except ValueError:
+            self.count_label.config(text="毛利率阈值必须是数字", fg="red")
+            return
+        self.model.apply(
+            department='' if department == '全部' else department,
+            customer=self.customer_var.get().strip(),
+            max_contract_rate=max_contract_rate,
+            max_profit_rate=max_profit_rate,
+            line='' if line == '全部' else line,
+        )
+        self.offset = 0
+        self.refresh()
+
+    def sort_by(self, column):
+        self.model.sort(column)
+        for name, _, _ in PREVIEW_COLUMNS:
+            arrow = ''
+            if name == column:
+                arrow = ' ▼' if self.model.sort_descending else ' ▲'
+            self.tree.heading(name, text=name + arrow)
+        self.refresh()
+
+    def scroll_to(self, offset):
+        max_offset = max(len(self.model) - self.visible_rows, 0)
+        offset = min(max(int(offset), 0), max_offset)
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == 'moveto':
+            self.scroll_to(float(value) * len(self.model))
+        elif action == 'scroll':
+            step = self.visible_rows if unit == 'pages' else 1
+            self.scroll_to(self.offset + int(value) * step)
+
+    def _on_mousewheel(self, event):
+        # Windows 每格 delta 为 120，macOS 为 1
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.scroll_to(self.offset - delta * 3)
+
+    def _on_resize(self, event):
+        # 表头约占一行高度
+        visible_rows = max(event.height // self.ROW_HEIGHT - 1, 1)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.scroll_to(self.offset)
+            self.refresh()
+
+    def refresh(self):
+        """只重新填充可见行"""
+        rows = self.model.rows(self.offset, self.visible_rows)
+        items = self.tree.get_children()
+        for i, values in enumerate(rows):
+            if i < len(items):
+                self.tree.item(items[i], values=values)
+            else:
+                self.tree.insert('', 'end', values=values)
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+
+        total = len(self.model)
+        if total:
+            self.scrollbar.set(self.offset / total, min((self.offset + self.visible_rows) / total, 1.0))
+        else:
+            self.scrollbar.set(0, 1)
+        self.count_label.config(text=f"显示 {total} / {len(self.model.frame)} 行", fg="#666666")
@@ -0,0 +1,138 @@
+import numpy as np
+
+# 支持的比较运算，value 为常数，other 为同一行中的另一列
+COMPARISONS = {
+    '==': lambda column, value: column == value,
+    '!=': lambda column, value: column != value,
+    '<': lambda column, value: column < value,
+    '<=': lambda column, value: column <= value,
+    '>': lambda column, value: column > value,
+    '>=': lambda column, value: column >= value,
+}
+
+# 集合/空值判断，in 和 not_in 的列表中可以写 null 表示空值
+MEMBERSHIP = ('in', 'not_in', 'isna', 'notna')
+
+def _scale_value(value, scale):
+    """按列的换算比例换算常数（如金额从元换算为分），非数值保持不变"""
+    if scale == 1 or isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return int(round(value * scale))
+
+def _compile_condition(rule_name, spec, scales):
+    """
+    把一个条件编译为 (缓存键, 求值函数)，求值函数接收整张表，返回整列的布尔数组
+
+    条件格式：{'column': 列名, 'op': 运算, 'value': 常数} 或 {'column': 列名, 'op': 运算, 'other': 另一列}
+    """
+    column = spec.get('column')
+    op = spec.get('op')
+    if not column or op is None:
+        raise ValueError(f"规则 {rule_name} 的条件缺少 column 或 op: {spec}")
+    scale = scales.get(column, 1)
+
+    if op in COMPARISONS:
+        compare = COMPARISONS[op]
+        if 'other' in spec:
+            other = spec['other']
+            if scales.get(other, 1) != scale:
+                raise ValueError(f"规则 {rule_name} 比较的两列单位不同: {column}, {other}")
+            key = (column, op, 'column', other)
+            evaluate = lambda frame: compare(frame[column], frame[other])
+        elif 'value' in spec:
+            value = _scale_value(spec['value'], scale)
+            key = (column, op, 'value', repr(value))
+            evaluate = lambda frame: compare(frame[column], value)
+        else:
+            raise ValueError(f"规则 {rule_name} 的条件缺少 value 或 other: {spec}")
+    elif op in ('in', 'not_in'):
+        values = spec.get('value')
+        if not isinstance(values, list):
+            raise ValueError(f"规则 {rule_name} 的 {op} 条件需要列表: {spec}")
+        include_null = None in values
+        values = [_scale_value(value, scale) for value in values if value is not None]
+        key = (column, 'in', 'value', repr(values + [include_null]))
+
+        def evaluate(frame):
+            series = frame[column]
+            mask = series.isin(values)
+            return mask | series.isna() if include_null else mask
+
+        if op == 'not_in':
+            return key, evaluate, True
+    elif op in ('isna', 'notna'):
+        key = (column, 'isna', 'value', '')
+        evaluate = lambda frame: frame[column].isna()
+        if op == 'notna':
+            return key, evaluate, True
+    else:
+        raise ValueError(f"规则 {rule_name} 使用了不支持的运算: {op}")
+    return key, evaluate, False
+
+def compile_rules(specs, scales=None):
+    """
+    编译规则配置
+
+    每条规则为 {'name': 名称, 'all': [条件, ...]} 或 {'name': 名称, 'any': [条件, ...]}，
+    all 要求全部条件成立，any 要求任一条件成立。返回编译后的规则列表，可多次用于 evaluate_rules / classify
+    scales: {列名: 换算比例}，表中该列的数值为配置单位乘以比例（如金额列以分保存时为 100），
+            条件中的常数按同样比例换算后再比较
+    """
+    scales = scales or {}
+    compiled = []
+    for spec in specs:
+        name = spec.get('name')
+        if not name:
+            raise ValueError(f"规则缺少名称: {spec}")
+        mode = 'any' if 'any' in spec else 'all'
+        conditions = spec.get(mode)
+        if not conditions:
+            raise ValueError(f"规则 {name} 没有条件")
+        compiled.append((name, mode, [_compile_condition(name, condition, scales) for condition in conditions]))
+    return compiled
+
+def rule_columns(rules):
+    """规则中引用到的全部列名"""
+    columns = set()
+    for name, mode, conditions in rules:
+        for key, _, _ in conditions:
+            columns.add(key[0])
+            if key[2] == 'column':
+                columns.add(key[3])
+    return columns
+
+def evaluate_rules(rules, frame):
+    """
+    在整张表上对每条规则求值，返回 {规则名称: 布尔数组}
+
+    所有条件都是整列运算；多条规则中相同的条件只计算一次
+    """
+    missing = rule_columns(rules) - set(frame.columns)
+    if missing:
+        raise ValueError(f"规则引用了不存在的列: {', '.join(sorted(missing))}")
+
+    cache = {}
+    masks = {}
+    for name, mode, conditions in rules:
+        mask = None
+        for key, evaluate, negate in conditions:
+            if key not in cache:
+                cache[key] = np.asarray(evaluate(frame), dtype=bool)
+            condition = ~cache[key] if negate else cache[key]
+            if mask is None:
+                mask = condition
+            else:
+                mask = mask | condition if mode == 'any' else mask & condition
+        masks[name] = mask
+    return masks
+
+def classify(rules, frame, default=''):
+    """
+    按规则顺序分类，每行取第一条成立的规则名称，都不成立时为 default
+    """
+    masks = evaluate_rules(rules, frame)
+    names = list(masks)
+    return np.select([masks[name] for name in names], names, default=default)
+
+def rule_names(rules):
+    return [name for name, _, _ in rules]
@@ -0,0 +1,233 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from config import DEFAULT_CONFIG
+from analyze_data import (SUBSCRIPTION_COLUMNS, PRECHECK_COLUMNS, resolve_business_month,
+                          summarize_subscription, summarize_precheck)
+from customer_keys import CustomerKeys, to_minor_units
+from excel_stream import iter_excel_chunks
+from precheck_merge import DuplicateIndex, input_file_list
+from rules import compile_rules, evaluate_rules, rule_columns, rule_names
+
+# SQLite 页缓存上限（MB），超出部分留在磁盘上的临时数据库中
+CACHE_MB = 64
+
+def _records(chunk, columns):
+    """转换为 sqlite3 可以直接写入的 Python 值，缺失值写为 NULL"""
+    values = [chunk[column].astype(object).where(chunk[column].notna(), None).tolist() for column in columns]
+    return zip(*values)
+
+def _column_values(rows, index):
+    """查询结果中的一列，按内容推断类型（与 pandas 读入 Excel 时一致）"""
+    return pd.Series([row[index] for row in rows], dtype=object).infer_objects()
+
+class SQLiteBackend:
+    """
+    SQLite 计算后端：输入数据分块写入磁盘上的临时数据库，分组汇总通过带索引的 SQL 查询完成
+
+    内存中只保留当前读入的一块数据和分组后的汇总结果，适合数据量远超内存的情况；
+    汇总结果交给与 pandas 后端相同的 summarize_subscription / summarize_precheck 生成报表数据，
+    因此两个后端的输出相同。临时数据库在 close 时删除
+    """
+
+    def __init__(self, temp_dir=None, cache_mb=CACHE_MB):
+        self._dir = tempfile.mkdtemp(prefix='analysis_', dir=temp_dir)
+        self.path = os.path.join(self._dir, 'compute.db')
+        self.connection = sqlite3.connect(self.path)
+        # 临时数据，不需要事务日志和落盘同步
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute(f"PRAGMA cache_size = {-int(cache_mb * 1024)}")
+        self.connection.execute("PRAGMA temp_store = FILE")
+
+    def close(self):
+        self.connection.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def process_subscription_file(self, subscription_file, business_lines=None, rules=None, progress=None):
+        """
+        与 analyze_data.process_subscription_file 相同的汇总，在 SQLite 中完成
+
+        返回 (汇总结果, 业务月度, CustomerKeys, 订阅文件中出现的业务大类集合)
+        """
+        if business_lines is None:
+            business_lines = ['海运']
+        if rules is None:
+            rules = DEFAULT_CONFIG['rules']['subscription']
+        rules = compile_rules(rules)
+        names = rule_names(rules)
+        missing_rules = {'约价负毛利', '非约价低负'} - set(names)
+        if missing_rules:
+            raise ValueError(f"订阅数据分类规则缺少: {', '.join(sorted(missing_rules))}")
+        extra_names = [name for name in names if name not in ('约价负毛利', '非约价低负')]
+        flag_columns = ['flag_yue', 'flag_non_yue'] + [f"flag_{i}" for i in range(len(extra_names))]
+
+        self.connection.execute("DROP TABLE IF EXISTS subscription")
+        self.connection.execute(f"""CREATE TABLE subscription (
+            line, dept, customer, profit INTEGER, income INTEGER,
+            {', '.join(f'{column} INTEGER' for column in flag_columns)})""")
+        insert = (f"INSERT INTO subscription VALUES "
+                  f"({', '.join('?' * (5 + len(flag_columns)))})")
+
+        columns = set(SUBSCRIPTION_COLUMNS) | rule_columns(rules)
+        first_month = None
+        present_lines = set()
+        total_rows = 0
+        selected_rows = 0
+        flag_counts = dict.fromkeys(names, 0)
+        for chunk in iter_excel_chunks(subscription_file, columns, progress=progress):
+            if total_rows == 0:
+                print("海运订阅文件的列名:", chunk.columns.tolist(), flush=True)
+                missing_columns = [col for col in SUBSCRIPTION_COLUMNS if col not in chunk.columns]
+                if missing_columns:
+                    raise ValueError(f"海运订阅文件缺少以下列: {', '.join(missing_columns)}")
+            total_rows += len(chunk)
+            if first_month is None:
+                months = chunk['业务月度'].dropna()
+                if not months.empty:
+                    first_month = months.iloc[0]
+            present_lines.update(chunk['业务大类名称'].dropna())
+
+            chunk = chunk[chunk['业务大类名称'].isin(business_lines)]
+            # 整块为空的列推断为 object，规则中的比较按数值列处理
+            for column in rule_columns(rules):
+                if chunk[column].dtype == object and chunk[column].isna().all():
+                    chunk[column] = chunk[column].astype(float)
+            flags = evaluate_rules(rules, chunk)
+            for name, mask in flags.items():
+                flag_counts[name] += int(np.count_nonzero(mask))
+            selected_rows += len(chunk)
+
+            data = pd.DataFrame({
+                'line': chunk['业务大类名称'].to_numpy(),
+                'dept': chunk['二级部门'].to_numpy(),
+                'customer': chunk['委托客户'].to_numpy(),
+                'profit': to_minor_units(chunk['未税人民币总毛利']),
+                'income': to_minor_units(chunk['未税人民币总收入']),
+            })
+            for column, name in zip(flag_columns, ['约价负毛利', '非约价低负'] + extra_names):
+                data[column] = flags[name].astype(np.int8)
+            with self.connection:
+                self.connection.executemany(insert, _records(data, list(data.columns)))
+
+        print(f"原始数据行数: {total_rows}", flush=True)
+        business_month = resolve_business_month(first_month)
+        print(f"筛选{'、'.join(business_lines)}业务后的数据行数: {selected_rows}", flush=True)
+        for name, count in flag_counts.items():
+            print(f"{name}的记录数: {count}", flush=True)
+
+        # (二级部门, 委托客户) 按第一次出现的顺序编号，与 pandas 后端逐行建立的客户键编号相同
+        with self.connection:
+            self.connection.execute("DROP TABLE IF EXISTS customer_pairs")
+            self.connection.execute("""
+                CREATE TABLE customer_pairs AS
+                SELECT dept, customer, MIN(rowid) AS first_row FROM subscription
+                GROUP BY dept, customer ORDER BY first_row""")
+            self.connection.execute("CREATE INDEX customer_pairs_name ON customer_pairs (dept, customer)")
+        pairs = self.connection.execute("SELECT dept, customer FROM customer_pairs ORDER BY rowid").fetchall()
+        keys = CustomerKeys(_column_values(pairs, 0), _column_values(pairs, 1))
+
+        # 按 (业务大类, 客户) 分组汇总票数和金额（分），分组顺序为第一次出现的顺序；
+        # 客户名称为空的行与 pandas 后端一样不参与分组
+        flag_sums = ', '.join(f"SUM(s.{column}), SUM(s.{column} * s.profit), SUM(s.{column} * s.income)"
+                              for column in flag_columns[:2])
+        extra_sums = ''.join(f", SUM(s.{column})" for column in flag_columns[2:])
+        groups = self.connection.execute(f"""
+            SELECT p.rowid - 1, s.line, {flag_sums}, SUM(s.profit), SUM(s.income), COUNT(*){extra_sums}
+            FROM subscription s JOIN customer_pairs p ON p.dept = s.dept AND p.customer = s.customer
+            GROUP BY s.line, p.rowid
+            ORDER BY MIN(s.rowid)""").fetchall()
+        aggregate_names = ['yue_count', 'yue_profit', 'yue_income', 'non_yue_count', 'non_yue_profit',
+                           'non_yue_income', 'total_profit', 'total_income', 'total_tickets']
+        values = np.asarray([row[2:] for row in groups], dtype=np.int64) \
+            .reshape(len(groups), len(aggregate_names) + len(extra_names))
+        aggregates = {name: values[:, i] for i, name in enumerate(aggregate_names)}
+        extra_counts = {name: values[:, len(aggregate_names) + i] for i, name in enumerate(extra_names)}
+        group_keys = keys.codes[np.asarray([row[0] for row in groups], dtype=np.int64)]
+        grouped_data = summarize_subscription(keys, group_keys, _column_values(groups, 1), aggregates, extra_counts)
+        return grouped_data, business_month, keys, present_lines
+
+    def analyze_precheck_data(self, input_files, keys, rules=None, matcher=None, dedup_columns=(), progress=None,
+                              status_callback=None):
+        """
+        与 analyze_data.analyze_precheck_data 相同的汇总：先在 SQLite 中按原始名称分组汇总应收/应付金额，
+        客户名称匹配和费目分类在分组结果上完成
+
+        input_files: 预对账文件列表，多个文件时按 dedup_columns 去掉后面文件中与之前文件重复的行，
+                     每个文件去掉的行数通过 status_callback 报告
+        返回 (result_df, customer_analysis, 每个文件保留的行)，只有一个文件时保留的行为 [None]
+        """
+        input_files = input_file_list(input_files)
+        self.connection.execute("DROP TABLE IF EXISTS precheck")
+        self.connection.execute("""CREATE TABLE precheck (
+            dept, customer, rate, alias, currency, direction, amount INTEGER)""")
+        key_columns = ['法人部门', '委托客户', '费率单号', '别名', '应收应付', '币种']
+        dedup = DuplicateIndex(dedup_columns) if len(input_files) > 1 else None
+        columns = set(PRECHECK_COLUMNS) | set(dedup.key_columns if dedup else ())
+        kept_rows = []
+        for path in input_files:
+            checked = False
+            keep = []
+            for chunk in iter_excel_chunks(path, columns, progress=progress):
+                if not checked:
+                    for col in PRECHECK_COLUMNS:
+                        if col not in chunk.columns:
+                            raise ValueError(f"缺少必要的列: {col}")
+                    if dedup:
+                        dedup.check_columns(path, chunk.columns)
+                    checked = True
+                if dedup:
+                    chunk_keep = dedup.filter(chunk)
+                    keep.append(chunk_keep)
+                    chunk = chunk[chunk_keep]
+                # groupby 会忽略分组列为空的行，这里保持一致
+                chunk = chunk[chunk[key_columns].notna().all(axis=1)]
+                data = pd.DataFrame({
+                    'dept': chunk['法人部门'].to_numpy(),
+                    'customer': chunk['委托客户'].to_numpy(),
+                    'rate': chunk['费率单号'].to_numpy(),
+                    'alias': chunk['别名'].to_numpy(),
+                    'currency': chunk['币种'].to_numpy(),
+                    'direction': chunk['应收应付'].to_numpy(),
+                    'amount': to_minor_units(chunk['本位币金额']),
+                })
+                with self.connection:
+                    self.connection.executemany("INSERT INTO precheck VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                                _records(data, list(data.columns)))
+            if dedup:
+                dedup.finish_file(path)
+                kept_rows.append(np.concatenate(keep))
+            else:
+                kept_rows.append(None)
+        if dedup:
+            dedup.report(status_callback)
+        with self.connection:
+            self.connection.execute(
+                "CREATE INDEX precheck_item ON precheck (dept, customer, rate, alias, currency)")
+
+        items = self.connection.execute("""
+            SELECT dept, customer, rate, alias, currency,
+                   SUM(CASE WHEN direction = '应收' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN direction = '应付' THEN amount ELSE 0 END),
+                   COUNT(*)
+            FROM precheck
+            GROUP BY dept, customer, rate, alias, currency
+            ORDER BY MIN(rowid)""").fetchall()
+        print(f"预对账数据按费目分组后的记录数: {len(items)}", flush=True)
+        amounts = np.asarray([row[5:] for row in items], dtype=np.int64).reshape(len(items), 3)
+        result_df, customer_analysis = summarize_precheck(
+            keys, _column_values(items, 0), _column_values(items, 1), _column_values(items, 2),
+            _column_values(items, 3), _column_values(items, 4), amounts[:, 0], amounts[:, 1], rules, matcher,
+            counts=amounts[:, 2])
+        return result_df, customer_analysis, kept_rows
@@ -0,0 +1,64 @@
+import copy
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analyze_data
+from config import DEFAULT_CONFIG
+
+def subscription_frame(month='2024-05'):
+    """一个月的海运订阅数据：两个二级部门、三个客户"""
+    return pd.DataFrame({
+        '二级部门': ['内贸水运', '内贸水运', '外贸水运', '外贸水运', '内贸水运'],
+        '委托客户': ['客户A', '客户A', '客户B', '客户C', '客户B'],
+        '客户约价': ['Y', None, 'N', 'Y', None],
+        '是否低负': ['负毛利', '低毛利', '负毛利', '负毛利', 'N'],
+        '未税人民币总毛利': [-100.5, 20.25, -30.0, -5.5, 80.0],
+        '未税人民币总收入': [1000.0, 500.0, 300.0, 200.0, 800.0],
+        '业务大类名称': ['海运', '海运', '海运', '海运', '空运'],
+        '业务月度': month,
+    })
+
+def precheck_frame():
+    """与 subscription_frame 对应的预对账数据"""
+    return pd.DataFrame({
+        '法人部门': ['内贸', '内贸', '内贸', '外贸', '外贸'],
+        '委托客户': ['客户A', '客户A', '客户A', '客户B', '客户C'],
+        '别名': ['海运费', '海运费', '港杂费', '海运费', '文件费'],
+        '应收应付': ['应收', '应付', '应付', '应付', '应收'],
+        '本位币金额': [100.0, 150.0, 20.0, 50.0, 10.0],
+        '费率单号': ['T1', 'T1', 'T1', 'T2', 'T3'],
+        '币种': ['CNY', 'CNY', 'CNY', 'USD', 'CNY'],
+    })
+
+def write_xls(df, path):
+    """写出 .xls 文件（BIFF 格式），空值写为空单元格"""
+    xlwt = pytest.importorskip('xlwt')
+    book = xlwt.Workbook()
+    sheet = book.add_sheet('Sheet1')
+    for j, column in enumerate(df.columns):
+        sheet.write(0, j, column)
+    for i, row in enumerate(df.itertuples(index=False), 1):
+        for j, value in enumerate(row):
+            if not pd.isna(value):
+                sheet.write(i, j, value.item() if hasattr(value, 'item') else value)
+    book.save(path)
+    return path
+
+def read_outputs(files):
+    """生成的 Excel 文件内容，{文件名: {sheet: DataFrame}}"""
+    return {os.path.basename(path): pd.read_excel(path, sheet_name=None)
+            for path in files if path.endswith('.xlsx')}
+
+@pytest.fixture
+def config(monkeypatch, tmp_path):
+    """分析使用的配置：不写历史数据库和别名表"""
+    settings = copy.deepcopy(DEFAULT_CONFIG)
+    settings['history_db'] = ''
+    settings['customer_matching']['alias_file'] = ''
+    monkeypatch.setattr(analyze_data, 'load_config', lambda path=None: settings)
+    return settings
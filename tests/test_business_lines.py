@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+import analyze_data
+from conftest import subscription_frame, precheck_frame, read_outputs
+
+@pytest.mark.parametrize('processing_mode', ['memory', 'streaming'])
+def test_each_line_gets_own_reports(tmp_path, config, capsys, processing_mode):
+    subscription = subscription_frame()
+    # 空运的客户B也是负毛利，进入客户分析
+    subscription.loc[4, '是否低负'] = '负毛利'
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    precheck_file = str(tmp_path / '预对账.xlsx')
+    subscription.to_excel(subscription_file, index=False)
+    precheck_frame().to_excel(precheck_file, index=False)
+
+    files = analyze_data.analyze_excel_data(precheck_file, str(tmp_path / '分析结果.xlsx'), subscription_file,
+                                            business_lines=['海运', '空运', '铁运'],
+                                            processing_mode=processing_mode)
+    # 订阅文件中没有铁运的数据，跳过而不报错
+    assert '订阅文件中没有铁运业务的数据，跳过' in capsys.readouterr().out
+    outputs = read_outputs(files)
+    assert sorted(outputs) == sorted([
+        '分析结果_总表_2024-05.xlsx', '分析结果_内贸水运_2024-05.xlsx', '分析结果_外贸水运_2024-05.xlsx',
+        '分析结果_空运_总表_2024-05.xlsx', '分析结果_空运_内贸水运_2024-05.xlsx',
+    ])
+    assert not any('铁运' in os.path.basename(path) for path in files)
+
+    for name, sheets in outputs.items():
+        line = '空运' if '空运' in name else '海运'
+        # 原始数据sheet只包含本业务大类的数据
+        raw = sheets[f'{line}订阅原始数据']
+        assert set(raw['业务大类名称']) == {line}, name
+        assert not any(sheet.endswith('订阅原始数据') and sheet != f'{line}订阅原始数据' for sheet in sheets)
+        expected = subscription[subscription['业务大类名称'] == line]
+        if name.endswith('_内贸水运_2024-05.xlsx'):
+            expected = expected[expected['二级部门'] == '内贸水运']
+        elif name.endswith('_外贸水运_2024-05.xlsx'):
+            expected = expected[expected['二级部门'] == '外贸水运']
+        assert sorted(raw['委托客户']) == sorted(expected['委托客户']), name
+        # 客户公司分析只包含本业务大类的客户（第一行为第二层表头）
+        analysis_customers = sheets['客户公司分析']['委托客户'].dropna()
+        assert set(analysis_customers) <= set(expected['委托客户']), name
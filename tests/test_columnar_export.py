@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+import pytest
+
+import analyze_data
+from columnar_export import export_columnar
+from conftest import precheck_frame, subscription_frame
+
+def test_partition_values_are_escaped(tmp_path):
+    ds = pytest.importorskip('pyarrow.dataset')
+    full_analysis = pd.DataFrame({
+        '二级部门': ['华东/上海', '内贸=水运', None],
+        '委托客户': ['客户A', '客户B', '客户C'],
+        '业务大类名称': '海运',
+        '总票数': [3, '', 1],
+        '总利润率': [0.1, 0.2, 0.3],
+    })
+    files = export_columnar(str(tmp_path), '2024-05', None, None, full_analysis)
+
+    assert len(files) == 3
+    dataset_dir = tmp_path / '客户公司分析'
+    assert [path.name for path in dataset_dir.iterdir()] == ['业务月度=2024-05']
+    # 每个部门只有一层分区目录
+    for path in files:
+        assert os.path.relpath(path, dataset_dir).count(os.sep) == 3
+    table = ds.dataset(str(dataset_dir), format='parquet', partitioning='hive').to_table().to_pandas()
+    table = table.sort_values('委托客户').reset_index(drop=True)
+    assert table['二级部门'].tolist()[:2] == ['华东/上海', '内贸=水运']
+    assert pd.isna(table['二级部门'][2])
+    assert table['总票数'].tolist() == [3, 0, 1]
+
+def test_rerun_replaces_month(tmp_path):
+    pytest.importorskip('pyarrow.dataset')
+    first = pd.DataFrame({'二级部门': ['内贸水运', '外贸水运'], '委托客户': ['客户A', '客户B'], '业务大类名称': '海运'})
+    second = pd.DataFrame({'二级部门': ['内贸水运'], '委托客户': ['客户A'], '业务大类名称': '海运'})
+    export_columnar(str(tmp_path), '2024-05', None, None, first, file_format='arrow')
+    files = export_columnar(str(tmp_path), '2024-05', None, None, second, file_format='arrow')
+    line_dir = tmp_path / '客户公司分析' / '业务月度=2024-05' / '业务大类名称=%E6%B5%B7%E8%BF%90'
+    assert [path.name for path in line_dir.iterdir()] == ['二级部门=%E5%86%85%E8%B4%B8%E6%B0%B4%E8%BF%90']
+    assert files == [str(line_dir / '二级部门=%E5%86%85%E8%B4%B8%E6%B0%B4%E8%BF%90' / 'part-0.arrow')]
+
+def test_other_lines_are_kept(tmp_path):
+    ds = pytest.importorskip('pyarrow.dataset')
+    sea = pd.DataFrame({'二级部门': ['内贸水运'], '委托客户': ['客户A'], '业务大类名称': '海运'})
+    air = pd.DataFrame({'二级部门': ['内贸水运'], '委托客户': ['客户A'], '业务大类名称': '空运'})
+    export_columnar(str(tmp_path), '2024-05', sea, None, sea, business_lines=['海运'])
+    export_columnar(str(tmp_path), '2024-05', air, None, air, business_lines=['空运'])
+    # 空运单独运行，不删除海运的分区；订阅汇总不使用海运的名称
+    for name in ('订阅汇总', '客户公司分析'):
+        table = ds.dataset(str(tmp_path / name), format='parquet', partitioning='hive').to_table().to_pandas()
+        assert sorted(table['业务大类名称']) == ['海运', '空运']
+    assert not (tmp_path / '海运订阅汇总').exists()
+
+@pytest.mark.parametrize('processing_mode', ['memory', 'streaming'])
+def test_both_mode_returns_datasets(tmp_path, config, processing_mode):
+    pytest.importorskip('pyarrow.dataset')
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    precheck_file = str(tmp_path / '预对账.xlsx')
+    subscription_frame().to_excel(subscription_file, index=False)
+    precheck_frame().to_excel(precheck_file, index=False)
+    output_dir = tmp_path / '输出'
+    output_dir.mkdir()
+    files = analyze_data.analyze_excel_data(precheck_file, str(output_dir / '分析结果.xlsx'), subscription_file,
+                                            export_mode='both', processing_mode=processing_mode)
+    # 工作簿和数据集都在返回的文件列表中，任务服务和监视目录据此提供下载和记录
+    assert str(output_dir / '分析结果_总表_2024-05.xlsx') in files
+    dataset_dir = str(output_dir / '分析结果_数据集')
+    datasets = [path for path in files if path.startswith(dataset_dir)]
+    assert {os.path.relpath(path, dataset_dir).split(os.sep)[0] for path in datasets} == \
+        {'订阅汇总', '费目明细', '客户公司分析'}
+    assert all(os.path.isfile(path) for path in files)
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from analyze_data import analyze_precheck_data
+from config import DEFAULT_CONFIG
+from customer_keys import (DEPT_MAPPING, CustomerKeys, dense_codes, department_rows, from_minor_units,
+                           group_sum_minor, to_minor_units)
+
+def test_float_rounding_does_not_change_line_item_type():
+    # 浮点数累加时 0.1 + 0.2 != 0.3，0.1 + 0.2 - 0.3 != 0
+    assert 0.1 + 0.2 > 0.3 and 0.1 + 0.2 - 0.3 != 0
+    keys = CustomerKeys(['内贸水运', '内贸水运'], ['客户A', '客户B'])
+    df = pd.DataFrame({
+        '法人部门': '内贸',
+        '委托客户': ['客户A', '客户A', '客户A', '客户B', '客户B', '客户B', '客户B'],
+        '费率单号': ['T1', 'T1', 'T1', 'T2', 'T2', 'T2', 'T2'],
+        '别名': '海运费',
+        '应收应付': ['应收', '应付', '应付', '应收', '应收', '应收', '应付'],
+        '本位币金额': [0.3, 0.1, 0.2, 0.1, 0.2, -0.3, 0.5],
+        '币种': 'CNY',
+    })
+    result_df, customer_analysis = analyze_precheck_data(df, keys, DEFAULT_CONFIG['rules']['line_items'])
+    result_df = result_df.set_index('费率单号')
+    # 应收与应付相等，不是倒挂
+    assert result_df.loc['T1', '应收金额'] == result_df.loc['T1', '应付金额'] == 0.3
+    assert result_df.loc['T1', '类型'] == ''
+    # 应收合计为 0，是无应收
+    assert result_df.loc['T2', '应收金额'] == 0
+    assert result_df.loc['T2', '类型'] == '无应收'
+    assert customer_analysis['初步分析'].tolist() == ['', '无应收：海运费']
+
+def test_minor_units_round_trip():
+    minor = to_minor_units(pd.Series([0.1, 0.2, -12.34, None, 'abc', 1234.5]))
+    assert minor.dtype == np.int32
+    assert minor.tolist() == [10, 20, -1234, 0, 0, 123450]
+    assert from_minor_units(minor).tolist() == [0.1, 0.2, -12.34, 0.0, 0.0, 1234.5]
+    assert to_minor_units([]).dtype == np.int32
+
+def test_large_amounts_use_int64():
+    limit = np.iinfo(np.int32).max
+    small = to_minor_units([limit / 100, -limit / 100])
+    assert small.dtype == np.int32
+    large = to_minor_units([1.0, 30000000.0])
+    assert large.dtype == np.int64
+    assert large.tolist() == [100, 3000000000]
+    assert from_minor_units(large).tolist() == [1.0, 30000000.0]
+
+def test_group_sum_minor_does_not_overflow():
+    limit = np.iinfo(np.int32).max
+    minor = np.array([limit, limit, 5, 7], dtype=np.int32)
+    sums = group_sum_minor(np.array([0, 0, 1, -1]), minor, 3)
+    assert sums.dtype == np.int64
+    assert sums.tolist() == [2 * limit, 5, 0]
+
+def test_keys_in_first_seen_order():
+    keys = CustomerKeys(['外贸水运', '内贸水运', '外贸水运', '其他', '内贸水运'],
+                        ['客户B', '客户A', '客户B', '客户A', '客户C'])
+    assert keys.codes.tolist() == [0, 1, 0, 2, 3]
+    assert keys.n_keys == 4
+    # 法人客户键同样按第一次出现的顺序编号
+    assert keys.key_legal.tolist() == [0, 1, 2, 3]
+    codes, first_rows = dense_codes(np.array([2, 0, 2, 1, 0]), np.array([1, 1, 1, 0, 1]))
+    assert codes.tolist() == [0, 1, 0, 2, 1]
+    assert first_rows.tolist() == [0, 1, 3]
+
+def test_encode_decode_round_trip():
+    departments = ['内贸水运', '外贸水运', '内贸水运', '内贸水运', None]
+    customers = ['客户A', '客户B', None, '客户A', '客户C']
+    keys = CustomerKeys(departments, customers)
+    # 委托客户或二级部门为空的行没有客户键
+    assert keys.codes.tolist() == [0, 1, -1, 0, -1]
+    decoded = keys.decode(np.arange(keys.n_keys))
+    assert list(zip(decoded['二级部门'], decoded['委托客户'])) == [('内贸水运', '客户A'), ('外贸水运', '客户B')]
+
+    legal = keys.encode_legal(['内贸', '外贸', '内贸', '外贸', '内贸'], ['客户A', '客户B', None, '客户D', '客户A'])
+    assert legal.tolist() == [0, 1, -1, 2, 0]
+    decoded = keys.decode_legal(legal[legal >= 0])
+    assert list(zip(decoded['法人部门'], decoded['委托客户'])) == [
+        ('内贸', '客户A'), ('外贸', '客户B'), ('外贸', '客户D'), ('内贸', '客户A')]
+    # 新出现的组合追加在原有编号之后，不影响订阅数据的编号
+    assert keys.n_legal_keys == 3
+    assert keys.decode_legal(keys.key_legal)['委托客户'].tolist() == ['客户A', '客户B']
+
+def test_legal_department_mapping():
+    departments = ['内贸水运', '外贸水运', '海外', '内贸水运']
+    customers = ['客户A', '客户A', '客户B', '客户C']
+    keys = CustomerKeys(departments, customers)
+    expected = [DEPT_MAPPING.get(name, name) for name in departments]
+    assert list(keys.legal_department_of(keys.codes)) == expected
+    assert keys.decode_legal(keys.key_legal)['法人部门'].tolist() == expected
+    # 二级部门不同但法人部门相同的客户合并为一个法人客户键
+    merged = CustomerKeys(['内贸水运', '内贸'], ['客户A', '客户A'])
+    assert merged.n_keys == 2 and merged.key_legal.tolist() == [0, 0]
+
+def test_department_rows_match_boolean_filters():
+    values = pd.Series(['外贸水运', '内贸水运', None, '外贸水运', '海外', '内贸水运', '外贸水运'])
+    rows = department_rows(values)
+    assert list(rows) == ['外贸水运', '内贸水运', '海外']
+    for department, index in rows.items():
+        assert index.tolist() == np.flatnonzero(values == department).tolist()
+    assert department_rows(pd.Series([], dtype=object)) == {}
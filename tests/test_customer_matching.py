@@ -0,0 +1,61 @@
+import csv
+import multiprocessing
+
+from customer_matching import AliasTable, CustomerMatcher, accept_matches, normalize_name
+
+def test_branch_is_not_merged_with_parent():
+    assert normalize_name('客户A有限公司') == normalize_name(' 客户Ａ 有限公司')
+    assert normalize_name('客户A有限公司上海分公司') != normalize_name('客户A有限公司')
+    assert normalize_name('客户A有限公司上海分公司') == normalize_name('客户A有限公司 上海分公司')
+
+def test_similar_names_are_only_suggested(tmp_path):
+    alias_file = str(tmp_path / '客户别名表.csv')
+    matcher = CustomerMatcher(['内贸'], ['上海远洋国际物流供应链管理有限公司'], AliasTable(alias_file))
+    # 相似度 0.92，也只给出建议，不替换名称
+    result = matcher.match(['内贸'], ['上海远洋国际物流供应链管理集团'])
+    assert result.tolist() == ['上海远洋国际物流供应链管理集团']
+    assert matcher.report['匹配方式'].tolist() == ['建议']
+    assert matcher.report['订阅委托客户'].tolist() == ['上海远洋国际物流供应链管理有限公司']
+    assert not (tmp_path / '客户别名表.csv').exists()
+
+def test_accepted_suggestions_are_used(tmp_path):
+    alias_file = str(tmp_path / '客户别名表.csv')
+    report_file = str(tmp_path / '客户匹配报告.xlsx')
+    matcher = CustomerMatcher(['内贸', '内贸'], ['远洋物流有限公司', '远洋航运有限公司'], AliasTable(alias_file))
+    matcher.match(['内贸', '内贸'], ['远洋物流股份公司', '远洋航运集团'])
+    report = matcher.report.copy()
+    report.loc[report['预对账委托客户'] == '远洋物流股份公司', '确认'] = '是'
+    report.to_excel(report_file, index=False)
+
+    assert accept_matches(report_file, alias_file) == 1
+    messages = []
+    matcher = CustomerMatcher(['内贸'], ['远洋物流有限公司'], AliasTable(alias_file), status_callback=messages.append)
+    assert matcher.match(['内贸'], ['远洋物流股份公司']).tolist() == ['远洋物流有限公司']
+    assert matcher.report['匹配方式'].tolist() == ['别名表']
+    assert messages == ["客户名称匹配：1 个预对账客户，0 个完全相同，1 个通过别名表/规范化匹配，0 个未匹配或待确认"]
+
+def test_unconfirmed_rows_from_older_versions_are_ignored(tmp_path):
+    alias_file = tmp_path / '客户别名表.csv'
+    alias_file.write_text('法人部门,预对账委托客户,订阅委托客户,来源,相似度\n'
+                          '内贸,客户甲,客户乙,自动,0.95\n内贸,客户丙,客户丁,人工,\n', encoding='utf-8-sig')
+    aliases = AliasTable(str(alias_file))
+    assert aliases.get('内贸', '客户甲') is None
+    assert aliases.get('内贸', '客户丙') == '客户丁'
+
+def _add_aliases(alias_file, worker):
+    for i in range(20):
+        aliases = AliasTable(alias_file)
+        aliases.add('内贸', f'客户{worker}-{i}', f'订阅客户{worker}-{i}')
+        aliases.save()
+
+def test_concurrent_saves_keep_every_row(tmp_path):
+    alias_file = str(tmp_path / '客户别名表.csv')
+    processes = [multiprocessing.Process(target=_add_aliases, args=(alias_file, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    with open(alias_file, encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 80
+    assert not [path for path in tmp_path.iterdir() if path.suffix == '.tmp']
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+import analyze_data
+from excel_stream import read_excel_chunked
+from conftest import subscription_frame, precheck_frame, write_xls, read_outputs
+
+def run_analysis(tmp_path, name, subscription_file, precheck_file, **options):
+    output_dir = tmp_path / name
+    output_dir.mkdir()
+    files = analyze_data.analyze_excel_data(precheck_file, str(output_dir / '分析结果.xlsx'), subscription_file,
+                                            **options)
+    return read_outputs(files)
+
+@pytest.mark.parametrize('processing_mode', ['memory', 'streaming', 'auto'])
+def test_xls_input_matches_xlsx(tmp_path, config, processing_mode):
+    subscription_xlsx = str(tmp_path / '订阅.xlsx')
+    precheck_xlsx = str(tmp_path / '预对账.xlsx')
+    subscription_frame().to_excel(subscription_xlsx, index=False)
+    precheck_frame().to_excel(precheck_xlsx, index=False)
+    subscription_xls = write_xls(subscription_frame(), str(tmp_path / '订阅.xls'))
+    precheck_xls = write_xls(precheck_frame(), str(tmp_path / '预对账.xls'))
+
+    expected = run_analysis(tmp_path, 'xlsx', subscription_xlsx, precheck_xlsx, processing_mode=processing_mode)
+    actual = run_analysis(tmp_path, 'xls', subscription_xls, precheck_xls, processing_mode=processing_mode)
+
+    assert '分析结果_总表_2024-05.xlsx' in actual
+    assert actual.keys() == expected.keys()
+    for name, sheets in expected.items():
+        assert actual[name].keys() == sheets.keys()
+        for sheet, frame in sheets.items():
+            pd.testing.assert_frame_equal(actual[name][sheet], frame, check_dtype=False)
+
+def test_read_excel_chunked_xls_matches_xlsx(tmp_path):
+    xlsx_path = str(tmp_path / '订阅.xlsx')
+    subscription_frame().to_excel(xlsx_path, index=False)
+    xls_path = write_xls(subscription_frame(), str(tmp_path / '订阅.xls'))
+    pd.testing.assert_frame_equal(read_excel_chunked(xls_path, chunk_rows=2),
+                                  read_excel_chunked(xlsx_path, chunk_rows=2))
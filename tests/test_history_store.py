@@ -0,0 +1,87 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analyze_data
+from conftest import subscription_frame
+from history_store import HistoryStore, SUBSCRIPTION_FIELDS, normalize_month
+
+@pytest.mark.parametrize('value', ['2024-05', '2024-5', '2024/05', '2024.5', '202405', 202405, '2024年5月',
+                                   '2024-05-01 00:00:00', pd.Timestamp('2024-05-01')])
+def test_normalize_month(value):
+    assert normalize_month(value) == '2024-05'
+
+@pytest.mark.parametrize('value', [None, np.nan, '', '五月', '2024-13'])
+def test_normalize_month_unrecognised(value):
+    assert normalize_month(value) is None
+
+def customer_rows(profit_rate):
+    row = {name: [0.0] for name, _ in SUBSCRIPTION_FIELDS}
+    row.update({'二级部门': ['内贸水运'], '委托客户': ['客户A'], '业务大类名称': ['海运'], '总利润率': [profit_rate],
+                '约价负毛利票数': [1], '非约价低负票数': [''], '总票数': [1], '法人部门': ['内贸'], '总金额': [0.0],
+                '初步分析': ['']})
+    return pd.DataFrame(row)
+
+def test_previous_month_with_mixed_formats(tmp_path):
+    with HistoryStore(str(tmp_path / 'history.db')) as store:
+        store.save_month('2024-9', customer_rows(0.09), ['海运'])
+        store.save_month('2024/10', customer_rows(0.10), ['海运'])
+        store.save_month(pd.Timestamp('2024-10-01'), customer_rows(0.11), ['海运'])
+        months = [row[0] for row in store.connection.execute(
+            "SELECT 业务月度 FROM subscription_aggregates ORDER BY 业务月度")]
+        assert months == ['2024-09', '2024-10']
+        # 同一月份的另一种写法替换之前保存的结果
+        assert store.previous_values('2024-11', customer_rows(0.2)).tolist() == [0.11]
+        assert store.previous_values('2024-10-01 00:00:00', customer_rows(0.2)).tolist() == [0.09]
+
+def test_months_saved_before_normalization_are_migrated(tmp_path):
+    path = str(tmp_path / 'history.db')
+    with HistoryStore(path) as store:
+        store.save_month('2024-09', customer_rows(0.09), ['海运'])
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("UPDATE subscription_aggregates SET 业务月度 = '2024-9'")
+    connection.close()
+    with HistoryStore(path) as store:
+        assert store.previous_values('2024-10', customer_rows(0.2)).tolist() == [0.09]
+
+def test_report_month_is_normalized(tmp_path, config):
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    subscription_frame(month='2024/5').to_excel(subscription_file, index=False)
+    files = analyze_data.analyze_excel_data(None, str(tmp_path / '分析结果.xlsx'), subscription_file,
+                                            processing_mode='streaming')
+    assert str(tmp_path / '分析结果_总表_2024-05.xlsx') in files
+
+def test_saving_another_line_keeps_existing_lines(tmp_path):
+    with HistoryStore(str(tmp_path / 'history.db')) as store:
+        sea = customer_rows(0.1)
+        sea['总金额'] = 100.0
+        air = customer_rows(0.2)
+        air['业务大类名称'] = '空运'
+        air['总金额'] = 200.0
+        store.save_month('2024-05', sea, ['海运'])
+        # 同一客户的另一个业务大类单独运行，不删除也不覆盖海运的结果
+        store.save_month('2024-05', air, ['空运'])
+        rows = store.connection.execute(
+            "SELECT 业务大类名称, 总金额 FROM customer_analysis ORDER BY 业务大类名称").fetchall()
+        assert sorted(rows) == [('海运', 100.0), ('空运', 200.0)]
+        lines = store.connection.execute(
+            "SELECT 业务大类名称 FROM subscription_aggregates ORDER BY 业务大类名称").fetchall()
+        assert sorted(lines) == [('海运',), ('空运',)]
+
+def test_analysis_table_without_line_is_migrated(tmp_path):
+    path = str(tmp_path / 'history.db')
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("""CREATE TABLE customer_analysis (
+            业务月度 TEXT NOT NULL, 二级部门 TEXT NOT NULL, 委托客户 TEXT NOT NULL,
+            法人部门 TEXT, 总金额 REAL, 初步分析 TEXT, PRIMARY KEY (业务月度, 二级部门, 委托客户))""")
+        connection.execute("INSERT INTO customer_analysis VALUES ('2024-04', '内贸水运', '客户A', '内贸', 50.0, '')")
+    connection.close()
+    with HistoryStore(path) as store:
+        store.save_month('2024-05', customer_rows(0.1), ['海运'])
+        rows = store.connection.execute(
+            "SELECT 业务月度, 业务大类名称, 总金额 FROM customer_analysis ORDER BY 业务月度").fetchall()
+        assert rows == [('2024-04', '海运', 50.0), ('2024-05', '海运', 0.0)]
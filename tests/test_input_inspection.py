@@ -0,0 +1,50 @@
+import datetime
+
+import pytest
+from openpyxl import Workbook
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+
+from input_inspection import inspect_input, format_inspection
+from conftest import subscription_frame, write_xls
+
+def write_date_months(path, epoch=None):
+    """业务月度为日期格式单元格的订阅文件"""
+    frame = subscription_frame()
+    workbook = Workbook()
+    if epoch is not None:
+        workbook.epoch = epoch
+    sheet = workbook.active
+    sheet.append(list(frame.columns))
+    for row in frame.itertuples(index=False):
+        sheet.append([datetime.datetime(2024, 5, 1) if column == '业务月度' else value
+                      for column, value in zip(frame.columns, row)])
+    for cell in sheet['H'][1:]:
+        cell.number_format = 'yyyy-mm'
+    workbook.save(path)
+    return path
+
+@pytest.mark.parametrize('epoch', [None, CALENDAR_MAC_1904])
+def test_date_month_cells_shown_as_month(tmp_path, config, epoch):
+    path = write_date_months(str(tmp_path / '订阅.xlsx'), epoch)
+    result = inspect_input(path, 'subscription', config)
+    assert result['business_month'] == '2024-05'
+    assert result['total_rows'] == 5
+    assert result['missing'] == []
+
+def test_xls_input_is_inspected(tmp_path, config):
+    path = write_xls(subscription_frame(), str(tmp_path / '订阅.xls'))
+    result = inspect_input(path, 'subscription', config)
+    assert result['business_month'] == '2024-05'
+    assert result['total_rows'] == 5
+    assert result['estimated'] is False
+    assert result['missing'] == []
+    assert result['warnings'] == []
+    text, has_problems = format_inspection(result)
+    assert text.startswith('5 行') and not has_problems
+
+def test_unreadable_input_is_reported(tmp_path, config):
+    path = tmp_path / '订阅.xls'
+    path.write_bytes(b'not an excel file')
+    result = inspect_input(str(path), 'subscription', config)
+    assert result['total_rows'] is None
+    assert format_inspection(result)[1]
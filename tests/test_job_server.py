@@ -0,0 +1,166 @@
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+from conftest import subscription_frame
+from job_server import JobManager, _init_worker, create_server, server_url, stop_server
+from process_pool import SerialExecutor, limit_workers, process_pool
+
+def wait_for(job, timeout=60):
+    deadline = time.time() + timeout
+    while job.state not in ('succeeded', 'failed', 'cancelled'):
+        assert time.time() < deadline, f"任务未完成: {job.state}"
+        time.sleep(0.05)
+
+def request_json(url, data=None):
+    """发送请求，返回 (状态码, JSON 内容)"""
+    body = None if data is None else json.dumps(data).encode('utf-8')
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body), timeout=30) as response:
+            return response.status, json.loads(response.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read().decode('utf-8'))
+
+def test_job_workers_do_not_start_nested_pools():
+    try:
+        _init_worker(None)
+        with process_pool(4) as executor:
+            assert isinstance(executor, SerialExecutor)
+            assert executor.submit(pow, 2, 10).result() == 1024
+    finally:
+        limit_workers(None)
+
+def test_finished_jobs_are_pruned(tmp_path, config):
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    subscription_frame().to_excel(subscription_file, index=False)
+    manager = JobManager(str(tmp_path / 'jobs'), workers=1, keep_jobs=1)
+    try:
+        first, _ = manager.submit({'subscription_file': subscription_file, 'processing_mode': 'memory'})
+        wait_for(first)
+        second, _ = manager.submit({'subscription_file': subscription_file, 'processing_mode': 'streaming'})
+        wait_for(second)
+        assert first.state == second.state == 'succeeded'
+        # 结束后的清理在 done callback 中进行
+        deadline = time.time() + 10
+        while first.id in manager.jobs and time.time() < deadline:
+            time.sleep(0.05)
+        assert list(manager.jobs) == [second.id]
+        assert not os.path.exists(first.output_dir)
+        assert second.files_available()
+    finally:
+        manager.shutdown()
+
+def test_expired_job_dirs_are_removed_on_start(tmp_path):
+    jobs_dir = tmp_path / 'jobs'
+    expired = jobs_dir / '0123456789ab'
+    other = jobs_dir / '报表'
+    expired.mkdir(parents=True)
+    other.mkdir()
+    old = time.time() - 30 * 86400
+    os.utime(expired, (old, old))
+    os.utime(other, (old, old))
+    manager = JobManager(str(jobs_dir), workers=1, keep_days=7)
+    manager.shutdown()
+    assert not expired.exists()
+    assert other.exists()
+
+def test_broken_pool_is_replaced(tmp_path, config):
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    subscription_frame().to_excel(subscription_file, index=False)
+    manager = JobManager(str(tmp_path / 'jobs'), workers=1)
+    try:
+        # 子进程异常退出（如内存不足被系统结束）后进程池不可再用
+        broken = manager._executor
+        crash = broken.submit(os._exit, 1)
+        assert crash.exception(timeout=60) is not None
+        job, _ = manager.submit({'subscription_file': subscription_file})
+        wait_for(job)
+        assert job.state == 'succeeded'
+        assert manager._executor is not broken
+    finally:
+        manager.shutdown()
+
+def test_queued_jobs_cancelled_on_shutdown(tmp_path, config):
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    subscription_frame().to_excel(subscription_file, index=False)
+    manager = JobManager(str(tmp_path / 'jobs'), workers=1)
+    jobs = [manager.submit({'subscription_file': subscription_file, 'compress_level': level})[0]
+            for level in range(5)]
+    manager.shutdown()
+    for job in jobs:
+        wait_for(job, timeout=10)
+    states = [job.state for job in jobs]
+    assert states[0] == 'succeeded'
+    assert 'cancelled' in states
+    assert set(states) <= {'succeeded', 'cancelled'}
+
+def test_only_unfinished_jobs_are_deduplicated(tmp_path, config):
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    subscription_frame().to_excel(subscription_file, index=False)
+    manager = JobManager(str(tmp_path / 'jobs'), workers=1)
+    try:
+        # 先提交一个任务占用唯一的进程，之后的任务一定在排队
+        busy, _ = manager.submit({'subscription_file': subscription_file, 'compress_level': 1})
+        first, duplicate = manager.submit({'subscription_file': subscription_file})
+        assert not duplicate
+        again, duplicate = manager.submit({'subscription_file': subscription_file})
+        assert duplicate and again is first
+        assert first.duplicate_requests == 1
+        wait_for(busy)
+        wait_for(first)
+        assert first.state == 'succeeded' and first.files_available()
+        # 已完成的任务不复用：配置、别名表或历史数据可能已经修改
+        rerun, duplicate = manager.submit({'subscription_file': subscription_file})
+        assert not duplicate and rerun is not first
+        wait_for(rerun)
+        assert rerun.state == 'succeeded'
+    finally:
+        manager.shutdown()
+
+def test_http_api(tmp_path, config):
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    subscription_frame().to_excel(subscription_file, index=False)
+    server = create_server(host='127.0.0.1', port=0, workers=1, jobs_dir=str(tmp_path / 'jobs'))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = server_url(server)
+    try:
+        status, busy = request_json(url, {'subscription_file': subscription_file, 'compress_level': 1})
+        assert status == 201
+        status, job = request_json(url, {'subscription_file': subscription_file})
+        assert status == 201 and job['duplicate'] is False
+        status, duplicate = request_json(url, {'subscription_file': subscription_file})
+        assert status == 200 and duplicate['duplicate'] is True
+        assert duplicate['id'] == job['id']
+
+        deadline = time.time() + 60
+        while job['state'] not in ('succeeded', 'failed', 'cancelled'):
+            assert time.time() < deadline, f"任务未完成: {job['state']}"
+            time.sleep(0.1)
+            status, job = request_json(f"{url}/{job['id']}")
+            assert status == 200
+        assert job['state'] == 'succeeded', job
+        assert job['files']
+
+        with urllib.request.urlopen(f"{url}/{job['id']}/files/0", timeout=30) as response:
+            assert response.status == 200
+            content = response.read()
+        assert pd.read_excel(io.BytesIO(content), sheet_name=None)
+
+        status, error = request_json(url, {'subscription_file': str(tmp_path / '不存在.xlsx')})
+        assert status == 400 and '文件不存在' in error['error']
+        status, error = request_json(url, {'subscription_file': subscription_file, 'unknown_option': 1})
+        assert status == 400 and 'unknown_option' in error['error']
+        assert request_json(f"{url}/000000000000")[0] == 404
+        assert request_json(f"{url}/{job['id']}/files/{len(job['files'])}")[0] == 404
+
+        with urllib.request.urlopen(url.rsplit('/', 1)[0] + '/metrics', timeout=30) as response:
+            assert response.status == 200
+            assert isinstance(json.loads(response.read().decode('utf-8')), dict)
+    finally:
+        stop_server(server)
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+import pytest
+
+from memory_budget import MemoryTracker, process_memory_mb
+
+def test_tracker_includes_child_processes(capsys):
+    pytest.importorskip('psutil')
+    tracker = MemoryTracker(budget_mb=10 ** 6)
+    parent, _ = process_memory_mb()
+    if parent is None:
+        pytest.skip("无法读取进程内存")
+    # 子进程占用约 200 MB 后等待，读到一行输出时内存已经分配
+    child = subprocess.Popen([sys.executable, '-c', "import sys, time; data = b'x' * (200 * 1024 ** 2); "
+                                                    "print('ready', flush=True); time.sleep(60)"],
+                             stdout=subprocess.PIPE, text=True)
+    try:
+        assert child.stdout.readline().strip() == 'ready'
+        current = tracker.stage('读取数据')
+    finally:
+        child.kill()
+        child.wait()
+    assert current - parent >= 150
+    assert '其中子进程' in capsys.readouterr().out
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analyze_data
+from precheck_merge import DuplicateIndex, combine_precheck_frames
+from conftest import subscription_frame, precheck_frame, read_outputs
+
+KEY_COLUMNS = ['费率单号', '别名', '应收应付', '币种', '本位币金额']
+
+def test_duplicates_dropped_by_count():
+    row = precheck_frame().iloc[[0]]
+    first = row
+    second = pd.concat([row, row], ignore_index=True)
+    combined, masks = combine_precheck_frames([first, second], ['A.xlsx', 'B.xlsx'], KEY_COLUMNS)
+    assert len(combined) == 2
+    assert masks[1].tolist() == [False, True]
+
+def test_duplicate_counts_reported():
+    row = precheck_frame().iloc[[0]]
+    messages = []
+    combine_precheck_frames([row, pd.concat([row, row], ignore_index=True), row], ['A.xlsx', 'B.xlsx', 'C.xlsx'],
+                            KEY_COLUMNS, status_callback=messages.append)
+    assert messages == ["合并 3 个预对账文件，共去掉重复行 2 行"
+                        "（A.xlsx 1 行中去掉 0 行；B.xlsx 2 行中去掉 1 行；C.xlsx 1 行中去掉 1 行）"]
+
+def test_later_file_with_fewer_copies_drops_all():
+    row = precheck_frame().iloc[[0]]
+    first = pd.concat([row, row], ignore_index=True)
+    combined, masks = combine_precheck_frames([first, row, pd.concat([row] * 3)], ['A', 'B', 'C'], KEY_COLUMNS)
+    # 之前的文件中最多出现 2 次，C 中的第 3 次保留
+    assert masks[1].tolist() == [False]
+    assert masks[2].tolist() == [False, False, True]
+    assert len(combined) == 3
+
+def test_counts_carry_across_chunks():
+    row = precheck_frame().iloc[[0]]
+    index = DuplicateIndex(KEY_COLUMNS)
+    index.filter(pd.concat([row, row], ignore_index=True))
+    index.finish_file('A')
+    # 同一文件分三块读入，与整个文件一次读入的结果相同
+    keeps = [index.filter(row) for _ in range(3)]
+    index.finish_file('B')
+    assert np.concatenate(keeps).tolist() == [False, False, True]
+    assert index.stats[1] == ('B', 3, 2)
+
+@pytest.mark.parametrize('compute_backend', ['pandas', 'sqlite'])
+def test_overlapping_files_counted_once(tmp_path, config, compute_backend):
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    subscription_frame().to_excel(subscription_file, index=False)
+    full = precheck_frame()
+    # 第一次导出前 3 行，第二次导出后 3 行（与第一次重叠 1 行），另外有一行与第一次导出的第一行完全相同
+    first_file = str(tmp_path / '预对账1.xlsx')
+    second_file = str(tmp_path / '预对账2.xlsx')
+    single_file = str(tmp_path / '预对账.xlsx')
+    full.iloc[[0, 1, 2]].to_excel(first_file, index=False)
+    full.iloc[[2, 3, 4, 0, 0]].to_excel(second_file, index=False)
+    full.iloc[[0, 1, 2, 3, 4, 0]].to_excel(single_file, index=False)
+
+    def run(name, input_file):
+        output_dir = tmp_path / name
+        output_dir.mkdir()
+        return read_outputs(analyze_data.analyze_excel_data(input_file, str(output_dir / '分析结果.xlsx'),
+                                                            subscription_file, compute_backend=compute_backend))
+
+    expected = run('single', single_file)
+    actual = run('merged', [first_file, second_file])
+    assert actual.keys() == expected.keys()
+    for name, sheets in expected.items():
+        for sheet, frame in sheets.items():
+            pd.testing.assert_frame_equal(actual[name][sheet], frame, check_dtype=False)
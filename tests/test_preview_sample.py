@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analyze_data
+from preview_sample import TicketSample
+from conftest import read_outputs
+
+def ticket_frames(n=200):
+    """n 张费率单的订阅数据，以及每张费率单两行的预对账数据（另有 10 张订阅数据中没有的费率单）"""
+    rng = np.random.default_rng(1)
+    departments = np.where(np.arange(n) % 4 == 0, '外贸水运', '内贸水运').astype(object)
+    # 只有一张费率单的二级部门，至少抽取这一张
+    departments[7] = '华南分公司'
+    tickets = [f"T{i:04d}" for i in range(n)]
+    customers = [f"客户{i % 15}" for i in range(n)]
+    subscription = pd.DataFrame({
+        '费率单号': tickets,
+        '二级部门': departments,
+        '委托客户': customers,
+        '客户约价': np.where(np.arange(n) % 3 == 0, 'Y', 'N'),
+        '是否低负': np.where(np.arange(n) % 2 == 0, '负毛利', '低毛利'),
+        '未税人民币总毛利': rng.integers(-500, 500, n) / 4,
+        '未税人民币总收入': rng.integers(100, 3000, n) / 4,
+        '业务大类名称': '海运',
+        '业务月度': '2024-05',
+    })
+    legal = [{'内贸水运': '内贸', '外贸水运': '外贸'}.get(d, d) for d in departments]
+    extra = [f"X{i:02d}" for i in range(10)]
+    precheck = pd.DataFrame({
+        '法人部门': legal * 2 + ['内贸'] * 10,
+        '委托客户': customers * 2 + ['客户0'] * 10,
+        '别名': ['海运费'] * n + ['港杂费'] * n + ['海运费'] * 10,
+        '应收应付': ['应收'] * n + ['应付'] * n + ['应收'] * 10,
+        '本位币金额': list(rng.integers(1, 1000, 2 * n) / 4) + [1.0] * 10,
+        '费率单号': tickets * 2 + extra,
+        '币种': 'CNY',
+    })
+    return subscription, precheck
+
+def test_sample_does_not_depend_on_chunks():
+    subscription, precheck = ticket_frames()
+    whole = TicketSample(0.2, seed=3)
+    whole.add_subscription(subscription)
+    expected, expected_factors = whole.subscription()
+    chunked = TicketSample(0.2, seed=3)
+    for start in range(0, len(subscription), 30):
+        chunked.add_subscription(subscription.iloc[start:start + 30])
+    actual, factors = chunked.subscription()
+    pd.testing.assert_frame_equal(actual, expected)
+    assert factors == expected_factors
+    assert '华南分公司' in set(actual['二级部门'])
+    mask = np.concatenate([chunked.precheck_mask(precheck.iloc[start:start + 50])
+                           for start in range(0, len(precheck), 50)])
+    assert mask.tolist() == whole.precheck_mask(precheck).tolist()
+
+def test_precheck_uses_subscription_tickets():
+    subscription, precheck = ticket_frames()
+    sample = TicketSample(0.2, seed=0)
+    sample.add_subscription(subscription)
+    sampled, _ = sample.subscription()
+    kept = precheck[sample.precheck_mask(precheck)]
+    tickets = set(sampled['费率单号'])
+    in_subscription = kept[kept['费率单号'].isin(subscription['费率单号'])]
+    # 订阅样本中的费率单在预对账数据中整单保留，没有订阅样本以外的费率单
+    assert set(in_subscription['费率单号']) == tickets
+    assert len(in_subscription) == 2 * len(tickets)
+
+@pytest.mark.parametrize('processing_mode', ['memory', 'streaming'])
+def test_preview_matches_across_modes(tmp_path, config, processing_mode):
+    subscription, precheck = ticket_frames()
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    precheck_file = str(tmp_path / '预对账.xlsx')
+    subscription.to_excel(subscription_file, index=False)
+    precheck.to_excel(precheck_file, index=False)
+
+    def run(name, mode):
+        output_dir = tmp_path / name
+        output_dir.mkdir()
+        return read_outputs(analyze_data.analyze_excel_data(precheck_file, str(output_dir / '分析结果.xlsx'),
+                                                            subscription_file, sample_fraction=0.2,
+                                                            processing_mode=mode))
+
+    expected = run('auto', 'auto')
+    actual = run(processing_mode, processing_mode)
+    assert actual.keys() == expected.keys()
+    summary = actual['抽样预览_20%_分析结果_总表_2024-05.xlsx']
+    subscription_tickets = set(summary['海运订阅原始数据']['费率单号'])
+    precheck_tickets = set(summary['预对账原始数据']['费率单号'])
+    assert subscription_tickets <= precheck_tickets
+    assert precheck_tickets - subscription_tickets <= {f"X{i:02d}" for i in range(10)}
+    for name, sheets in expected.items():
+        for sheet, frame in sheets.items():
+            pd.testing.assert_frame_equal(actual[name][sheet], frame)
+
+@pytest.mark.parametrize('processing_mode', ['memory', 'streaming'])
+def test_preview_without_ticket_column(tmp_path, config, processing_mode):
+    subscription, precheck = ticket_frames()
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    precheck_file = str(tmp_path / '预对账.xlsx')
+    subscription.drop(columns=['费率单号']).to_excel(subscription_file, index=False)
+    precheck.to_excel(precheck_file, index=False)
+    messages = []
+    files = analyze_data.analyze_excel_data(precheck_file, str(tmp_path / '分析结果.xlsx'), subscription_file,
+                                            sample_fraction=0.2, processing_mode=processing_mode,
+                                            status_callback=messages.append)
+    assert "海运订阅文件没有费率单号列，订阅数据按行抽样，预对账数据独立抽样" in messages
+    summary = read_outputs(files)['抽样预览_20%_分析结果_总表_2024-05.xlsx']
+    # 订阅数据按行抽样，每个二级部门至少保留一行
+    sampled = summary['海运订阅原始数据']
+    assert 0 < len(sampled) < len(subscription)
+    assert set(sampled['二级部门']) == set(subscription['二级部门'])
+    # 预对账数据按费率单独立抽样，整单保留
+    kept = summary['预对账原始数据']
+    assert 0 < kept['费率单号'].nunique() < precheck['费率单号'].nunique()
+    assert (kept[kept['费率单号'].str.startswith('T')].groupby('费率单号').size() == 2).all()
@@ -0,0 +1,84 @@
+import threading
+
+from progress import ProgressChannel, format_progress
+
+def state(done=0, total=None, rate=None, eta=None, unit='行'):
+    return {'text': '', 'done': done, 'total': total, 'unit': unit, 'rate': rate, 'eta': eta}
+
+def test_progress_updates_are_coalesced():
+    channel = ProgressChannel()
+    assert channel.poll() is None
+    channel.status("读取数据...")
+    for done in range(1, 101):
+        channel.progress(done, 100)
+    polled = channel.poll()
+    assert polled['text'] == "读取数据..."
+    assert (polled['done'], polled['total']) == (100, 100)
+    assert channel.poll() is None
+    channel.progress(120, None, '个部门')
+    polled = channel.poll()
+    assert (polled['done'], polled['total'], polled['unit']) == (120, None, '个部门')
+
+def test_status_messages_kept_in_order():
+    channel = ProgressChannel()
+    channel.status("读取数据...")
+    channel.status("合并 2 个预对账文件，共去掉重复行 3 行")
+    channel.status("写出总表...")
+    channel.progress(10, 20)
+    polled = [channel.poll() for _ in range(3)]
+    assert [item['text'] for item in polled] == ["读取数据...", "合并 2 个预对账文件，共去掉重复行 3 行", "写出总表..."]
+    # 之前阶段的文字没有进度，当前阶段带最新进度
+    assert [item['done'] for item in polled] == [0, 0, 10]
+    assert channel.poll() is None
+    # snapshot 始终是当前阶段，不影响 poll
+    channel.status("拆分工作簿...")
+    assert channel.snapshot()['text'] == "拆分工作簿..."
+    assert channel.poll()['text'] == "拆分工作簿..."
+
+def test_snapshot_from_another_thread():
+    channel = ProgressChannel()
+    channel.status("读取数据...")
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        try:
+            while not stop.is_set():
+                snapshot = channel.snapshot()
+                assert snapshot['total'] is None or snapshot['done'] <= snapshot['total']
+                format_progress(snapshot)
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for done in range(20000):
+        channel.progress(done, 20000)
+    stop.set()
+    for reader in readers:
+        reader.join()
+    assert not errors
+    assert channel.snapshot()['done'] == 19999
+
+def test_format_progress():
+    assert format_progress(state()) == ''
+    assert format_progress(state(1200, 40000, 3000, 12.6)) == "1,200 / 40,000 行  3,000 行/秒  剩余约 13 秒"
+    assert format_progress(state(5, 100, 1, 95)) == "5 / 100 行  1 行/秒  剩余约 1 分 35 秒"
+    # 总数未知时没有剩余时间
+    assert format_progress(state(1500, None, 250.4, unit='行')) == "1,500 行  250 行/秒"
+    assert format_progress(state(0, 10, unit='个部门')) == "0 / 10 个部门"
+
+def test_eta_from_rate():
+    channel = ProgressChannel()
+    channel.status("读取数据...")
+    channel.progress(0, 100)
+    assert channel.snapshot()['eta'] is None
+    channel._started -= 2
+    channel.progress(50, 100)
+    snapshot = channel.snapshot()
+    assert 20 < snapshot['rate'] <= 25
+    assert 1.9 < snapshot['eta'] <= 2.5
+    # 总数未知时只有速度
+    channel.progress(60)
+    assert channel.snapshot()['eta'] is None and channel.snapshot()['rate']
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from result_preview import PreviewModel, PREVIEW_COLUMNS
+
+def analysis(n=1000):
+    """n 个客户的客户公司分析结果，海运和空运交替"""
+    rates = np.linspace(-0.5, 0.5, n)
+    return pd.DataFrame({
+        '业务大类名称': np.where(np.arange(n) % 2 == 0, '海运', '空运'),
+        '二级部门': np.where(np.arange(n) % 3 == 0, '外贸水运', '内贸水运'),
+        '委托客户': [f"客户{i:04d}" for i in range(n)],
+        '约价负毛利票数': [i % 5 or '' for i in range(n)],
+        '约价毛利率': rates,
+        '总票数': np.arange(n),
+        '总利润率': rates[::-1],
+        '初步分析': '',
+    })
+
+def test_rows_are_windowed():
+    model = PreviewModel(analysis())
+    assert len(model) == 1000
+    rows = model.rows(10, 5)
+    assert len(rows) == 5
+    assert [row[0] for row in rows] == ['海运', '空运', '海运', '空运', '海运']
+    assert [row[2] for row in rows] == [f"客户{i:04d}" for i in range(10, 15)]
+    # 最后一页只返回剩余的行
+    assert len(model.rows(998, 5)) == 2
+    # 票数为 0 时显示为空，毛利率显示为百分比
+    first = dict(zip([name for name, _, _ in PREVIEW_COLUMNS], model.rows(0, 1)[0]))
+    assert first['约价负毛利票数'] == '' and first['约价毛利率'] == '-50.00%' and first['非约价毛利率'] == ''
+
+def test_sort_and_filter():
+    model = PreviewModel(analysis())
+    model.sort('总票数')
+    model.sort('总票数')
+    assert model.sort_descending
+    assert model.rows(0, 1)[0][2] == '客户0999'
+
+    model.apply(line='空运', max_profit_rate=0)
+    assert model.lines() == ['海运', '空运']
+    names = [row[2] for row in model.rows(0, len(model))]
+    # 筛选后保持降序，空运为奇数行，总利润率不超过 0 的是后一半客户
+    assert names[0] == '客户0999' and names[-1] == '客户0501'
+    assert len(names) == 250
+
+    model.sort('委托客户')
+    assert model.rows(0, 1)[0][2] == '客户0501'
+    model.apply(department='外贸水运', customer='客户00')
+    assert {row[1] for row in model.rows(0, len(model))} == {'外贸水运'}
+    assert len(model) == 34
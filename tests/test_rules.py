@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+
+from rules import compile_rules, evaluate_rules, classify, rule_columns, rule_names
+
+def frame():
+    return pd.DataFrame({
+        '客户约价': ['Y', None, 'N', 'Y'],
+        '应收金额': [0, 100, 50, 30],
+        '应付金额': [10, 100, 80, 0],
+    })
+
+def masks(*conditions, mode='all', scales=None):
+    rules = compile_rules([{'name': '规则', mode: list(conditions)}], scales)
+    return evaluate_rules(rules, frame())['规则'].tolist()
+
+@pytest.mark.parametrize('op, value, expected', [
+    ('==', 100, [False, True, False, False]),
+    ('!=', 100, [True, False, True, True]),
+    ('<', 50, [True, False, False, True]),
+    ('<=', 50, [True, False, True, True]),
+    ('>', 30, [False, True, True, False]),
+    ('>=', 30, [False, True, True, True]),
+])
+def test_comparisons_with_value(op, value, expected):
+    assert masks({'column': '应收金额', 'op': op, 'value': value}) == expected
+
+@pytest.mark.parametrize('op, expected', [
+    ('==', [False, True, False, False]),
+    ('<', [True, False, True, False]),
+    ('>=', [False, True, False, True]),
+])
+def test_comparisons_with_other_column(op, expected):
+    assert masks({'column': '应收金额', 'op': op, 'other': '应付金额'}) == expected
+
+def test_membership_and_null_checks():
+    assert masks({'column': '客户约价', 'op': 'in', 'value': [None, 'N']}) == [False, True, True, False]
+    assert masks({'column': '客户约价', 'op': 'not_in', 'value': [None, 'N']}) == [True, False, False, True]
+    assert masks({'column': '客户约价', 'op': 'in', 'value': ['Y']}) == [True, False, False, True]
+    assert masks({'column': '客户约价', 'op': 'isna'}) == [False, True, False, False]
+    assert masks({'column': '客户约价', 'op': 'notna'}) == [True, False, True, True]
+
+def test_all_and_any():
+    conditions = ({'column': '应收金额', 'op': '==', 'value': 0}, {'column': '客户约价', 'op': '==', 'value': 'N'})
+    assert masks(*conditions) == [False, False, False, False]
+    assert masks(*conditions, mode='any') == [True, False, True, False]
+
+def test_values_scaled_with_column():
+    # 金额列以分保存时，配置中的元按同样比例换算
+    assert masks({'column': '应收金额', 'op': '>=', 'value': 0.5}, scales={'应收金额': 100}) == \
+        [False, True, True, False]
+    with pytest.raises(ValueError, match='单位不同'):
+        compile_rules([{'name': '规则', 'all': [{'column': '应收金额', 'op': '<', 'other': '应付金额'}]}],
+                      {'应收金额': 100})
+
+def test_classify_takes_first_matching_rule():
+    rules = compile_rules([
+        {'name': '无应收', 'all': [{'column': '应付金额', 'op': '>', 'value': 0},
+                                  {'column': '应收金额', 'op': '==', 'value': 0}]},
+        {'name': '倒挂', 'all': [{'column': '应收金额', 'op': '<', 'other': '应付金额'}]},
+    ])
+    assert rule_names(rules) == ['无应收', '倒挂']
+    assert rule_columns(rules) == {'应收金额', '应付金额'}
+    assert classify(rules, frame()).tolist() == ['无应收', '', '倒挂', '']
+    assert classify(rules, frame(), default='正常').tolist() == ['无应收', '正常', '倒挂', '正常']
+
+@pytest.mark.parametrize('spec, message', [
+    ({'name': '规则', 'all': [{'column': '应收金额', 'op': '~', 'value': 0}]}, '不支持的运算'),
+    ({'name': '规则', 'all': [{'column': '应收金额', 'value': 0}]}, '缺少 column 或 op'),
+    ({'name': '规则', 'all': [{'column': '应收金额', 'op': '=='}]}, '缺少 value 或 other'),
+    ({'name': '规则', 'all': [{'column': '客户约价', 'op': 'in', 'value': 'Y'}]}, '需要列表'),
+    ({'all': [{'column': '应收金额', 'op': '==', 'value': 0}]}, '缺少名称'),
+    ({'name': '规则', 'all': []}, '没有条件'),
+])
+def test_invalid_rules(spec, message):
+    with pytest.raises(ValueError, match=message):
+        compile_rules([spec])
+
+def test_missing_column():
+    rules = compile_rules([{'name': '规则', 'all': [{'column': '费目', 'op': 'notna'}]}])
+    with pytest.raises(ValueError, match='不存在的列: 费目'):
+        evaluate_rules(rules, frame())
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+import analyze_data
+from conftest import subscription_frame, precheck_frame, read_outputs
+
+def subscription_with_nulls():
+    """委托客户和二级部门有空值的订阅数据"""
+    df = subscription_frame()
+    df.loc[1, '委托客户'] = None
+    df.loc[3, '二级部门'] = None
+    return df
+
+# (订阅数据, 是否有预对账文件, business_lines)
+CASES = {
+    'subscription_only': (subscription_frame, False, None),
+    'one_precheck_file': (subscription_frame, True, None),
+    'two_business_lines': (subscription_frame, True, ['海运', '空运']),
+    'null_keys': (subscription_with_nulls, True, None),
+}
+
+@pytest.mark.parametrize('case', list(CASES))
+def test_sqlite_matches_pandas(tmp_path, config, case):
+    make_subscription, with_precheck, business_lines = CASES[case]
+    subscription_file = str(tmp_path / '订阅.xlsx')
+    make_subscription().to_excel(subscription_file, index=False)
+    precheck_file = None
+    if with_precheck:
+        precheck_file = str(tmp_path / '预对账.xlsx')
+        precheck_frame().to_excel(precheck_file, index=False)
+
+    def run(compute_backend):
+        output_dir = tmp_path / compute_backend
+        output_dir.mkdir()
+        return read_outputs(analyze_data.analyze_excel_data(precheck_file, str(output_dir / '分析结果.xlsx'),
+                                                            subscription_file, business_lines=business_lines,
+                                                            compute_backend=compute_backend))
+
+    expected = run('pandas')
+    actual = run('sqlite')
+    assert expected
+    assert actual.keys() == expected.keys()
+    for name, sheets in expected.items():
+        assert actual[name].keys() == sheets.keys(), name
+        for sheet, frame in sheets.items():
+            pd.testing.assert_frame_equal(actual[name][sheet], frame, check_dtype=False, obj=f"{name} {sheet}")
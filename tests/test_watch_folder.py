@@ -0,0 +1,90 @@
+import os
+import time
+
+from conftest import subscription_frame, precheck_frame, write_xls
+from watch_folder import FolderWatcher
+
+class FakeJob:
+    def __init__(self, subscription_file, input_file):
+        self.subscription_file = subscription_file
+        self.input_file = input_file
+        self.state = 'running'
+        self.finished = None
+        self.files = []
+        self.error = None
+
+    def finish(self, state, error=None):
+        self.state = state
+        self.finished = time.time()
+        self.error = error
+
+    def metrics(self):
+        return {'total_seconds': 0}
+
+class FakeManager:
+    def __init__(self):
+        self.submitted = []
+
+    def job_key(self, subscription_file, input_file=None, options=None):
+        return repr((subscription_file, input_file))
+
+    def submit(self, request, output_dir=None):
+        job = FakeJob(request['subscription_file'], request['input_file'])
+        self.submitted.append(job)
+        return job, False
+
+def make_watcher(tmp_path, **options):
+    directory = tmp_path / '导出'
+    directory.mkdir()
+    manager = FakeManager()
+    watcher = FolderWatcher(str(directory), str(tmp_path / '结果'), manager, stable_seconds=0,
+                            pair_wait_seconds=0, **options)
+    return directory, manager, watcher
+
+def test_failed_jobs_are_retried_with_backoff(tmp_path):
+    directory, manager, watcher = make_watcher(tmp_path, max_retries=2, retry_seconds=100)
+    subscription_frame().to_excel(directory / '海运订阅_2024-05.xlsx', index=False)
+    precheck_frame().to_excel(directory / '预对账_2024-05.xlsx', index=False)
+
+    assert len(watcher.scan()) == 1
+    manager.submitted[0].finish('failed', '文件被占用')
+    now = time.time()
+    assert watcher.scan(now) == []
+    # 等待时间过后重试
+    assert len(watcher.scan(now + 101)) == 1
+    manager.submitted[1].finish('failed', '文件被占用')
+    # 失败次数已满，不再重试
+    assert watcher.scan(now + 10000) == []
+    record = next(iter(watcher.processed.values()))
+    assert record['state'] == 'failed' and record['attempts'] == 2
+
+def test_success_is_not_reprocessed(tmp_path):
+    directory, manager, watcher = make_watcher(tmp_path)
+    subscription_frame().to_excel(directory / '海运订阅_2024-05.xlsx', index=False)
+    assert len(watcher.scan()) == 1
+    manager.submitted[0].finish('succeeded')
+    assert watcher.scan(time.time() + 10000) == []
+
+def test_precheck_without_month_pairs_with_latest_month(tmp_path):
+    directory, manager, watcher = make_watcher(tmp_path)
+    subscription_frame(month='2024-04').to_excel(directory / '海运订阅_0.xlsx', index=False)
+    subscription_frame(month='2024-05').to_excel(directory / '海运订阅_1.xlsx', index=False)
+    older = directory / '预对账_旧.xlsx'
+    newer = directory / '预对账_新.xlsx'
+    precheck_frame().to_excel(older, index=False)
+    precheck_frame().to_excel(newer, index=False)
+    past = time.time() - 3600
+    os.utime(older, (past, past))
+
+    jobs = {job.subscription_file: job for job in watcher.scan()}
+    assert jobs[str(directory / '海运订阅_0.xlsx')].input_file is None
+    assert jobs[str(directory / '海运订阅_1.xlsx')].input_file == str(newer)
+
+def test_xls_exports_are_processed(tmp_path):
+    directory, manager, watcher = make_watcher(tmp_path)
+    subscription_file = write_xls(subscription_frame(), str(directory / '海运订阅_2024-05.xls'))
+    precheck_file = write_xls(precheck_frame(), str(directory / '预对账_2024-05.xls'))
+    # 没有写完的 .xls 文件不能打开，不提交
+    (directory / '预对账_2024-05_第2周.xls').write_bytes(open(precheck_file, 'rb').read()[:100])
+    jobs = watcher.scan()
+    assert [(job.subscription_file, job.input_file) for job in jobs] == [(subscription_file, precheck_file)]
@@ -0,0 +1,52 @@
+import os
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import analyze_data
+from conftest import subscription_frame, precheck_frame, read_outputs
+
+def run(tmp_path, name, **options):
+    output_dir = tmp_path / name
+    output_dir.mkdir()
+    return analyze_data.analyze_excel_data(str(tmp_path / '预对账.xlsx'), str(output_dir / '分析结果.xlsx'),
+                                           str(tmp_path / '订阅.xlsx'), processing_mode='memory', **options)
+
+def test_parallel_writer_matches_openpyxl(tmp_path, config):
+    subscription_frame().to_excel(tmp_path / '订阅.xlsx', index=False)
+    precheck_frame().to_excel(tmp_path / '预对账.xlsx', index=False)
+    expected_files = run(tmp_path, 'openpyxl', writer_mode='openpyxl')
+    actual_files = run(tmp_path, 'parallel', writer_mode='parallel', compress_level=1)
+
+    expected = read_outputs(expected_files)
+    actual = read_outputs(actual_files)
+    assert actual.keys() == expected.keys()
+    for name, sheets in expected.items():
+        assert list(actual[name]) == list(sheets)
+        for sheet, frame in sheets.items():
+            pd.testing.assert_frame_equal(actual[name][sheet], frame)
+
+    # 总表的合并单元格、冻结窗格和列宽也相同
+    summary = "分析结果_总表_2024-05.xlsx"
+    expected_book = load_workbook(os.path.join(tmp_path, 'openpyxl', summary))
+    actual_book = load_workbook(os.path.join(tmp_path, 'parallel', summary))
+    for sheet in expected_book.sheetnames:
+        expected_sheet, actual_sheet = expected_book[sheet], actual_book[sheet]
+        assert sorted(map(str, actual_sheet.merged_cells.ranges)) == \
+            sorted(map(str, expected_sheet.merged_cells.ranges))
+        assert actual_sheet.freeze_panes == expected_sheet.freeze_panes
+        for letter, dimension in expected_sheet.column_dimensions.items():
+            if dimension.customWidth:
+                assert actual_sheet.column_dimensions[letter].width == pytest.approx(dimension.width, abs=1)
+
+def test_writer_mode_read_from_config(tmp_path, config):
+    subscription_frame().to_excel(tmp_path / '订阅.xlsx', index=False)
+    precheck_frame().to_excel(tmp_path / '预对账.xlsx', index=False)
+    config['writer_mode'] = 'zip'
+    with pytest.raises(ValueError, match='写出方式'):
+        run(tmp_path, 'invalid')
+    config['writer_mode'] = 'parallel'
+    config['compress_level'] = 10
+    with pytest.raises(ValueError, match='压缩级别'):
+        run(tmp_path, 'level')
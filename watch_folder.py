@@ -0,0 +1,273 @@
+import json
+import os
+import re
+import time
+
+from config import load_config, resolve_path
+from excel_stream import EXCEL_EXTENSIONS, excel_complete, iter_sheet_rows, header_names
+from history_store import normalize_month
+from job_server import JobManager, JobRejected
+from precheck_merge import input_file_list
+
+# 已处理文件的记录，保存在输出目录中，重启后不会重复处理相同内容的文件
+STATE_FILE_NAME = '自动处理记录.json'
+# 文件名或业务月度中的年月，如 2024-05、202405、2024年05月
+MONTH_PATTERN = re.compile(r'(20\d{2})\D?(0[1-9]|1[0-2])(?!\d)')
+
+def parse_month(text):
+    """从文字中取出业务月度（YYYY-MM），没有时返回 None"""
+    match = MONTH_PATTERN.search(str(text))
+    return f"{match.group(1)}-{match.group(2)}" if match else None
+
+def subscription_month(path):
+    """
+    海运订阅文件的业务月度：读取到第一个非空的业务月度单元格即停止，没有该列时从文件名中取
+    """
+    rows = iter_sheet_rows(path)
+    try:
+        names = header_names(next(rows, ()))
+        if '业务月度' in names:
+            column = names.index('业务月度')
+            for row in rows:
+                if column < len(row) and row[column] is not None:
+                    return normalize_month(row[column]) or parse_month(row[column]) or str(row[column])
+    finally:
+        rows.close()
+    return parse_month(os.path.basename(path))
+
+class FolderWatcher:
+    """
+    监视导出目录，把同一业务月度的海运订阅文件和预对账文件配对后提交分析任务
+
+    接受 xlsx 和 .xls 文件，文件大小和修改时间在 stable_seconds 内不再变化、且能作为 Excel 文件打开时才认为导出完成；
+    每个月份取最新的海运订阅文件和全部预对账文件（如每周导出，合并时去掉重叠部分），
+    文件名中没有业务月度的预对账文件，在最新月份没有同月预对账文件时按最新的一个与之配对；
+    内容哈希已经处理成功的不再重复处理，失败的（如文件被 Excel 占用、内存不足）间隔
+    retry_seconds、2 倍、4 倍……后重试，最多 max_retries 次；同一月份同时只运行一个任务
+    """
+
+    def __init__(self, directory, output_dir, manager, stable_seconds=30, pair_wait_seconds=600,
+                 subscription_keyword='订阅', precheck_keyword='预对账', max_retries=3, retry_seconds=60):
+        self.directory = directory
+        self.output_dir = output_dir
+        self.manager = manager
+        self.stable_seconds = stable_seconds
+        self.pair_wait_seconds = pair_wait_seconds
+        self.max_retries = max_retries
+        self.retry_seconds = retry_seconds
+        self.subscription_keyword = subscription_keyword
+        self.precheck_keyword = precheck_keyword
+        # 路径 -> (大小, 修改时间, 最后一次发现变化的时间)
+        self._files = {}
+        # (路径, 大小, 修改时间) -> 业务月度
+        self._months = {}
+        # 业务月度 -> (任务, 去重键)
+        self._running = {}
+        self._reported = set()
+        os.makedirs(output_dir, exist_ok=True)
+        self.state_path = os.path.join(output_dir, STATE_FILE_NAME)
+        self.processed = self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                print(f"警告：处理记录格式错误，将重新开始记录: {self.state_path}", flush=True)
+                return {}
+
+    def _save_state(self):
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.processed, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.state_path)
+
+    def _report_once(self, message):
+        if message not in self._reported:
+            self._reported.add(message)
+            print(message, flush=True)
+
+    def _stable_files(self, now):
+        """更新目录中文件的大小和修改时间，返回 [(路径, 大小, 修改时间, 稳定开始时间)]"""
+        current = {}
+        for entry in os.scandir(self.directory):
+            # 跳过 Excel 打开时生成的临时文件
+            if not entry.is_file() or entry.name.startswith('~$') or not entry.name.lower().endswith(EXCEL_EXTENSIONS):
+                continue
+            stat = entry.stat()
+            previous = self._files.get(entry.path)
+            if previous and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+                current[entry.path] = previous
+            else:
+                current[entry.path] = (stat.st_size, stat.st_mtime_ns, now)
+        self._files = current
+
+        stable = []
+        for path, (size, mtime, changed) in current.items():
+            if now - changed >= self.stable_seconds and excel_complete(path):
+                stable.append((path, size, mtime, changed))
+        return stable
+
+    def _file_month(self, path, size, mtime, is_subscription):
+        cache_key = (path, size, mtime)
+        if cache_key not in self._months:
+            try:
+                month = subscription_month(path) if is_subscription else parse_month(os.path.basename(path))
+            except Exception as e:
+                self._report_once(f"读取业务月度出错，跳过 {path}: {str(e)}")
+                month = None
+            self._months[cache_key] = month
+        return self._months[cache_key]
+
+    def _collect_finished(self):
+        """记录已经结束的任务；失败的任务记录失败次数和下次重试的时间"""
+        for month, (job, key) in list(self._running.items()):
+            if job.state == 'cancelled':
+                # 停止服务时被取消，不记录，下次扫描时重新提交
+                del self._running[month]
+                continue
+            if job.state not in ('succeeded', 'failed'):
+                continue
+            del self._running[month]
+            attempts = self.processed.get(key, {}).get('attempts', 0) + 1 if job.state == 'failed' else None
+            self.processed[key] = {
+                '业务月度': month,
+                'subscription_file': job.subscription_file,
+                'input_file': job.input_file,
+                'state': job.state,
+                'finished': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(job.finished)),
+                'files': [os.path.relpath(path, self.output_dir) for path in job.files],
+                'error': job.error,
+            }
+            if job.state == 'succeeded':
+                print(f"{month} 报表已生成，共 {len(job.files)} 个文件，用时 {job.metrics()['total_seconds']:.0f} 秒",
+                      flush=True)
+            elif attempts < self.max_retries:
+                retry_at = job.finished + self.retry_seconds * 2 ** (attempts - 1)
+                self.processed[key].update(attempts=attempts, retry_at=retry_at)
+                print(f"{month} 分析失败（第 {attempts} 次）: {job.error}，"
+                      f"{time.strftime('%H:%M:%S', time.localtime(retry_at))} 后重试", flush=True)
+            else:
+                self.processed[key]['attempts'] = attempts
+                print(f"{month} 分析失败（第 {attempts} 次）: {job.error}，不再重试；文件内容变化后会重新处理",
+                      flush=True)
+            self._save_state()
+
+    def _should_submit(self, key, now):
+        """成功处理过或失败次数已满的不再提交，失败的等到重试时间再提交"""
+        record = self.processed.get(key)
+        if record is None:
+            return True
+        if record.get('state') != 'failed':
+            return False
+        # 旧的处理记录中没有失败次数，按失败 1 次计
+        attempts = record.get('attempts', 1)
+        return attempts < self.max_retries and now >= record.get('retry_at', 0)
+
+    def _used_precheck_files(self):
+        """已经成功处理过的预对账文件 -> 业务月度"""
+        used = {}
+        for record in self.processed.values():
+            if record.get('state') == 'succeeded':
+                for path in input_file_list(record.get('input_file')):
+                    used[path] = record.get('业务月度')
+        return used
+
+    def scan(self, now=None):
+        """扫描一次目录，提交可以处理的文件，返回本次提交的任务列表"""
+        now = time.time() if now is None else now
+        self._collect_finished()
+
+        # 每个月份取修改时间最新的订阅文件，预对账文件按修改时间顺序全部使用
+        subscriptions = {}
+        prechecks = {}
+        # 文件名中没有业务月度的预对账文件 [(修改时间, 路径)]
+        undated = []
+        for path, size, mtime, changed in self._stable_files(now):
+            name = os.path.basename(path)
+            is_precheck = self.precheck_keyword in name
+            if not is_precheck and self.subscription_keyword not in name:
+                continue
+            month = self._file_month(path, size, mtime, not is_precheck)
+            if month is None:
+                if is_precheck:
+                    undated.append((mtime, path))
+                else:
+                    self._report_once(f"无法确定业务月度，跳过 {path}")
+                continue
+            if is_precheck:
+                prechecks.setdefault(month, []).append((mtime, path))
+            elif month not in subscriptions or mtime > subscriptions[month][1]:
+                subscriptions[month] = (path, mtime, changed)
+
+        used = self._used_precheck_files()
+        submitted = []
+        for month, (subscription_file, _, changed) in sorted(subscriptions.items()):
+            input_files = [path for _, path in sorted(prechecks.get(month, []))]
+            if not input_files and month == max(subscriptions):
+                # 最新月份没有同月的预对账文件时，使用修改时间最新的、还没有与其他月份配对的无月份预对账文件
+                candidates = [(mtime, path) for mtime, path in undated if used.get(path, month) == month]
+                if candidates:
+                    path = max(candidates)[1]
+                    used[path] = month
+                    input_files = [path]
+                    self._report_once(f"警告：预对账文件名中没有业务月度，按修改时间最新的文件与 {month} 配对: "
+                                      f"{os.path.basename(path)}")
+            if month in self._running:
+                continue
+            input_file = input_files[0] if len(input_files) == 1 else (input_files or None)
+            if input_file is None and now - changed < self.pair_wait_seconds:
+                self._report_once(f"{month} 等待预对账文件: {subscription_file}")
+                continue
+
+            key = self.manager.job_key(subscription_file, input_file)
+            if not self._should_submit(key, now):
+                continue
+            try:
+                job, _ = self.manager.submit({'subscription_file': subscription_file, 'input_file': input_file},
+                                             output_dir=self.output_dir)
+            except JobRejected as e:
+                # 队列已满或文件在提交前被删除，下次扫描时重试
+                print(f"{month} 暂时无法提交: {str(e)}", flush=True)
+                continue
+            pair_text = ' + '.join(os.path.basename(path) for path in [subscription_file] + input_files)
+            print(f"{month} 开始分析: {pair_text}", flush=True)
+            self._running[month] = (job, key)
+            submitted.append(job)
+        for _, path in undated:
+            if path not in used:
+                self._report_once(f"警告：预对账文件名中没有业务月度，暂时没有可以配对的海运订阅文件: {path}")
+        return submitted
+
+def run_watch(directory=None, output_dir=None, workers=None):
+    """持续监视目录，直到按 Ctrl+C 停止；未指定的参数读取配置文件中的 watch 配置"""
+    config = load_config()
+    settings = config['watch']
+    directory = directory or settings['directory']
+    if not directory:
+        raise ValueError("请在配置文件的 watch.directory 中或通过 --watch 参数指定监视目录")
+    if not os.path.isdir(directory):
+        raise ValueError(f"监视目录不存在: {directory}")
+    output_dir = output_dir or settings['output_dir'] or os.path.join(directory, '分析结果')
+    output_dir = resolve_path(output_dir)
+
+    manager = JobManager(output_dir, workers=workers or settings['workers'],
+                         max_queued_jobs=config['server']['max_queued_jobs'])
+    watcher = FolderWatcher(directory, output_dir, manager,
+                            stable_seconds=settings['stable_seconds'],
+                            pair_wait_seconds=settings['pair_wait_seconds'],
+                            subscription_keyword=settings['subscription_keyword'],
+                            precheck_keyword=settings['precheck_keyword'],
+                            max_retries=settings['max_retries'],
+                            retry_seconds=settings['retry_seconds'])
+    print(f"正在监视 {directory}，报表输出到 {output_dir}，每 {settings['poll_seconds']} 秒扫描一次", flush=True)
+    try:
+        while True:
+            watcher.scan()
+            time.sleep(settings['poll_seconds'])
+    except KeyboardInterrupt:
+        print("正在停止监视，等待运行中的任务完成...", flush=True)
+    finally:
+        manager.shutdown()
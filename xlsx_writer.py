@@ -0,0 +1,504 @@
+import os
+import re
+import math
+import time
+import struct
+import zlib
+import zipfile
+import datetime
+import tempfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from openpyxl.utils import get_column_letter, column_index_from_string
+
+from process_pool import process_pool
+
+# 样式索引，对应 STYLES_XML 中 cellXfs 的顺序
+STYLE_DEFAULT = 0
+STYLE_HEADER = 1           # DataFrame 表头：加粗、细边框、居中（与 pandas.to_excel 一致）
+STYLE_DATETIME = 2         # 日期时间
+STYLE_PERCENT = 3          # 百分比
+STYLE_REPORT_HEADER = 4    # 报表表头：加粗 9 号字、居中换行、细边框
+STYLE_REPORT_LEFT = 5      # 报表数据：9 号字、左对齐换行、细边框
+STYLE_REPORT_CENTER = 6    # 报表数据：9 号字、居中换行、细边框
+STYLE_REPORT_PERCENT = 7   # 报表数据：9 号字、居中换行、细边框、百分比
+STYLE_REPORT_BLANK = 8     # 报表空白列：9 号字、居中、细边框
+
+STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+    '<fonts count="4">'
+    '<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+    '<font><sz val="9"/><name val="Calibri"/><family val="2"/></font>'
+    '<font><b/><sz val="9"/><name val="Calibri"/><family val="2"/></font>'
+    '</fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="2"><border><left/><right/><top/><bottom/><diagonal/></border>'
+    '<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/><diagonal/></border>'
+    '</borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="9">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="top"/></xf>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="10" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="3" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center" wrapText="1"/></xf>'
+    '<xf numFmtId="0" fontId="2" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="left" vertical="center" wrapText="1"/></xf>'
+    '<xf numFmtId="0" fontId="2" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center" wrapText="1"/></xf>'
+    '<xf numFmtId="10" fontId="2" fillId="0" borderId="1" xfId="0" applyNumberFormat="1" applyFont="1" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center" wrapText="1"/></xf>'
+    '<xf numFmtId="0" fontId="2" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center"/></xf>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+# XML 中不允许出现的控制字符
+ILLEGAL_XML_CHARS_RE = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+def dataframe_sheet(name, df, freeze_panes='A2', fixed_widths=None, max_auto_width=None, percent_column=None):
+    """
+    描述一个按 DataFrame 原样输出的 sheet（首行为列名）
+
+    fixed_widths: 固定列宽，如 {'A': 17}
+    max_auto_width: 其余列按内容自适应宽度的上限，为 None 时不设置列宽
+    percent_column: 需要设置百分比格式的列号（从 0 开始），只对非零数值生效
+    """
+    return {
+        'kind': 'dataframe',
+        'name': name,
+        'frame': df,
+        'freeze_panes': freeze_panes,
+        'fixed_widths': fixed_widths or {},
+        'max_auto_width': max_auto_width,
+        'percent_column': percent_column,
+    }
+
+def report_sheet(name, headers, df, columns, merge_ranges, column_widths,
+                 freeze_panes='A3', header_height=30, blank_columns=0):
+    """
+    描述一个带多行表头和合并单元格的报表 sheet（如客户公司分析）
+
+    columns: [(列名, 对齐方式 'left'/'center', 是否百分比), ...]，按顺序写入数据行
+    blank_columns: 数据列之后追加的带边框空白列数量
+    """
+    return {
+        'kind': 'report',
+        'name': name,
+        'headers': headers,
+        'frame': df,
+        'columns': columns,
+        'merge_ranges': merge_ranges,
+        'column_widths': column_widths,
+        'freeze_panes': freeze_panes,
+        'header_height': header_height,
+        'blank_columns': blank_columns,
+    }
+
+def _cell_xml(ref, value, style):
+    """生成单个单元格的 XML，空值只保留样式"""
+    style_attr = f' s="{style}"' if style else ''
+    if value is None or (isinstance(value, str) and value == ''):
+        return f'<c r="{ref}"{style_attr}/>' if style else ''
+    if isinstance(value, (bool, np.bool_)):
+        return f'<c r="{ref}"{style_attr} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, np.integer)):
+        return f'<c r="{ref}"{style_attr}><v>{int(value)}</v></c>'
+    if isinstance(value, (float, np.floating)):
+        if not math.isfinite(value):
+            return f'<c r="{ref}"{style_attr}/>' if style else ''
+        return f'<c r="{ref}"{style_attr}><v>{repr(float(value))}</v></c>'
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        if value is pd.NaT:
+            return f'<c r="{ref}"{style_attr}/>' if style else ''
+        if not isinstance(value, datetime.datetime):
+            value = datetime.datetime(value.year, value.month, value.day)
+        if value.tzinfo is not None:
+            value = value.replace(tzinfo=None)
+        serial = (value - EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c r="{ref}" s="{style or STYLE_DATETIME}"><v>{repr(serial)}</v></c>'
+    text = ILLEGAL_XML_CHARS_RE.sub('', str(value))
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+def _is_missing(value):
+    if value is None or value is pd.NaT or value is pd.NA:
+        return True
+    return isinstance(value, (float, np.floating)) and math.isnan(value)
+
+def _sheet_views_xml(freeze_panes):
+    if not freeze_panes:
+        return '<sheetViews><sheetView workbookViewId="0"/></sheetViews>'
+    col = column_index_from_string(re.match(r'[A-Z]+', freeze_panes).group()) - 1
+    row = int(re.search(r'\d+', freeze_panes).group()) - 1
+    split = ''
+    if col:
+        split += f' xSplit="{col}"'
+    if row:
+        split += f' ySplit="{row}"'
+    pane = 'bottomRight' if col and row else ('bottomLeft' if row else 'topRight')
+    return ('<sheetViews><sheetView workbookViewId="0">'
+            f'<pane{split} topLeftCell="{freeze_panes}" activePane="{pane}" state="frozen"/>'
+            f'<selection pane="{pane}" activeCell="{freeze_panes}" sqref="{freeze_panes}"/>'
+            '</sheetView></sheetViews>')
+
+def _cols_xml(widths):
+    if not widths:
+        return ''
+    parts = []
+    for letter, width in sorted(widths.items(), key=lambda item: column_index_from_string(item[0])):
+        index = column_index_from_string(letter)
+        parts.append(f'<col min="{index}" max="{index}" width="{width}" customWidth="1"/>')
+    return '<cols>' + ''.join(parts) + '</cols>'
+
+def _dataframe_row_xml(row_index, values, letters, max_lengths, percent_column):
+    """生成 DataFrame sheet 一个数据行的 XML，同时累计每列的最大文字长度"""
+    if len(values) > len(letters):
+        letters.extend(get_column_letter(i + 1) for i in range(len(letters), len(values)))
+        max_lengths.extend([0] * (len(values) - len(max_lengths)))
+    cells = []
+    for i, value in enumerate(values):
+        if _is_missing(value):
+            continue
+        style = STYLE_DEFAULT
+        if i == percent_column and isinstance(value, (int, float, np.number)) and value:
+            style = STYLE_PERCENT
+        cells.append(_cell_xml(f'{letters[i]}{row_index}', value, style))
+        length = len(str(value))
+        if length > max_lengths[i]:
+            max_lengths[i] = length
+    return f'<row r="{row_index}">{"".join(cells)}</row>'
+
+def _header_row_xml(columns, letters):
+    cells = ''.join(_cell_xml(f'{letters[i]}1', str(col), STYLE_HEADER) for i, col in enumerate(columns))
+    return f'<row r="1">{cells}</row>'
+
+def _auto_widths(letters, max_lengths, fixed_widths, max_auto_width):
+    widths = dict(fixed_widths)
+    if max_auto_width is not None:
+        for letter, length in zip(letters, max_lengths):
+            if letter not in widths:
+                widths[letter] = min(length + 2, max_auto_width)
+    return widths
+
+def _render_dataframe_rows(spec):
+    """生成 DataFrame sheet 的行 XML，并按内容计算列宽"""
+    df = spec['frame']
+    letters = [get_column_letter(i + 1) for i in range(len(df.columns))]
+    max_lengths = [len(str(col)) for col in df.columns]
+    rows = [_header_row_xml(df.columns, letters)]
+    for row_index, values in enumerate(df.itertuples(index=False, name=None), start=2):
+        rows.append(_dataframe_row_xml(row_index, values, letters, max_lengths, spec['percent_column']))
+
+    widths = _auto_widths(letters, max_lengths, spec['fixed_widths'], spec['max_auto_width'])
+    return rows, widths, len(df) + 1, len(df.columns)
+
+def _render_report_rows(spec):
+    """生成报表 sheet 的行 XML（多行表头 + 带样式的数据行）"""
+    headers = spec['headers']
+    n_cols = len(headers[0])
+    letters = [get_column_letter(i + 1) for i in range(n_cols)]
+
+    # 合并区域内除左上角以外的单元格只保留样式
+    covered = set()
+    for cell_range in spec['merge_ranges']:
+        start, end = cell_range.split(':')
+        c1, r1 = column_index_from_string(re.match(r'[A-Z]+', start).group()), int(re.search(r'\d+', start).group())
+        c2, r2 = column_index_from_string(re.match(r'[A-Z]+', end).group()), int(re.search(r'\d+', end).group())
+        for r in range(r1, r2 + 1):
+            for c in range(c1, c2 + 1):
+                if (r, c) != (r1, c1):
+                    covered.add((r, c))
+
+    rows = []
+    height = spec['header_height']
+    for row_index, header in enumerate(headers, start=1):
+        cells = ''.join(
+            _cell_xml(f'{letters[i]}{row_index}', None if (row_index, i + 1) in covered else value, STYLE_REPORT_HEADER)
+            for i, value in enumerate(header)
+        )
+        rows.append(f'<row r="{row_index}" ht="{height}" customHeight="1">{cells}</row>')
+
+    columns = spec['columns']
+    styles = []
+    for _, align, is_percent in columns:
+        if is_percent:
+            styles.append(STYLE_REPORT_PERCENT)
+        else:
+            styles.append(STYLE_REPORT_LEFT if align == 'left' else STYLE_REPORT_CENTER)
+    frame = spec['frame'][[name for name, _, _ in columns]]
+    blank_start = len(columns)
+    blank_cells = [letters[i] for i in range(blank_start, blank_start + spec['blank_columns'])]
+
+    row_index = len(headers)
+    for values in frame.itertuples(index=False, name=None):
+        row_index += 1
+        cells = [
+            _cell_xml(f'{letters[i]}{row_index}', None if _is_missing(value) else value, styles[i])
+            for i, value in enumerate(values)
+        ]
+        cells.extend(f'<c r="{letter}{row_index}" s="{STYLE_REPORT_BLANK}"/>' for letter in blank_cells)
+        rows.append(f'<row r="{row_index}">{"".join(cells)}</row>')
+
+    return rows, dict(spec['column_widths']), row_index, n_cols
+
+def _sheet_head_xml(max_row, max_col, freeze_panes, widths):
+    """sheetData 之前的部分：尺寸、冻结窗格和列宽"""
+    dimension = f'A1:{get_column_letter(max(max_col, 1))}{max(max_row, 1)}'
+    return ''.join([
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n',
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">',
+        f'<dimension ref="{dimension}"/>',
+        _sheet_views_xml(freeze_panes),
+        '<sheetFormatPr defaultRowHeight="15"/>',
+        _cols_xml(widths),
+        '<sheetData>',
+    ])
+
+def _sheet_tail_xml(merge_ranges=None):
+    """sheetData 之后的部分：合并单元格和页边距"""
+    merge_xml = ''
+    if merge_ranges:
+        merge_xml = (f'<mergeCells count="{len(merge_ranges)}">'
+                     + ''.join(f'<mergeCell ref="{r}"/>' for r in merge_ranges)
+                     + '</mergeCells>')
+    return ''.join([
+        '</sheetData>',
+        merge_xml,
+        '<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5"/>',
+        '</worksheet>',
+    ])
+
+def _sheet_xml(spec):
+    """生成单个 sheet 的完整 XML"""
+    if spec['kind'] == 'report':
+        rows, widths, max_row, max_col = _render_report_rows(spec)
+    else:
+        rows, widths, max_row, max_col = _render_dataframe_rows(spec)
+    return ''.join([
+        _sheet_head_xml(max_row, max_col, spec['freeze_panes'], widths),
+        ''.join(rows),
+        _sheet_tail_xml(spec.get('merge_ranges')),
+    ]).encode('utf-8')
+
+def render_sheet(spec, compress_level=6):
+    """
+    在子进程中生成单个 sheet 的 XML 并完成 deflate 压缩
+
+    返回 (sheet 名称, 压缩后数据, CRC32, 原始长度)
+    """
+    xml = _sheet_xml(spec)
+    compressed = _deflate(xml, compress_level)
+    return spec['name'], compressed, zlib.crc32(xml), len(xml)
+
+def _deflate(data, compress_level):
+    compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+def _write_zip(output_file, entries):
+    """
+    将已压缩的部件组装为 ZIP 包
+
+    entries: [(文件名, 压缩后数据, CRC32, 原始长度), ...]
+    """
+    dos_time, dos_date = _dos_datetime(time.time())
+    central = []
+    offset = 0
+    with open(output_file, 'wb') as f:
+        for name, data, crc, size in entries:
+            if offset > 0xFFFFFFFF or len(data) > 0xFFFFFFFF or size > 0xFFFFFFFF:
+                raise ValueError("工作簿超过 4GB，无法使用并行写出模式")
+            name_bytes = name.encode('utf-8')
+            f.write(struct.pack('<IHHHHHIIIHH', 0x04034b50, 20, 0x0800, 8, dos_time, dos_date,
+                                crc, len(data), size, len(name_bytes), 0))
+            f.write(name_bytes)
+            f.write(data)
+            central.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, 20, 20, 0x0800, 8, dos_time, dos_date,
+                                       crc, len(data), size, len(name_bytes), 0, 0, 0, 0, 0, offset) + name_bytes)
+            offset += 30 + len(name_bytes) + len(data)
+        central_data = b''.join(central)
+        f.write(central_data)
+        f.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, len(entries), len(entries),
+                            len(central_data), offset, 0))
+
+def _package_parts(sheet_names):
+    """生成工作簿除 sheet 以外的固定部件"""
+    sheet_overrides = ''.join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in range(1, len(sheet_names) + 1)
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        f'{sheet_overrides}</Types>'
+    )
+    root_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>'
+    )
+    sheets = ''.join(
+        f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+        for i, name in enumerate(sheet_names, start=1)
+    )
+    workbook = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<bookViews><workbookView/></bookViews><sheets>{sheets}</sheets></workbook>'
+    )
+    sheet_rels = ''.join(
+        f'<Relationship Id="rId{i}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{i}.xml"/>'
+        for i in range(1, len(sheet_names) + 1)
+    )
+    styles_id = len(sheet_names) + 1
+    workbook_rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'{sheet_rels}<Relationship Id="rId{styles_id}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/></Relationships>'
+    )
+    return [
+        ('[Content_Types].xml', content_types),
+        ('_rels/.rels', root_rels),
+        ('xl/workbook.xml', workbook),
+        ('xl/_rels/workbook.xml.rels', workbook_rels),
+        ('xl/styles.xml', STYLES_XML),
+    ]
+
+def write_workbook_parallel(output_file, sheets, compress_level=6, max_workers=None):
+    """
+    并行写出工作簿：每个 sheet 的 XML 生成和压缩在独立子进程中完成，
+    主进程只负责组装 ZIP 包，总耗时取决于最大的 sheet 而不是所有 sheet 之和
+
+    sheets: 由 dataframe_sheet / report_sheet 生成的 sheet 描述列表，按顺序写入
+    compress_level: deflate 压缩级别 0-9，数值越小写出越快、文件越大
+    """
+    if not 0 <= compress_level <= 9:
+        raise ValueError(f"压缩级别必须在 0-9 之间: {compress_level}")
+    if not sheets:
+        raise ValueError("工作簿至少需要一个 sheet")
+
+    if max_workers is None:
+        max_workers = min(len(sheets), os.cpu_count() or 1)
+    # 体积最大的 sheet 最先提交，避免它最后才开始
+    order = sorted(range(len(sheets)), key=lambda i: -len(sheets[i]['frame']))
+    rendered = [None] * len(sheets)
+    with process_pool(max_workers) as executor:
+        futures = {i: executor.submit(render_sheet, sheets[i], compress_level) for i in order}
+        for i, future in futures.items():
+            rendered[i] = future.result()
+
+    entries = []
+    for name, content in _package_parts([spec['name'] for spec in sheets]):
+        data = content.encode('utf-8')
+        entries.append((name, _deflate(data, compress_level), zlib.crc32(data), len(data)))
+    for i, (_, data, crc, size) in enumerate(rendered, start=1):
+        entries.append((f'xl/worksheets/sheet{i}.xml', data, crc, size))
+
+    _write_zip(output_file, entries)
+
+class StreamingSheet:
+    """
+    逐行写出的 DataFrame 样式 sheet（首行为列名），用于数据量超出内存预算时
+
+    行 XML 随写入保存到临时文件，列宽随写入累计，不在内存中保留单元格；
+    由 write_workbook_streaming 拼接为完整的 sheet
+    """
+
+    def __init__(self, name, columns, freeze_panes='A2', fixed_widths=None, max_auto_width=None,
+                 percent_column=None):
+        self.name = name
+        self.freeze_panes = freeze_panes
+        self.fixed_widths = fixed_widths or {}
+        self.max_auto_width = max_auto_width
+        self.percent_column = percent_column
+        self.letters = [get_column_letter(i + 1) for i in range(len(columns))]
+        self.max_lengths = [len(str(col)) for col in columns]
+        self.rows = 0
+        self._file = tempfile.TemporaryFile()
+        self._file.write(_header_row_xml(columns, self.letters).encode('utf-8'))
+
+    def append(self, values):
+        """追加一行数据"""
+        self.rows += 1
+        row = _dataframe_row_xml(self.rows + 1, values, self.letters, self.max_lengths, self.percent_column)
+        self._file.write(row.encode('utf-8'))
+
+    def append_frame(self, frame):
+        for values in frame.itertuples(index=False, name=None):
+            self.append(values)
+
+    def write_xml(self, output):
+        """把完整的 sheet XML 写入 output，写完后释放临时文件"""
+        widths = _auto_widths(self.letters, self.max_lengths, self.fixed_widths, self.max_auto_width)
+        output.write(_sheet_head_xml(self.rows + 1, len(self.letters), self.freeze_panes, widths).encode('utf-8'))
+        self._file.seek(0)
+        while True:
+            block = self._file.read(1024 * 1024)
+            if not block:
+                break
+            output.write(block)
+        output.write(_sheet_tail_xml().encode('utf-8'))
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+def write_workbook_streaming(output_file, sheets, compress_level=6):
+    """
+    流式写出工作簿：StreamingSheet 从临时文件边读边压缩写入，内存占用与数据量无关；
+    dataframe_sheet / report_sheet 描述的 sheet（如客户公司分析）直接生成
+
+    sheets: StreamingSheet 或 sheet 描述的列表，按顺序写入
+    """
+    if not 0 <= compress_level <= 9:
+        raise ValueError(f"压缩级别必须在 0-9 之间: {compress_level}")
+    if not sheets:
+        raise ValueError("工作簿至少需要一个 sheet")
+
+    try:
+        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=compress_level) as archive:
+            sheet_names = [sheet.name if isinstance(sheet, StreamingSheet) else sheet['name'] for sheet in sheets]
+            for name, content in _package_parts(sheet_names):
+                archive.writestr(name, content)
+            for i, sheet in enumerate(sheets, start=1):
+                with archive.open(f'xl/worksheets/sheet{i}.xml', 'w', force_zip64=True) as output:
+                    if isinstance(sheet, StreamingSheet):
+                        sheet.write_xml(output)
+                    else:
+                        output.write(_sheet_xml(sheet))
+    finally:
+        for sheet in sheets:
+            if isinstance(sheet, StreamingSheet):
+                sheet.close()